@@ -0,0 +1,50 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from bookings.models import PaymeCallbackResponse
+from bookings.order_utils import expire_pending_orders
+from facilities.models import FacilityDayLedger
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Переводит просроченные неоплаченные заказы в 'expired_awaiting_payment' и освобождает их слоты; "
+        "удаляет устаревшие ответы журнала идемпотентности Payme и строки FacilityDayLedger за прошедшие даты."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help="Работать постоянно, повторяя проверку каждые --interval секунд.")
+        parser.add_argument(
+            '--interval', type=int, default=getattr(settings, 'PENDING_ORDER_SWEEP_INTERVAL_SECONDS', 60),
+            help="Пауза между проходами в режиме --loop (секунды)."
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=getattr(settings, 'PENDING_ORDER_SWEEP_BATCH_SIZE', 500),
+            help="Сколько заказов истекает одним UPDATE."
+        )
+
+    def handle(self, *args, **options):
+        interval = max(1, options['interval'])
+        while True:
+            try:
+                expired_count = expire_pending_orders(batch_size=options['batch_size'])
+                if expired_count or not options['loop']:
+                    self.stdout.write(self.style.SUCCESS(f"Истекло заказов: {expired_count}"))
+                PaymeCallbackResponse.objects.purge_expired()
+                FacilityDayLedger.objects.purge_past()
+            except Exception as e:
+                if not options['loop']: raise
+                logger.error(f"expire_pending_orders sweep failed: {e}", exc_info=True)
+            if not options['loop']:
+                break
+            close_old_connections() # Долгоживущий процесс не должен держать устаревшее соединение
+            try:
+                time.sleep(interval)
+            except KeyboardInterrupt:
+                break
@@ -0,0 +1,24 @@
+from datetime import date as dt_date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bookings.models import DailyOrderStats
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает дневные агрегаты заказов (DailyOrderStats) из таблицы заказов."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start-date', help="Первый день периода (YYYY-MM-DD). По умолчанию — с самого начала.")
+        parser.add_argument('--end-date', help="Последний день периода (YYYY-MM-DD). По умолчанию — до конца.")
+
+    def handle(self, *args, **options):
+        try:
+            start_date = dt_date.fromisoformat(options['start_date']) if options['start_date'] else None
+            end_date = dt_date.fromisoformat(options['end_date']) if options['end_date'] else None
+        except ValueError as e:
+            raise CommandError(f"Некорректная дата: {e}")
+        if start_date and end_date and start_date > end_date:
+            raise CommandError("--start-date не может быть позже --end-date.")
+        rows_count = DailyOrderStats.objects.rebuild(start_date=start_date, end_date=end_date)
+        self.stdout.write(self.style.SUCCESS(f"Записано строк агрегатов: {rows_count}"))
@@ -0,0 +1,33 @@
+# Generated by Django 5.2 on 2026-10-18 10:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0004_alter_paymenttransaction_expires_at_and_more'),
+        ('facilities', '0011_backfill_slot_occupancy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderSlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(blank=True, help_text='Для бронирования слотов и оплаты за вход.', null=True, verbose_name='Дата')),
+                ('weekday', models.PositiveSmallIntegerField(blank=True, choices=[(0, 'Понедельник'), (1, 'Вторник'), (2, 'Среда'), (3, 'Четверг'), (4, 'Пятница'), (5, 'Суббота'), (6, 'Воскресенье')], help_text='Для подписки. Пн=0, Вс=6.', null=True, verbose_name='День недели')),
+                ('start_time', models.TimeField(blank=True, help_text='Пусто — весь день (оплата за вход).', null=True, verbose_name='Время начала')),
+                ('duration_hours', models.PositiveSmallIntegerField(default=1, verbose_name='Длительность (часы)')),
+                ('facility', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='order_slots', to='facilities.facility', verbose_name='Спортивный объект')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='order_slots', to='bookings.order', verbose_name='Заказ')),
+            ],
+            options={
+                'verbose_name': 'Слот заказа',
+                'verbose_name_plural': 'Слоты заказов',
+                'ordering': ['order', 'date', 'weekday', 'start_time'],
+                'indexes': [models.Index(fields=['facility', 'date', 'start_time'], name='bookings_or_facilit_6225c1_idx'), models.Index(fields=['facility', 'weekday', 'start_time'], name='bookings_or_facilit_c513c8_idx')],
+            },
+        ),
+    ]
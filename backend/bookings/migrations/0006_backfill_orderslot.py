@@ -0,0 +1,67 @@
+from datetime import date, datetime, time, timedelta
+from django.db import migrations
+
+# Копия логики Order.iter_order_slot_specs: в миграциях исторические модели не имеют методов.
+
+
+def _iter_order_slot_specs(order):
+    if order.order_type == 'slot_booking':
+        if not order.booking_date or not isinstance(order.slots, list): return
+        seen_times = set()
+        for slot_item in order.slots:
+            try:
+                slot_time = time.fromisoformat(slot_item['start_time'])
+            except (ValueError, KeyError, TypeError): continue
+            if slot_time in seen_times: continue
+            seen_times.add(slot_time)
+            duration_hours = 1
+            try:
+                end_dt = datetime.combine(date.min, time.fromisoformat(slot_item['end_time']))
+                start_dt = datetime.combine(date.min, slot_time)
+                if end_dt <= start_dt: end_dt += timedelta(days=1)
+                duration_hours = max(1, int((end_dt - start_dt).total_seconds() // 3600))
+            except (ValueError, KeyError, TypeError): pass
+            yield order.booking_date, None, slot_time, duration_hours
+    elif order.order_type == 'subscription':
+        parsed_days = sorted(set(int(d.strip()) for d in (order.days_of_week or '').split(',') if d.strip().isdigit()))
+        parsed_times = []
+        for t_str in sorted(set(t.strip() for t in (order.subscription_times or '').split(',') if len(t.strip()) == 5)):
+            try: parsed_times.append(time.fromisoformat(t_str))
+            except ValueError: continue
+        for day_of_week in parsed_days:
+            for slot_time in parsed_times:
+                yield None, day_of_week, slot_time, order.duration_per_slot_hours or 1
+    elif order.order_type == 'entry_fee':
+        if order.booking_date:
+            yield order.booking_date, None, None, 1
+
+
+def backfill_order_slots(apps, schema_editor):
+    Order = apps.get_model('bookings', 'Order')
+    OrderSlot = apps.get_model('bookings', 'OrderSlot')
+    rows = []
+    for order in Order.objects.all().iterator(chunk_size=500):
+        for slot_date, weekday, start_time, duration_hours in _iter_order_slot_specs(order):
+            rows.append(OrderSlot(
+                order_id=order.pk, facility_id=order.facility_id, date=slot_date,
+                weekday=weekday, start_time=start_time, duration_hours=duration_hours
+            ))
+        if len(rows) >= 5000:
+            OrderSlot.objects.bulk_create(rows); rows = []
+    if rows:
+        OrderSlot.objects.bulk_create(rows)
+
+
+def clear_order_slots(apps, schema_editor):
+    apps.get_model('bookings', 'OrderSlot').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0005_orderslot'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_order_slots, clear_order_slots),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2 on 2026-10-18 10:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0006_backfill_orderslot'),
+        ('facilities', '0012_facilitydayledger'),
+        ('universities', '0007_remove_university_payme_merchant_id_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyOrderStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Дата создания заказов')),
+                ('order_type', models.CharField(choices=[('entry_fee', 'Оплата за вход'), ('slot_booking', 'Слотовое бронирование'), ('subscription', 'Подписка/Абонемент')], max_length=20, verbose_name='Тип заказа')),
+                ('status', models.CharField(choices=[('pending_payment', 'Ожидает оплаты'), ('confirmed', 'Подтвержден/Активен'), ('completed', 'Завершен/Использован'), ('cancelled_user', 'Отменен пользователем'), ('cancelled_admin', 'Отменен системой/администратором'), ('payment_failed', 'Ошибка оплаты'), ('expired_awaiting_payment', 'Истекло время ожидания оплаты'), ('refund_initiated', 'Возврат инициирован'), ('refunded', 'Возвращено')], max_length=30, verbose_name='Статус заказа')),
+                ('order_count', models.IntegerField(default=0, verbose_name='Количество заказов')),
+                ('revenue', models.DecimalField(decimal_places=0, default=0, max_digits=16, verbose_name='Сумма (сум)')),
+                ('facility', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_order_stats', to='facilities.facility', verbose_name='Спортивный объект')),
+                ('university', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_order_stats', to='universities.university', verbose_name='Университет')),
+            ],
+            options={
+                'verbose_name': 'Дневная статистика заказов',
+                'verbose_name_plural': 'Дневная статистика заказов',
+                'ordering': ['-date'],
+                'indexes': [models.Index(fields=['university', 'date'], name='bookings_da_univers_b245b7_idx'), models.Index(fields=['status', 'date'], name='bookings_da_status_f9441b_idx')],
+                'constraints': [models.UniqueConstraint(fields=('date', 'university', 'facility', 'order_type', 'status'), name='unique_daily_order_stats')],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+from decimal import Decimal
+from django.db import migrations
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+# Копия логики DailyOrderStats.objects.rebuild: в миграциях исторические менеджеры не имеют методов.
+
+
+def backfill_daily_order_stats(apps, schema_editor):
+    Order = apps.get_model('bookings', 'Order')
+    DailyOrderStats = apps.get_model('bookings', 'DailyOrderStats')
+    rows = [
+        DailyOrderStats(
+            date=row['stats_date'], university_id=row['facility__university'], facility_id=row['facility'],
+            order_type=row['order_type'], status=row['status'], order_count=row['order_count'], revenue=row['revenue']
+        )
+        for row in Order.objects.annotate(stats_date=TruncDate('created_at', tzinfo=timezone.get_current_timezone()))
+        .values('stats_date', 'facility__university', 'facility', 'order_type', 'status')
+        .annotate(order_count=Count('id'), revenue=Coalesce(Sum('total_price'), Decimal(0)))
+        .order_by()
+    ]
+    DailyOrderStats.objects.bulk_create(rows, batch_size=1000)
+
+
+def clear_daily_order_stats(apps, schema_editor):
+    apps.get_model('bookings', 'DailyOrderStats').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0007_dailyorderstats'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_daily_order_stats, clear_daily_order_stats),
+    ]
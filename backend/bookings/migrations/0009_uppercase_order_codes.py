@@ -0,0 +1,24 @@
+from django.db import migrations
+from django.db.models import F
+from django.db.models.functions import Upper
+
+# Коды заказов теперь хранятся в верхнем регистре (Order.normalize_order_code),
+# чтобы QR-сканер искал точным совпадением по уникальному индексу вместо UPPER(order_code).
+
+
+def uppercase_order_codes(apps, schema_editor):
+    Order = apps.get_model('bookings', 'Order')
+    Order.objects.annotate(order_code_upper=Upper('order_code')).exclude(
+        order_code=F('order_code_upper')
+    ).update(order_code=Upper('order_code'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0008_backfill_daily_order_stats'),
+    ]
+
+    operations = [
+        migrations.RunPython(uppercase_order_codes, migrations.RunPython.noop),
+    ]
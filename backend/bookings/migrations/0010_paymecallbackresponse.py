@@ -0,0 +1,30 @@
+# Generated by Django 5.2 on 2026-10-18 11:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0009_uppercase_order_codes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymeCallbackResponse',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('method', models.CharField(max_length=40, verbose_name='Метод JSON-RPC')),
+                ('paycom_transaction_id', models.CharField(max_length=255, verbose_name='ID транзакции в Paycom')),
+                ('request_hash', models.CharField(max_length=64, verbose_name='Хэш запроса')),
+                ('response_payload', models.JSONField(verbose_name='Ответ')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Создано')),
+            ],
+            options={
+                'verbose_name': 'Ответ на вызов Payme',
+                'verbose_name_plural': 'Ответы на вызовы Payme',
+                'indexes': [models.Index(fields=['paycom_transaction_id'], name='bookings_pa_paycom__2cc64b_idx')],
+                'constraints': [models.UniqueConstraint(fields=('method', 'paycom_transaction_id', 'request_hash'), name='unique_payme_callback_response')],
+            },
+        ),
+    ]
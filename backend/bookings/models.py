@@ -1,9 +1,15 @@
 # --- START OF FULL MODIFIED backend/bookings/models.py ---
-from django.db import models
+from collections import defaultdict
+from decimal import Decimal
+from django.db import models, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Coalesce, TruncDate
 from django.utils.translation import gettext_lazy as _
 from django.core.exceptions import ValidationError as DjangoValidationError # Переименовали для ясности
 from datetime import time, date as dt_date, timedelta, datetime
 from django.utils import timezone
+import hashlib
+import json
 import uuid 
 from django.conf import settings
 from django.core.validators import MinValueValidator
@@ -16,10 +22,10 @@ except ImportError:
     User = settings.AUTH_USER_MODEL # type: ignore
 
 try:
-    from facilities.models import Facility
+    from facilities.models import Facility, SlotOccupancy
     FACILITY_IMPORTED = True
 except ImportError:
-    Facility = None # type: ignore
+    Facility = SlotOccupancy = None # type: ignore
     FACILITY_IMPORTED = False
     # print("Warning [bookings.models.Order]: Could not import Facility model.")
 
@@ -57,6 +63,17 @@ class Order(models.Model):
     ]
     # Статусы, которые должны учитываться при проверке конфликтов доступности
     STATUS_CREATES_CONFLICT = [STATUS_CONFIRMED, STATUS_PENDING_PAYMENT]
+    # Поля, изменение которых требует пересборки SlotOccupancy
+    OCCUPANCY_FIELDS = {
+        'status', 'facility', 'order_type', 'booking_date', 'slots',
+        'subscription_start_date', 'subscription_end_date', 'days_of_week', 'subscription_times',
+    }
+    # Поля, изменение которых требует пересборки OrderSlot (статус на состав слотов не влияет)
+    ORDER_SLOT_FIELDS = {
+        'facility', 'order_type', 'booking_date', 'slots', 'days_of_week', 'subscription_times', 'duration_per_slot_hours',
+    }
+    # Поля, от которых зависит вклад заказа в DailyOrderStats (created_at не меняется после создания)
+    STATS_FIELDS = {'status', 'facility', 'order_type', 'total_price'}
 
     id = models.BigAutoField(primary_key=True, verbose_name=_("ID Заказа"))
     order_code = models.CharField(
@@ -114,11 +131,29 @@ class Order(models.Model):
             models.Index(fields=['order_code']),
             models.Index(fields=['facility', 'booking_date', 'status']),
             models.Index(fields=['facility', 'subscription_start_date', 'subscription_end_date', 'status']),
+            models.Index(fields=['user', 'created_at', 'id']), # Курсорная пагинация "Моих заказов" (core.pagination)
         ]
 
     def __str__(self):
         return f"Заказ {self.order_code or self.pk} ({self.get_order_type_display()})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем исходный вклад в DailyOrderStats, чтобы при сохранении перенести его без лишнего запроса
+        if {'created_at', 'facility_id', 'order_type', 'status', 'total_price'}.issubset(instance.__dict__):
+            instance._stats_snapshot = instance.get_stats_snapshot()
+        return instance
+
+    @staticmethod
+    def normalize_order_code(order_code: str) -> str:
+        """ Код заказа в каноническом виде (как хранится в БД): без пробелов по краям, в верхнем регистре. """
+        return (order_code or '').strip().upper()
+
+    def get_stats_snapshot(self) -> tuple:
+        """ Вклад заказа в DailyOrderStats: (created_at, facility_id, order_type, status, total_price). """
+        return (self.created_at, self.facility_id, self.order_type, self.status, self.total_price)
+
     # --- Методы для парсинга и отображения данных заказа ---
     def get_parsed_slots(self) -> list:
         if self.order_type == self.TYPE_SLOT_BOOKING and isinstance(self.slots, list):
@@ -198,6 +233,102 @@ class Order(models.Model):
             return self.booking_date == check_date 
         return False
 
+    def iter_occupied_slots(self):
+        """
+        Разворачивает заказ в пары (дата, время начала слота), которые он занимает.
+        Для оплаты за вход время равно None — заказ занимает весь день.
+        Семантика совпадает с is_active_for_conflict_check (без учета статуса).
+        """
+        if self.order_type == self.TYPE_SLOT_BOOKING:
+            if not self.booking_date: return
+            seen_times = set()
+            for slot_item in self.get_parsed_slots():
+                try:
+                    slot_time = time.fromisoformat(slot_item['start_time'])
+                except (ValueError, KeyError, TypeError): continue
+                if slot_time not in seen_times:
+                    seen_times.add(slot_time)
+                    yield self.booking_date, slot_time
+        elif self.order_type == self.TYPE_SUBSCRIPTION:
+            if not (self.subscription_start_date and self.subscription_end_date): return
+            parsed_days = set(self.get_parsed_days_of_week())
+            parsed_times = []
+            for t_str in self.get_parsed_subscription_times():
+                try: parsed_times.append(time.fromisoformat(t_str))
+                except ValueError: continue
+            if not parsed_days or not parsed_times: return
+            current_date = self.subscription_start_date
+            while current_date <= self.subscription_end_date:
+                if current_date.weekday() in parsed_days:
+                    for slot_time in parsed_times:
+                        yield current_date, slot_time
+                current_date += timedelta(days=1)
+        elif self.order_type == self.TYPE_ENTRY_FEE:
+            if self.booking_date:
+                yield self.booking_date, None
+
+    def iter_order_slot_specs(self):
+        """
+        Разворачивает JSON/строковые поля заказа в нормализованные строки OrderSlot:
+        (дата, день недели, время начала, длительность в часах).
+        Слоты бронирования и вход привязаны к дате, подписка — к дню недели.
+        """
+        if self.order_type == self.TYPE_SLOT_BOOKING:
+            if not self.booking_date: return
+            seen_times = set()
+            for slot_item in self.get_parsed_slots():
+                try:
+                    slot_time = time.fromisoformat(slot_item['start_time'])
+                except (ValueError, KeyError, TypeError): continue
+                if slot_time in seen_times: continue
+                seen_times.add(slot_time)
+                duration_hours = 1
+                try:
+                    end_dt = datetime.combine(dt_date.min, time.fromisoformat(slot_item['end_time']))
+                    start_dt = datetime.combine(dt_date.min, slot_time)
+                    if end_dt <= start_dt: end_dt += timedelta(days=1) # Слот до полуночи ('00:00')
+                    duration_hours = max(1, int((end_dt - start_dt).total_seconds() // 3600))
+                except (ValueError, KeyError, TypeError): pass
+                yield self.booking_date, None, slot_time, duration_hours
+        elif self.order_type == self.TYPE_SUBSCRIPTION:
+            duration_hours = self.duration_per_slot_hours or 1
+            parsed_times = []
+            for t_str in self.get_parsed_subscription_times():
+                try: parsed_times.append(time.fromisoformat(t_str))
+                except ValueError: continue
+            for day_of_week in self.get_parsed_days_of_week():
+                for slot_time in parsed_times:
+                    yield None, day_of_week, slot_time, duration_hours
+        elif self.order_type == self.TYPE_ENTRY_FEE:
+            if self.booking_date:
+                yield self.booking_date, None, None, 1
+
+    def get_order_slots_display(self) -> str:
+        """
+        Описание слотов по нормализованным строкам OrderSlot (используйте с prefetch_related('order_slots')).
+        """
+        return self.format_order_slots_display(
+            self.order_type, ((s.weekday, s.start_time, s.duration_hours) for s in self.order_slots.all())
+        )
+
+    @classmethod
+    def format_order_slots_display(cls, order_type: str, slot_specs) -> str:
+        """ То же описание по кортежам (weekday, start_time, duration_hours) — для выгрузок через values(). """
+        slot_specs = sorted(
+            (spec for spec in slot_specs if spec[1] is not None),
+            key=lambda spec: (spec[0] if spec[0] is not None else -1, spec[1])
+        )
+        if not slot_specs: return "-"
+        time_ranges = []
+        for _weekday, start_time, duration_hours in slot_specs:
+            time_range = OrderSlot.format_time_range(start_time, duration_hours)
+            if time_range not in time_ranges: time_ranges.append(time_range)
+        if order_type == cls.TYPE_SUBSCRIPTION:
+            day_map_display = dict(DAYS_OF_WEEK_NUMERIC)
+            days_str = ", ".join(str(day_map_display.get(d, d)) for d in sorted({spec[0] for spec in slot_specs}))
+            return f"{_('Дни')}: {days_str}; {_('Время')}: {', '.join(sorted(time_ranges))}"
+        return ", ".join(time_ranges)
+
     def clean(self):
         super().clean()
         # ... (вся ваша существующая логика clean() остается здесь без изменений)
@@ -219,8 +350,31 @@ class Order(models.Model):
             while Order.objects.filter(order_code=self.order_code).exclude(pk=self.pk).exists():
                  unique_suffix = str(uuid.uuid4().hex)[:6].upper()
                  self.order_code = f"{prefix}-{date_part_str}-{unique_suffix}"
+        # Коды храним в верхнем регистре: поиск по QR — точное совпадение по уникальному индексу, без UPPER()
+        self.order_code = self.normalize_order_code(self.order_code)
         # print(f"--- Вызван save() для Order ID: {self.pk}, Code: {self.order_code}, Status: {self.status} ---")
-        super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        occupancy_changed = update_fields is None or bool(self.OCCUPANCY_FIELDS.intersection(update_fields))
+        order_slots_changed = update_fields is None or bool(self.ORDER_SLOT_FIELDS.intersection(update_fields))
+        stats_changed = Facility is not None and (update_fields is None or bool(self.STATS_FIELDS.intersection(update_fields)))
+        with transaction.atomic():
+            old_stats_snapshot = None
+            if stats_changed and not self._state.adding:
+                old_stats_snapshot = getattr(self, '_stats_snapshot', None)
+                if old_stats_snapshot is None: # Экземпляр загружен не полностью — берем прежние значения из БД
+                    old_stats_snapshot = Order.objects.filter(pk=self.pk).values_list(
+                        'created_at', 'facility_id', 'order_type', 'status', 'total_price'
+                    ).first()
+            super().save(*args, **kwargs)
+            if order_slots_changed:
+                OrderSlot.objects.sync_for_order(self)
+            if occupancy_changed and SlotOccupancy is not None:
+                SlotOccupancy.objects.sync_for_order(self)
+            if stats_changed:
+                new_stats_snapshot = self.get_stats_snapshot()
+                if new_stats_snapshot != old_stats_snapshot:
+                    DailyOrderStats.objects.record_order_change(old_stats_snapshot, new_stats_snapshot)
+                self._stats_snapshot = new_stats_snapshot
 
     # --- НОВЫЕ МЕТОДЫ ДЛЯ QR-СЕРИАЛИЗАТОРА (из вашего предыдущего кода) ---
     def get_display_date_period_for_qr(self) -> str:
@@ -243,6 +397,167 @@ class Order(models.Model):
         return "-"
 
 
+class OrderSlotManager(models.Manager):
+    def sync_for_order(self, order: Order) -> None:
+        """ Пересобирает нормализованные слоты заказа из его JSON/строковых полей. """
+        self.filter(order_id=order.pk).delete()
+        rows = [
+            self.model(
+                order_id=order.pk, facility_id=order.facility_id, date=slot_date,
+                weekday=weekday, start_time=start_time, duration_hours=duration_hours
+            )
+            for slot_date, weekday, start_time, duration_hours in order.iter_order_slot_specs()
+        ]
+        if rows:
+            self.bulk_create(rows, batch_size=1000)
+
+
+class OrderSlot(models.Model):
+    """
+    Нормализованный слот заказа: одна строка на время начала.
+    Бронирование слотов и вход задают date, подписка — weekday (период берется из заказа).
+    Поля Order.slots / days_of_week / subscription_times остаются источником для API.
+    """
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='order_slots', verbose_name=_("Заказ"))
+    facility = models.ForeignKey(
+        'facilities.Facility' if not FACILITY_IMPORTED else Facility,
+        on_delete=models.CASCADE, related_name='order_slots', verbose_name=_("Спортивный объект")
+    )
+    date = models.DateField(_("Дата"), null=True, blank=True, help_text=_("Для бронирования слотов и оплаты за вход."))
+    weekday = models.PositiveSmallIntegerField(
+        _("День недели"), choices=DAYS_OF_WEEK_NUMERIC, null=True, blank=True, help_text=_("Для подписки. Пн=0, Вс=6.")
+    )
+    start_time = models.TimeField(_("Время начала"), null=True, blank=True, help_text=_("Пусто — весь день (оплата за вход)."))
+    duration_hours = models.PositiveSmallIntegerField(_("Длительность (часы)"), default=1)
+
+    objects = OrderSlotManager()
+
+    class Meta:
+        verbose_name = _("Слот заказа")
+        verbose_name_plural = _("Слоты заказов")
+        ordering = ['order', 'date', 'weekday', 'start_time']
+        indexes = [
+            models.Index(fields=['facility', 'date', 'start_time']),
+            models.Index(fields=['facility', 'weekday', 'start_time']),
+        ]
+
+    def __str__(self):
+        when = self.date.strftime('%d.%m.%Y') if self.date else dict(DAYS_OF_WEEK_NUMERIC).get(self.weekday, self.weekday)
+        return f"{when} {self.get_time_range_display()} (Заказ {self.order_id})"
+
+    def get_time_range_display(self) -> str:
+        return self.format_time_range(self.start_time, self.duration_hours)
+
+    @staticmethod
+    def format_time_range(start_time, duration_hours) -> str:
+        if start_time is None: return str(_("весь день"))
+        end_time = (datetime.combine(dt_date.min, start_time) + timedelta(hours=duration_hours or 1)).time()
+        return f"{start_time.strftime('%H:%M')}-{end_time.strftime('%H:%M')}"
+
+
+class DailyOrderStatsManager(models.Manager):
+    def apply_deltas(self, deltas) -> None:
+        """
+        Применяет приращения {(date, university_id, facility_id, order_type, status): (count, revenue)}
+        атомарными UPDATE ... SET order_count = order_count + N. Недостающие строки создаются
+        только для положительных приращений (уменьшение всегда относится к уже учтенному заказу).
+        """
+        deltas = {key: delta for key, delta in deltas.items() if delta[0] or delta[1]}
+        if not deltas: return
+        missing_rows = [
+            self.model(date=key[0], university_id=key[1], facility_id=key[2], order_type=key[3], status=key[4])
+            for key, (count_delta, _revenue_delta) in deltas.items() if count_delta > 0
+        ]
+        if missing_rows:
+            self.bulk_create(missing_rows, ignore_conflicts=True)
+        for (stats_date, university_id, facility_id, order_type, status), (count_delta, revenue_delta) in deltas.items():
+            self.filter(
+                date=stats_date, university_id=university_id, facility_id=facility_id, order_type=order_type, status=status
+            ).update(order_count=F('order_count') + count_delta, revenue=F('revenue') + revenue_delta)
+
+    def record_order_change(self, old_snapshot, new_snapshot) -> None:
+        """ Переносит вклад заказа из old_snapshot в new_snapshot (см. Order.get_stats_snapshot; None — нет вклада). """
+        facility_ids = {snapshot[1] for snapshot in (old_snapshot, new_snapshot) if snapshot}
+        university_by_facility = dict(Facility.objects.filter(pk__in=facility_ids).values_list('id', 'university_id'))
+        deltas = defaultdict(lambda: [0, Decimal(0)])
+        for sign, snapshot in ((-1, old_snapshot), (1, new_snapshot)):
+            if snapshot is None: continue
+            created_at, facility_id, order_type, status, total_price = snapshot
+            if created_at is None or facility_id not in university_by_facility: continue
+            key = (timezone.localdate(created_at), university_by_facility[facility_id], facility_id, order_type, status)
+            deltas[key][0] += sign
+            deltas[key][1] += sign * Decimal(total_price or 0)
+        self.apply_deltas(deltas)
+
+    def rebuild(self, start_date=None, end_date=None) -> int:
+        """
+        Пересчитывает агрегаты из Order за период [start_date, end_date] (по умолчанию — целиком).
+        Возвращает количество записанных строк.
+        """
+        current_tz = timezone.get_current_timezone()
+        orders_qs = Order.objects.all()
+        stats_qs = self.all()
+        if start_date:
+            orders_qs = orders_qs.filter(created_at__gte=timezone.make_aware(datetime.combine(start_date, time.min), current_tz))
+            stats_qs = stats_qs.filter(date__gte=start_date)
+        if end_date:
+            orders_qs = orders_qs.filter(created_at__lt=timezone.make_aware(datetime.combine(end_date + timedelta(days=1), time.min), current_tz))
+            stats_qs = stats_qs.filter(date__lte=end_date)
+        rows = [
+            self.model(
+                date=row['stats_date'], university_id=row['facility__university'], facility_id=row['facility'],
+                order_type=row['order_type'], status=row['status'], order_count=row['order_count'], revenue=row['revenue']
+            )
+            for row in orders_qs.annotate(stats_date=TruncDate('created_at', tzinfo=current_tz))
+            .values('stats_date', 'facility__university', 'facility', 'order_type', 'status')
+            .annotate(order_count=Count('id'), revenue=Coalesce(Sum('total_price'), Decimal(0)))
+            .order_by()
+        ]
+        with transaction.atomic():
+            stats_qs.delete()
+            self.bulk_create(rows, batch_size=1000)
+        return len(rows)
+
+
+class DailyOrderStats(models.Model):
+    """
+    Дневной агрегат заказов для дашбордов: количество и сумма по (дата создания, ВУЗ, объект, тип, статус).
+    Поддерживается инкрементально при сохранении заказа и массовых переходах статусов
+    (bookings.order_utils.bulk_transition_orders); полный пересчет — команда rebuild_daily_order_stats.
+    """
+    date = models.DateField(_("Дата создания заказов"))
+    university = models.ForeignKey(
+        'universities.University', on_delete=models.CASCADE, related_name='daily_order_stats', verbose_name=_("Университет")
+    )
+    facility = models.ForeignKey(
+        'facilities.Facility' if not FACILITY_IMPORTED else Facility,
+        on_delete=models.CASCADE, related_name='daily_order_stats', verbose_name=_("Спортивный объект")
+    )
+    order_type = models.CharField(_("Тип заказа"), max_length=20, choices=Order.ORDER_TYPE_CHOICES)
+    status = models.CharField(_("Статус заказа"), max_length=30, choices=Order.ORDER_STATUS_CHOICES)
+    order_count = models.IntegerField(_("Количество заказов"), default=0)
+    revenue = models.DecimalField(_("Сумма (сум)"), max_digits=16, decimal_places=0, default=0)
+
+    objects = DailyOrderStatsManager()
+
+    class Meta:
+        verbose_name = _("Дневная статистика заказов")
+        verbose_name_plural = _("Дневная статистика заказов")
+        ordering = ['-date']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['date', 'university', 'facility', 'order_type', 'status'], name='unique_daily_order_stats'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['university', 'date']),
+            models.Index(fields=['status', 'date']),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.facility_id} {self.order_type}/{self.status}: {self.order_count}"
+
+
 # --- ОБНОВЛЕННАЯ МОДЕЛЬ PaymentTransaction ---
 def default_payment_transaction_expires_at(): # Это было для Stripe
     # Для Paycom нет явного expires_at для сессии, которую мы создаем.
@@ -354,4 +669,63 @@ class PaymentTransaction(models.Model):
     # def is_stripe_session_expired(self):
     #     return self.stripe_session_id and self.status == 'intent_created' and self.expires_at and timezone.now() > self.expires_at
 
+
+class PaymeCallbackResponseManager(models.Manager):
+    def get_cached_payload(self, method: str, paycom_transaction_id: str, request_hash: str):
+        """ Сохраненный ответ на такой же вызов (одна выборка по уникальному ключу) или None. """
+        ttl_minutes = getattr(settings, 'PAYME_CALLBACK_IDEMPOTENCY_TTL_MINUTES', 12 * 60)
+        return self.filter(
+            method=method, paycom_transaction_id=paycom_transaction_id, request_hash=request_hash,
+            created_at__gte=timezone.now() - timedelta(minutes=ttl_minutes),
+        ).values_list('response_payload', flat=True).first()
+
+    def store(self, method: str, paycom_transaction_id: str, request_hash: str, response_payload: dict) -> None:
+        """
+        Запоминает ответ. Ответы других методов по этой транзакции удаляются: после CancelTransaction
+        повтор PerformTransaction должен снова пройти через обработчик, а не получить устаревший ответ.
+        """
+        self.filter(paycom_transaction_id=paycom_transaction_id).exclude(method=method).delete()
+        self.bulk_create([
+            self.model(method=method, paycom_transaction_id=paycom_transaction_id, request_hash=request_hash, response_payload=response_payload)
+        ], ignore_conflicts=True)
+
+    def purge_expired(self, now=None) -> int:
+        now = now or timezone.now()
+        ttl_minutes = getattr(settings, 'PAYME_CALLBACK_IDEMPOTENCY_TTL_MINUTES', 12 * 60)
+        deleted_count, _deleted_by_model = self.filter(created_at__lt=now - timedelta(minutes=ttl_minutes)).delete()
+        return deleted_count
+
+
+class PaymeCallbackResponse(models.Model):
+    """
+    Журнал ответов на PerformTransaction/CancelTransaction Payme: повтор того же вызова (по таймауту)
+    получает сохраненный ответ без повторной обработки заказа. Ключ — (метод, ID транзакции Payme, хэш запроса).
+    Записи старше PAYME_CALLBACK_IDEMPOTENCY_TTL_MINUTES удаляются командой expire_pending_orders.
+    """
+    method = models.CharField(_("Метод JSON-RPC"), max_length=40)
+    paycom_transaction_id = models.CharField(_("ID транзакции в Paycom"), max_length=255)
+    request_hash = models.CharField(_("Хэш запроса"), max_length=64)
+    response_payload = models.JSONField(_("Ответ"))
+    created_at = models.DateTimeField(_("Создано"), auto_now_add=True, db_index=True)
+
+    objects = PaymeCallbackResponseManager()
+
+    class Meta:
+        verbose_name = _("Ответ на вызов Payme")
+        verbose_name_plural = _("Ответы на вызовы Payme")
+        constraints = [
+            models.UniqueConstraint(fields=['method', 'paycom_transaction_id', 'request_hash'], name='unique_payme_callback_response'),
+        ]
+        indexes = [
+            models.Index(fields=['paycom_transaction_id']),
+        ]
+
+    def __str__(self):
+        return f"{self.method} {self.paycom_transaction_id}"
+
+    @staticmethod
+    def build_request_hash(university_id, params) -> str:
+        canonical_request = json.dumps({'university_id': university_id, 'params': params}, sort_keys=True, separators=(',', ':'), default=str)
+        return hashlib.sha256(canonical_request.encode('utf-8')).hexdigest()
+
 # --- END OF FULL MODIFIED backend/bookings/models.py ---
\ No newline at end of file
@@ -1,15 +1,20 @@
-from typing import Optional, Dict, Any, Union
+from collections import defaultdict
+from typing import Optional, Dict, Any, Union, List
 from uuid import UUID
 from datetime import time, timedelta, datetime, date as dt_date
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 import logging # Добавим логирование
 
-from facilities.models import Facility
+from facilities.models import Facility, FacilityDayLedger, SlotOccupancy
 # --- ИЗМЕНЕНИЕ: Импортируем сервис ---
 from facilities.availability_checker import FacilityAvailabilityService 
+from facilities.availability_cache import invalidate_availability_cache
 # --- КОНЕЦ ИЗМЕНЕНИЯ ---
-from .models import Order 
+from .models import Order, PaymentTransaction, DailyOrderStats
 
 logger = logging.getLogger(__name__)
 
@@ -22,15 +27,72 @@ def check_order_conflicts(
 ) -> Optional[str]:
     """
     Проверяет конфликты для создаваемого заказа (брони или подписки).
-    Использует FacilityAvailabilityService.check_slot_availability для каждого релевантного слота.
+    Возвращает сообщение о первом конфликте или None.
+    """
+    conflict_messages = list_order_conflicts(
+        facility, order_type, params_for_check,
+        exclude_order_id=exclude_order_id, request_time_for_service=request_time_for_service, first_only=True
+    )
+    return conflict_messages[0] if conflict_messages else None
+
+
+def get_order_dates(order_type: str, params_for_check: Dict[str, Any]) -> List[dt_date]:
+    """
+    Возвращает даты, которые затрагивает заказ (для подписки — только дни из days_of_week).
+    Некорректные параметры дают пустой список: ошибку вернет сама проверка конфликтов.
+    """
+    try:
+        if order_type == Order.TYPE_SUBSCRIPTION:
+            start_date_obj = dt_date.fromisoformat(params_for_check['start_date'])
+            end_date_obj = dt_date.fromisoformat(params_for_check['end_date'])
+            days_set = set(params_for_check['days_of_week'])
+            return [
+                start_date_obj + timedelta(days=offset) for offset in range((end_date_obj - start_date_obj).days + 1)
+                if (start_date_obj + timedelta(days=offset)).weekday() in days_set
+            ]
+        return [dt_date.fromisoformat(params_for_check['date'])]
+    except (KeyError, ValueError, TypeError):
+        return []
+
+
+def reserve_and_check_order_conflicts(
+    facility: Facility, 
+    order_type: str, 
+    params_for_check: Dict[str, Any], 
+    exclude_order_id: Optional[Union[int, str, UUID]] = None,
+    request_time_for_service: Optional[datetime] = None
+) -> Optional[str]:
+    """
+    То же, что check_order_conflicts, но сначала блокирует журнал объекта (FacilityDayLedger) на даты заказа.
+    Вызывать внутри transaction.atomic() и создавать заказ в той же транзакции: параллельный заказ
+    на те же даты дождется коммита и увидит новую занятость, заказы на другие даты не ждут.
+    """
+    FacilityDayLedger.objects.lock_dates(facility.id, get_order_dates(order_type, params_for_check))
+    return check_order_conflicts(
+        facility, order_type, params_for_check,
+        exclude_order_id=exclude_order_id, request_time_for_service=request_time_for_service
+    )
+
+
+def list_order_conflicts(
+    facility: Facility, 
+    order_type: str, 
+    params_for_check: Dict[str, Any], 
+    exclude_order_id: Optional[Union[int, str, UUID]] = None,
+    request_time_for_service: Optional[datetime] = None,
+    first_only: bool = False,
+) -> List[str]:
+    """
+    Возвращает сообщения обо всех конфликтах заказа (или только о первом при first_only).
+    Подписки проверяются массово через FacilityAvailabilityService.find_subscription_conflicts,
+    слоты — через check_range; в обоих случаях занятость загружается одним запросом.
     """
-    current_tz = timezone.get_current_timezone()
-    
     # --- ИЗМЕНЕНИЕ: Создаем экземпляр сервиса ---
     # request_time_for_service можно передавать из view, если там оно фиксируется, 
     # иначе сервис сам возьмет timezone.now()
     availability_service = FacilityAvailabilityService(facility, request_time=request_time_for_service)
     # --- КОНЕЦ ИЗМЕНЕНИЯ ---
+    conflict_messages = []
 
     if order_type == Order.TYPE_SUBSCRIPTION:
         try:
@@ -40,43 +102,38 @@ def check_order_conflicts(
             times_list_str = params_for_check['start_times'] 
         except (KeyError, ValueError, TypeError) as e:
             logger.warning(f"Invalid params for subscription conflict check: {params_for_check}. Error: {e}")
-            return _("Ошибка в параметрах для проверки конфликтов подписки.")
-
-        current_iter_date = start_date_obj
-        while current_iter_date <= end_date_obj:
-            if current_iter_date.weekday() in days_list_int:
-                for time_str in times_list_str:
-                    try:
-                        slot_time_obj = time.fromisoformat(time_str)
-                    except ValueError:
-                        logger.warning(f"Invalid time format '{time_str}' in subscription params.")
-                        return _("Некорректный формат времени '{time_val}' для подписки.").format(time_val=time_str)
-                    
-                    check_dt_start_naive = datetime.combine(current_iter_date, slot_time_obj)
-                    check_dt_start_aware = timezone.make_aware(check_dt_start_naive, current_tz)
-                    
-                    # --- ИЗМЕНЕНИЕ: Вызываем метод сервиса ---
-                    availability_result = availability_service.check_slot_availability(
-                        check_datetime_start=check_dt_start_aware,
-                        capacity_needed=1, 
-                        exclude_order_id=exclude_order_id
-                    )
-                    # --- КОНЕЦ ИЗМЕНЕНИЯ ---
-
-                    if not availability_result["is_available"]:
-                        reason = availability_result.get("reason", "unknown") # Добавил .get
-                        # Логируем детали конфликта
-                        logger.info(
-                            f"Subscription conflict for facility {facility.id}: "
-                            f"Date: {current_iter_date}, Time: {time_str}, Reason: {reason}, "
-                            f"Details: {availability_result}"
-                        )
-                        return _("Конфликт для подписки: {date} {time} (Причина: {reason_key})").format(
-                            date=current_iter_date.strftime('%d.%m.%Y'), 
-                            time=time_str, 
-                            reason_key=reason # Используем ключ причины из результата
-                        )
-            current_iter_date += timedelta(days=1)
+            return [_("Ошибка в параметрах для проверки конфликтов подписки.")]
+
+        # Время разбираем один раз, а не для каждой даты периода
+        time_str_by_obj = {}
+        for time_str in times_list_str:
+            try:
+                time_str_by_obj.setdefault(time.fromisoformat(time_str), time_str)
+            except ValueError:
+                logger.warning(f"Invalid time format '{time_str}' in subscription params.")
+                return [_("Некорректный формат времени '{time_val}' для подписки.").format(time_val=time_str)]
+
+        # --- ИЗМЕНЕНИЕ: Массовая проверка вместо перебора всех дат и времен подписки ---
+        subscription_conflicts = availability_service.find_subscription_conflicts(
+            start_date_obj, end_date_obj, days_list_int, list(time_str_by_obj),
+            capacity_needed=1, exclude_order_id=exclude_order_id, first_only=first_only
+        )
+        # --- КОНЕЦ ИЗМЕНЕНИЯ ---
+
+        for conflict_date, conflict_time, availability_result in subscription_conflicts:
+            reason = availability_result.get("reason", "unknown") # Добавил .get
+            time_str = time_str_by_obj[conflict_time]
+            # Логируем детали конфликта
+            logger.info(
+                f"Subscription conflict for facility {facility.id}: "
+                f"Date: {conflict_date}, Time: {time_str}, Reason: {reason}, "
+                f"Details: {availability_result}"
+            )
+            conflict_messages.append(_("Конфликт для подписки: {date} {time} (Причина: {reason_key})").format(
+                date=conflict_date.strftime('%d.%m.%Y'), 
+                time=time_str, 
+                reason_key=reason # Используем ключ причины из результата
+            ))
 
     elif order_type == Order.TYPE_SLOT_BOOKING:
         try:
@@ -84,28 +141,28 @@ def check_order_conflicts(
             slots_list_str = params_for_check.get('slots', []) 
             if not slots_list_str:
                  logger.warning("No slots provided for slot booking conflict check.")
-                 return _("Для слотового бронирования не переданы слоты для проверки конфликтов.")
+                 return [_("Для слотового бронирования не переданы слоты для проверки конфликтов.")]
         except (KeyError, ValueError, TypeError) as e:
             logger.warning(f"Invalid params for slot booking conflict check: {params_for_check}. Error: {e}")
-            return _("Ошибка в параметрах для проверки конфликтов слотового бронирования.")
+            return [_("Ошибка в параметрах для проверки конфликтов слотового бронирования.")]
 
+        parsed_slots = []
         for slot_str in slots_list_str:
             try:
-                slot_time_obj = time.fromisoformat(slot_str)
+                parsed_slots.append((slot_str, time.fromisoformat(slot_str)))
             except ValueError:
                 logger.warning(f"Invalid time format '{slot_str}' in slot booking params.")
-                return _("Некорректный формат времени '{time_val}' для слота.").format(time_val=slot_str)
-
-            check_dt_start_naive = datetime.combine(booking_date_obj, slot_time_obj)
-            check_dt_start_aware = timezone.make_aware(check_dt_start_naive, current_tz)
-            
-            # --- ИЗМЕНЕНИЕ: Вызываем метод сервиса ---
-            availability_result = availability_service.check_slot_availability(
-                check_datetime_start=check_dt_start_aware,
-                capacity_needed=1, 
-                exclude_order_id=exclude_order_id
-            )
-            # --- КОНЕЦ ИЗМЕНЕНИЯ ---
+                return [_("Некорректный формат времени '{time_val}' для слота.").format(time_val=slot_str)]
+
+        # --- ИЗМЕНЕНИЕ: Все слоты дня проверяются одним запросом ---
+        range_results = availability_service.check_range(
+            booking_date_obj, booking_date_obj, [slot_time_obj for _s, slot_time_obj in parsed_slots],
+            capacity_needed=1, exclude_order_id=exclude_order_id
+        )
+        # --- КОНЕЦ ИЗМЕНЕНИЯ ---
+
+        for slot_str, slot_time_obj in parsed_slots:
+            availability_result = range_results[(booking_date_obj, slot_time_obj)]
 
             if not availability_result["is_available"]:
                 reason = availability_result.get("reason", "unknown")
@@ -114,9 +171,142 @@ def check_order_conflicts(
                     f"Date: {booking_date_obj}, Time: {slot_str}, Reason: {reason}, "
                     f"Details: {availability_result}"
                 )
-                return _("Конфликт для бронирования: {date} {time} (Причина: {reason_key})").format(
+                conflict_messages.append(_("Конфликт для бронирования: {date} {time} (Причина: {reason_key})").format(
                     date=booking_date_obj.strftime('%d.%m.%Y'), 
                     time=slot_str, 
                     reason_key=reason
-                )
-    return None
\ No newline at end of file
+                ))
+                if first_only: break
+    return conflict_messages
+
+
+def bulk_transition_orders(order_ids, from_status: str, to_status: str) -> List[int]:
+    """
+    Переводит заказы из from_status в to_status одним UPDATE ... WHERE status = from_status.
+    Вызывать внутри transaction.atomic(). Заказы, статус которых успел измениться (например, оплата
+    пришла параллельно), пропускаются. Т.к. update() не вызывает Order.save(), занятость
+    освобождается здесь же, если новый статус не создает конфликтов, и переносятся дневные агрегаты.
+    Возвращает id фактически переведенных заказов.
+    """
+    locked_ids = list(
+        Order.objects.select_for_update(skip_locked=True)
+        .filter(pk__in=list(order_ids), status=from_status)
+        .values_list('pk', flat=True)
+    )
+    if not locked_ids:
+        return []
+    # update() не вызывает Order.save(), поэтому вклад в дневные агрегаты переносим здесь же
+    stats_deltas = defaultdict(lambda: [0, 0])
+    for created_at, university_id, facility_id, order_type, total_price in Order.objects.filter(pk__in=locked_ids).values_list(
+        'created_at', 'facility__university_id', 'facility_id', 'order_type', 'total_price'
+    ):
+        stats_date = timezone.localdate(created_at)
+        for status_key, sign in ((from_status, -1), (to_status, 1)):
+            delta = stats_deltas[(stats_date, university_id, facility_id, order_type, status_key)]
+            delta[0] += sign; delta[1] += sign * total_price
+    Order.objects.filter(pk__in=locked_ids, status=from_status).update(status=to_status, updated_at=timezone.now())
+    DailyOrderStats.objects.apply_deltas(stats_deltas)
+    if to_status not in Order.STATUS_CREATES_CONFLICT:
+        released_dates = defaultdict(set)
+        for facility_id, slot_date in SlotOccupancy.objects.filter(order_id__in=locked_ids).values_list('facility_id', 'date').distinct():
+            released_dates[facility_id].add(slot_date)
+        SlotOccupancy.objects.filter(order_id__in=locked_ids).delete()
+        for facility_id, dates in released_dates.items():
+            invalidate_availability_cache(facility_id, dates)
+    return locked_ids
+
+
+def expire_pending_orders(now: Optional[datetime] = None, batch_size: Optional[int] = None) -> int:
+    """
+    Переводит просроченные неоплаченные заказы в STATUS_EXPIRED_AWAITING_PAYMENT пачками.
+    Кандидаты выбираются по индексу PaymentTransaction (status, expires_at); для старых транзакций
+    без expires_at срок считается от created_at (PENDING_ORDER_TTL_MINUTES).
+    Возвращает количество истекших заказов.
+    """
+    now = now or timezone.now()
+    batch_size = batch_size or getattr(settings, 'PENDING_ORDER_SWEEP_BATCH_SIZE', 500)
+    legacy_cutoff = now - timedelta(minutes=getattr(settings, 'PENDING_ORDER_TTL_MINUTES', 30))
+    pending_tx_statuses = [PaymentTransaction.STATUS_AWAITING_PROVIDER_REDIRECT, PaymentTransaction.STATUS_PROVIDER_PROCESSING]
+    expired_q = Q(expires_at__lt=now) | Q(expires_at__isnull=True, created_at__lt=legacy_cutoff)
+
+    total_expired = 0
+    last_pk = None
+    while True:
+        candidates_qs = PaymentTransaction.objects.filter(
+            expired_q, status__in=pending_tx_statuses, created_order__status=Order.STATUS_PENDING_PAYMENT
+        ).order_by('pk')
+        if last_pk is not None:
+            candidates_qs = candidates_qs.filter(pk__gt=last_pk)
+        candidates = list(candidates_qs.values_list('pk', 'created_order__pk')[:batch_size])
+        if not candidates:
+            break
+        last_pk = candidates[-1][0]
+        with transaction.atomic():
+            expired_order_ids = bulk_transition_orders(
+                [order_pk for _tx_pk, order_pk in candidates],
+                Order.STATUS_PENDING_PAYMENT, Order.STATUS_EXPIRED_AWAITING_PAYMENT
+            )
+            if expired_order_ids:
+                PaymentTransaction.objects.filter(
+                    created_order__pk__in=expired_order_ids, status__in=pending_tx_statuses
+                ).update(status=PaymentTransaction.STATUS_PROVIDER_EXPIRED, updated_at=now)
+        total_expired += len(expired_order_ids)
+        logger.info(f"Expired {len(expired_order_ids)} pending orders (batch of {len(candidates)} candidates).")
+        if len(candidates) < batch_size:
+            break
+    return total_expired
+
+
+def complete_order_by_code(order_code: str) -> Optional[Order]:
+    """
+    Отмечает заказ (бронь слотов или вход) использованным — см. complete_orders_by_codes.
+    Возвращает заказ (только поля из RETURNING) или None, если подходящего подтвержденного заказа нет.
+    """
+    completed_orders = complete_orders_by_codes([order_code])
+    return completed_orders[0] if completed_orders else None
+
+
+def complete_orders_by_codes(order_codes) -> List[Order]:
+    """
+    Compare-and-set confirmed → completed для набора кодов одним
+    UPDATE ... WHERE order_code IN (...) AND status = 'confirmed' ... RETURNING.
+    Из параллельных сканирований одного кода заказ получает только одно.
+    Возвращает фактически завершенные заказы (только поля из RETURNING).
+    Т.к. Order.save() не вызывается, занятость и дневные агрегаты обновляются здесь же.
+    """
+    normalized_codes = list(dict.fromkeys(Order.normalize_order_code(code) for code in order_codes))
+    if not normalized_codes:
+        return []
+    quote_name = connection.ops.quote_name
+    order_table = quote_name(Order._meta.db_table)
+    facility_table = quote_name(Facility._meta.db_table)
+    completed_at = timezone.now()
+    # Подзапрос в RETURNING отдает ВУЗ для агрегатов без отдельного запроса (PostgreSQL и SQLite >= 3.35)
+    completion_sql = f"""
+        UPDATE {order_table} SET status = %s, updated_at = %s
+        WHERE order_code IN ({', '.join(['%s'] * len(normalized_codes))}) AND status = %s AND order_type IN (%s, %s)
+        RETURNING id, order_code, order_type, status, booking_date, facility_id, total_price, created_at, updated_at,
+            (SELECT f.university_id FROM {facility_table} f WHERE f.id = {order_table}.facility_id) AS university_id
+    """
+    params = [
+        Order.STATUS_COMPLETED, connection.ops.adapt_datetimefield_value(completed_at),
+        *normalized_codes, Order.STATUS_CONFIRMED, Order.TYPE_SLOT_BOOKING, Order.TYPE_ENTRY_FEE,
+    ]
+    with transaction.atomic():
+        completed_orders = list(Order.objects.raw(completion_sql, params))
+        if not completed_orders:
+            return []
+        SlotOccupancy.objects.filter(order_id__in=[order.pk for order in completed_orders]).delete() # 'completed' не создает конфликтов
+        released_dates = defaultdict(set)
+        stats_deltas = defaultdict(lambda: [0, 0])
+        for order in completed_orders:
+            if order.booking_date:
+                released_dates[order.facility_id].add(order.booking_date)
+            stats_key = (timezone.localdate(order.created_at), order.university_id, order.facility_id, order.order_type)
+            for status_key, sign in ((Order.STATUS_CONFIRMED, -1), (Order.STATUS_COMPLETED, 1)):
+                delta = stats_deltas[stats_key + (status_key,)]
+                delta[0] += sign; delta[1] += sign * order.total_price
+        for facility_id, dates in released_dates.items():
+            invalidate_availability_cache(facility_id, dates)
+        DailyOrderStats.objects.apply_deltas(stats_deltas)
+    return completed_orders
@@ -1,14 +1,15 @@
 # --- START OF FULL MODIFIED backend/bookings/paycom_handler.py ---
-import base64
 import binascii
 import logging
+from datetime import timedelta
 from decimal import Decimal, ROUND_DOWN
 
 from django.conf import settings
 from django.utils import timezone
 from django.utils.module_loading import import_string
 from django.db import transaction as django_db_transaction
-from django.shortcuts import get_object_or_404
+from django.db.models import BigIntegerField, Q, Subquery
+from django.db.models.functions import Cast
 from django.utils.translation import gettext_lazy as _
 
 from rest_framework.response import Response
@@ -19,8 +20,9 @@ from payme import exceptions as payme_exceptions
 from payme.types import response as payme_response_types
 from payme.util import time_to_payme, time_to_service
 
-from .models import Order, PaymentTransaction
-from universities.models import University
+from .models import Order, PaymentTransaction, PaymeCallbackResponse
+from .status_events import publish_order_status
+from universities.webhook_credentials import get_webhook_credentials
 
 logger = logging.getLogger(__name__) # Имя логгера будет bookings.paycom_handler
 
@@ -32,27 +34,22 @@ except ImportError:
     AccountModel = Order
 
 class CustomPaymeCallbackView(PaymeWebHookAPIView):
-    current_university = None 
+    current_university_id = None
+    IDEMPOTENT_METHODS = ("PerformTransaction", "CancelTransaction")
 
     def check_authorize(self, request, university_webhook_slug=None):
-        # ... (логика check_authorize, logger.error и logger.warning остаются, logger.info об успехе можно оставить)
+        # Учетные данные кассы берутся из кэша процесса (universities.webhook_credentials), без запроса к БД на каждый вызов
         if not university_webhook_slug: logger.error("[PaymeAuth] Slug missing."); raise payme_exceptions.PermissionDenied("slug_missing")
         try:
-            university = University.objects.get(webhook_slug=university_webhook_slug, is_active=True)
-            payme_key_for_university = university.payme_secret_key
-            payme_login_for_university = university.payme_cash_id
-        except University.DoesNotExist: logger.error(f"[PaymeAuth] Uni slug '{university_webhook_slug}' not found."); raise payme_exceptions.PermissionDenied("university_not_found")
+            credentials = get_webhook_credentials(university_webhook_slug)
         except Exception as e: logger.error(f"[PaymeAuth] Creds retrieval error for slug '{university_webhook_slug}': {e}", exc_info=True); raise payme_exceptions.InternalServiceError("credential_access_error")
-        if not payme_key_for_university or not payme_login_for_university: logger.error(f"[PaymeAuth] Credentials not set for uni {university.id}."); raise payme_exceptions.PermissionDenied("university_credentials_missing")
+        if credentials is None: logger.error(f"[PaymeAuth] Uni slug '{university_webhook_slug}' not found."); raise payme_exceptions.PermissionDenied("university_not_found")
+        if not credentials.secret_key or not credentials.cash_id: logger.error(f"[PaymeAuth] Credentials not set for uni {credentials.university_id}."); raise payme_exceptions.PermissionDenied("university_credentials_missing")
         auth_header = request.META.get('HTTP_AUTHORIZATION')
         if not auth_header: logger.warning(f"[PaymeAuth] Missing Auth header for {university_webhook_slug}."); raise payme_exceptions.PermissionDenied("auth_header_missing")
-        try:
-            auth_type, creds = auth_header.split(); assert auth_type.lower() == 'basic'
-            login_hdr, key_hdr = base64.b64decode(creds).decode('utf-8').split(':', 1)
-        except: logger.warning(f"[PaymeAuth] Auth decoding error for {university_webhook_slug}."); raise payme_exceptions.PermissionDenied("auth_decoding_error")
-        if login_hdr != payme_login_for_university or key_hdr != payme_key_for_university: logger.warning(f"[PaymeAuth] Invalid credentials for uni {university.id}."); raise payme_exceptions.PermissionDenied("invalid_key_or_login")
-        self.current_university = university
-        logger.info(f"[PaymeAuth] Authorized Paycom request for university: {self.current_university.name}")
+        if not credentials.matches_authorization_header(auth_header): logger.warning(f"[PaymeAuth] Invalid credentials for uni {credentials.university_id}."); raise payme_exceptions.PermissionDenied("invalid_key_or_login")
+        self.current_university_id = credentials.university_id
+        logger.info(f"[PaymeAuth] Authorized Paycom request for university: {self.current_university_id}")
 
 
     def post(self, request, *args, **kwargs):
@@ -66,7 +63,17 @@ class CustomPaymeCallbackView(PaymeWebHookAPIView):
             error_payload = {"error": {"code": payme_exceptions.InvalidParamsError.error_code, "message": payme_exceptions.InvalidParamsError.message, "data": message}, "id": request.data.get("id", None)}
             return Response(error_payload, status=200)
         if method in payme_methods_map:
+            idempotency_key = None
+            if method in self.IDEMPOTENT_METHODS and isinstance(params, dict):
+                # Повтор вызова после таймаута получает тот же ответ без повторной обработки заказа
+                idempotency_key = (method, str(params.get('id', '')), PaymeCallbackResponse.build_request_hash(self.current_university_id, params))
+                cached_payload = PaymeCallbackResponse.objects.get_cached_payload(*idempotency_key)
+                if cached_payload is not None:
+                    logger.info(f"[PaymeCallbackPost] Replayed {method} for Payme Tx {idempotency_key[1]} from idempotency ledger.")
+                    if request_id is not None: cached_payload["id"] = request_id
+                    return Response(cached_payload)
             result_payload_dict = payme_methods_map[method](params) 
+            if idempotency_key is not None: PaymeCallbackResponse.objects.store(*idempotency_key, response_payload=result_payload_dict)
             if request_id is not None: result_payload_dict["id"] = request_id
             return Response(result_payload_dict) 
         logger.warning(f"[PaymeCallbackPost] Method not found: {method}")
@@ -74,14 +81,16 @@ class CustomPaymeCallbackView(PaymeWebHookAPIView):
 
 
     @payme_handle_exceptions_decorator
-    def fetch_account(self, params: dict) -> Order:
-        # ... (logger.warning и logger.error остаются) ...
+    def fetch_account(self, params: dict, for_update: bool = False) -> Order:
+        # Заказ читается одним запросом вместе с объектом и PaymentTransaction; for_update=True — внутри atomic()
         account_field_name = settings.PAYME_ACCOUNT_FIELD; account_value = params.get('account', {}).get(account_field_name)
         if not account_value: logger.warning(f"[PaymeLogic] Account field '{account_field_name}' missing."); raise payme_exceptions.InvalidAccount(account_field_name)
         try:
-            order_instance = AccountModel.objects.get(**{account_field_name: account_value})
-            if not hasattr(order_instance, 'facility') or not hasattr(order_instance.facility, 'university'): logger.error(f"[PaymeLogic] Order {order_instance.id} integrity error."); raise payme_exceptions.InternalServiceError("order_integrity_error")
-            if order_instance.facility.university != self.current_university: logger.error(f"[PaymeLogic] Order {order_instance.id} university mismatch."); raise payme_exceptions.AccountDoesNotExist(account_field_name)
+            orders_qs = AccountModel.objects.select_related('facility', 'payment_transaction_link')
+            if for_update: orders_qs = orders_qs.select_for_update(of=('self',)) # Блокируем только строку заказа
+            order_instance = orders_qs.get(**{account_field_name: account_value})
+            if not order_instance.facility_id or not order_instance.facility.university_id: logger.error(f"[PaymeLogic] Order {order_instance.id} integrity error."); raise payme_exceptions.InternalServiceError("order_integrity_error")
+            if order_instance.facility.university_id != self.current_university_id: logger.error(f"[PaymeLogic] Order {order_instance.id} university mismatch."); raise payme_exceptions.AccountDoesNotExist(account_field_name)
             return order_instance
         except AccountModel.DoesNotExist: logger.warning(f"[PaymeLogic] Order not found by {account_field_name}={account_value}."); raise 
         except Exception as e: logger.error(f"[PaymeLogic] Unexpected error in fetch_account: {e}", exc_info=True); raise payme_exceptions.InternalServiceError(f"fetch_account_failed: {str(e)}")
@@ -104,26 +113,32 @@ class CustomPaymeCallbackView(PaymeWebHookAPIView):
         # ... (например, logger.info(f"[PaymeCreateTx] PaymeTransaction ... already exists in state INITIATING (idempotency).") - можно сделать debug или убрать)
         # ... (logger.error остается)
         paycom_transaction_id = params["id"]; paycom_amount_tiyin = int(Decimal(params.get('amount', 0)))
-        order_instance = self.fetch_account(params); self.validate_amount(order_instance, paycom_amount_tiyin)
-        if settings.PAYME_ONE_TIME_PAYMENT: # ... (проверка existing_other_payme_tx_for_order, logger.warning) ...
-            existing_other_payme_tx_for_order = PaymeTransactions.objects.filter(account_id=order_instance.pk, state=PaymeTransactions.INITIATING).exclude(transaction_id=paycom_transaction_id).first()
-            if existing_other_payme_tx_for_order: logger.warning(f"[PaymeCreateTx] Order {order_instance.id} already has active PaymeTx {existing_other_payme_tx_for_order.transaction_id}."); raise payme_exceptions.TransactionAlreadyExists(settings.PAYME_ACCOUNT_FIELD)
-        if order_instance.status != Order.STATUS_PENDING_PAYMENT: # ... (проверка existing_payme_tx, logger.info/warning) ...
-            try: 
-                existing_payme_tx = PaymeTransactions.objects.get(transaction_id=paycom_transaction_id)
-                if existing_payme_tx.is_performed() or existing_payme_tx.is_cancelled(): return {"result": {"create_time": time_to_payme(existing_payme_tx.created_at), "transaction": str(getattr(order_instance, settings.PAYME_ACCOUNT_FIELD)), "state": existing_payme_tx.state}}
-                elif existing_payme_tx.state == PaymeTransactions.INITIATING: pass 
-                else: raise payme_exceptions.AccountDoesNotExist(f"Order {order_instance.id} status invalid and Payme tx {paycom_transaction_id} in unexpected state {existing_payme_tx.state}")
-            except PaymeTransactions.DoesNotExist: raise payme_exceptions.AccountDoesNotExist(f"Order {order_instance.id} not pending and no Payme tx {paycom_transaction_id} found")
-        with django_db_transaction.atomic(): # ... (создание/обновление, logger.error если нужно) ...
-            payme_tx_defaults = {"amount": Decimal(paycom_amount_tiyin) / 100, "state": PaymeTransactions.INITIATING, "account_id": order_instance.pk}
-            payme_transaction_record, created = PaymeTransactions.objects.get_or_create(transaction_id=paycom_transaction_id, defaults=payme_tx_defaults)
-            if not created and payme_transaction_record.state != PaymeTransactions.INITIATING:
+        with django_db_transaction.atomic():
+            # Строка заказа заблокирована до конца транзакции — повторные/параллельные CreateTransaction по заказу идут по очереди
+            order_instance = self.fetch_account(params, for_update=True); self.validate_amount(order_instance, paycom_amount_tiyin)
+            # Эта транзакция Payme и другие активные транзакции заказа — одним запросом
+            payme_tx_records = list(PaymeTransactions.objects.filter(
+                Q(transaction_id=paycom_transaction_id) | Q(account_id=order_instance.pk, state=PaymeTransactions.INITIATING)
+            ))
+            payme_transaction_record = next((tx for tx in payme_tx_records if tx.transaction_id == paycom_transaction_id), None)
+            if settings.PAYME_ONE_TIME_PAYMENT:
+                existing_other_payme_tx_for_order = next((tx for tx in payme_tx_records if tx.transaction_id != paycom_transaction_id), None)
+                if existing_other_payme_tx_for_order: logger.warning(f"[PaymeCreateTx] Order {order_instance.id} already has active PaymeTx {existing_other_payme_tx_for_order.transaction_id}."); raise payme_exceptions.TransactionAlreadyExists(settings.PAYME_ACCOUNT_FIELD)
+            if payme_transaction_record is not None and payme_transaction_record.state != PaymeTransactions.INITIATING:
                 if payme_transaction_record.is_performed() or payme_transaction_record.is_cancelled(): return {"result": {"create_time": time_to_payme(payme_transaction_record.created_at), "transaction": str(getattr(order_instance, settings.PAYME_ACCOUNT_FIELD)), "state": payme_transaction_record.state}}
                 raise payme_exceptions.AccountDoesNotExist(f"Payme tx {paycom_transaction_id} exists for Order {order_instance.id} but not initiating")
-            our_payment_transaction = get_object_or_404(PaymentTransaction, created_order=order_instance)
+            if payme_transaction_record is None:
+                if order_instance.status != Order.STATUS_PENDING_PAYMENT: raise payme_exceptions.AccountDoesNotExist(f"Order {order_instance.id} not pending and no Payme tx {paycom_transaction_id} found")
+                payme_transaction_record = PaymeTransactions.objects.create(
+                    transaction_id=paycom_transaction_id, amount=Decimal(paycom_amount_tiyin) / 100,
+                    state=PaymeTransactions.INITIATING, account_id=order_instance.pk,
+                )
+            our_payment_transaction = order_instance.payment_transaction_link
+            if our_payment_transaction is None: logger.error(f"[PaymeCreateTx] No payment_transaction_link for Order {order_instance.id}!"); raise payme_exceptions.InternalServiceError("payment_transaction_missing")
             our_payment_transaction.paycom_id = paycom_transaction_id; our_payment_transaction.paycom_time_created_ms = params.get("time"); our_payment_transaction.status = PaymentTransaction.STATUS_PROVIDER_PROCESSING 
-            our_payment_transaction.save(update_fields=['paycom_id', 'paycom_time_created_ms', 'status', 'updated_at'])
+            # Paycom может провести транзакцию в течение своего таймаута — не истекаем заказ раньше
+            our_payment_transaction.expires_at = timezone.now() + timedelta(minutes=settings.PAYCOM_TRANSACTION_TTL_MINUTES)
+            our_payment_transaction.save(update_fields=['paycom_id', 'paycom_time_created_ms', 'status', 'expires_at', 'updated_at'])
         response_payload = {"create_time": time_to_payme(payme_transaction_record.created_at), "transaction": str(getattr(order_instance, settings.PAYME_ACCOUNT_FIELD)), "state": payme_transaction_record.state}
         self.handle_created_payment(params, {"result": response_payload}) 
         return {"result": response_payload}
@@ -155,22 +170,29 @@ class CustomPaymeCallbackView(PaymeWebHookAPIView):
     # logger.error для исключений обязателен.
     # Убрал [PaymePerformDebug] и [PaymeCancelDebug] для единообразия.
 
+    def lock_order_for_payme_transaction(self, paycom_transaction_id: str) -> Order:
+        """
+        Заказ транзакции Payme вместе с PaymentTransaction одним SELECT ... FOR UPDATE (вызывать внутри atomic()).
+        PaymeTransactions.account_id хранится строкой, поэтому приводится к типу первичного ключа.
+        """
+        account_id_subquery = PaymeTransactions.objects.filter(transaction_id=paycom_transaction_id).values('account_id')[:1]
+        return AccountModel.objects.select_related('payment_transaction_link').select_for_update(of=('self',)).get(
+            pk=Cast(Subquery(account_id_subquery), output_field=BigIntegerField())
+        )
+
     def handle_successfully_payment(self, params, result, *args, **kwargs):
         logger.info(f"[PaymePerform] Entered handle_successfully_payment. Order ID (our): {result.get('result',{}).get('transaction')}, Payme Tx ID: {params.get('id')}")
         super().handle_successfully_payment(params, result, *args, **kwargs)
         # ... (остальная логика с logger.info/error как была) ...
         paycom_id_from_params = params['id']
         try:
-            payme_tx_record = PaymeTransactions.objects.get(transaction_id=paycom_id_from_params)
-            our_order_pk = payme_tx_record.account_id
-            order_instance = AccountModel.objects.get(pk=our_order_pk)
-            # logger.info(f"[PaymePerform] Found Order: {order_instance.id}, current status: {order_instance.status}")
             with django_db_transaction.atomic(): # ... (обновление Order и PaymentTransaction) ...
+                order_instance = self.lock_order_for_payme_transaction(paycom_id_from_params)
                 order_needs_save = False
                 if order_instance.status == Order.STATUS_PENDING_PAYMENT: order_instance.status = Order.STATUS_CONFIRMED; order_needs_save = True; logger.info(f"[PaymePerform] Order {order_instance.id} status set to CONFIRMED.")
                 elif order_instance.status == Order.STATUS_CONFIRMED: logger.info(f"[PaymePerform] Order {order_instance.id} already CONFIRMED.")
                 else: logger.error(f"[PaymePerform] Order {order_instance.id} has unexpected status {order_instance.status}.")
-                if order_needs_save: order_instance.save(update_fields=['status', 'updated_at'])
+                if order_needs_save: order_instance.save(update_fields=['status', 'updated_at']); publish_order_status(order_instance.pk, order_instance.status)
                 if hasattr(order_instance, 'payment_transaction_link') and order_instance.payment_transaction_link: # ... (обновление PaymentTransaction) ...
                     our_payment_transaction = order_instance.payment_transaction_link; pt_needs_save = False
                     if not our_payment_transaction.paycom_id: our_payment_transaction.paycom_id = paycom_id_from_params; pt_needs_save = True
@@ -190,15 +212,14 @@ class CustomPaymeCallbackView(PaymeWebHookAPIView):
         # ... (остальная логика с logger.info/error как была) ...
         paycom_id_from_params = params['id']; payme_reason_code = params.get('reason')
         try:
-            payme_tx_record = PaymeTransactions.objects.get(transaction_id=paycom_id_from_params)
-            order_instance = AccountModel.objects.get(pk=payme_tx_record.account_id)
             with django_db_transaction.atomic(): # ... (обновление Order и PaymentTransaction) ...
+                order_instance = self.lock_order_for_payme_transaction(paycom_id_from_params)
                 new_order_status = order_instance.status; current_order_status = order_instance.status
                 if current_order_status == Order.STATUS_PENDING_PAYMENT: # ...
                     if payme_reason_code == 4: new_order_status = Order.STATUS_EXPIRED_AWAITING_PAYMENT
                     else: new_order_status = Order.STATUS_PAYMENT_FAILED 
                 elif current_order_status == Order.STATUS_CONFIRMED and result['result']['state'] == PaymeTransactions.CANCELED: new_order_status = Order.STATUS_REFUNDED 
-                if new_order_status != current_order_status: order_instance.status = new_order_status; order_instance.save(update_fields=['status', 'updated_at'])
+                if new_order_status != current_order_status: order_instance.status = new_order_status; order_instance.save(update_fields=['status', 'updated_at']); publish_order_status(order_instance.pk, new_order_status)
                 if hasattr(order_instance, 'payment_transaction_link') and order_instance.payment_transaction_link: # ... (обновление PaymentTransaction) ...
                     our_payment_transaction = order_instance.payment_transaction_link; pt_needs_save = False
                     if not our_payment_transaction.paycom_id: our_payment_transaction.paycom_id = paycom_id_from_params; pt_needs_save = True
@@ -2,6 +2,8 @@ from rest_framework import serializers
 from django.utils.translation import gettext_lazy as _
 from datetime import time, timedelta, date as dt_date, datetime
 from decimal import Decimal
+from modeltranslation import settings as mt_settings
+from modeltranslation.utils import build_localized_fieldname
 
 from .models import Order, PaymentTransaction # Импортируем новые модели
 # FacilityListSerializer будет использоваться для вложенного представления объекта
@@ -151,6 +153,73 @@ class OrderSerializer(serializers.ModelSerializer):
             return f"{start} - {end}"
         return "-"
 
+class SparseFieldsetMixin:
+    """
+    ?fields=id,status,... — отдает только перечисленные поля (неизвестные имена игнорируются).
+    Мобильный клиент может урезать ответ списка; без параметра поля не меняются.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        requested_fields = request.query_params.get('fields') if request is not None and hasattr(request, 'query_params') else None
+        if requested_fields:
+            allowed_fields = {name.strip() for name in requested_fields.split(',') if name.strip()}
+            for field_name in set(self.fields) - allowed_fields:
+                self.fields.pop(field_name)
+
+
+class OrderListSerializer(SparseFieldsetMixin, OrderSerializer):
+    """
+    Сериализатор списка «Мои заказы»: тот же ответ, что у OrderSerializer, но
+    расписание заказа (дни, время, период) разбирается один раз на строку,
+    а queryset читает только колонки из QUERYSET_ONLY_FIELDS.
+    """
+    QUERYSET_ONLY_FIELDS = (
+        'id', 'order_code', 'user__email', 'order_type', 'status', 'total_price', 'payment_transaction_link_id',
+        'created_at', 'updated_at', 'booking_date', 'slots',
+        'subscription_start_date', 'subscription_end_date', 'days_of_week', 'subscription_times', 'duration_per_slot_hours',
+        'facility__id', 'facility__main_image', 'facility__facility_type', 'facility__booking_type',
+        'facility__price_per_hour', 'facility__open_time', 'facility__close_time', 'facility__university__id',
+    )
+    # Переводимые поля (modeltranslation) — читаются вместе с колонками всех языков
+    TRANSLATED_ONLY_FIELDS = ('facility__name', 'facility__university__name', 'facility__university__short_name')
+
+    @classmethod
+    def get_queryset_only_fields(cls) -> list:
+        # Order не зарегистрирован в modeltranslation, поэтому only() по связям не дополняется колонками _uz/_ru сам
+        localized_fields = [
+            f"{prefix}__{build_localized_fieldname(field_name, language)}"
+            for prefix, _sep, field_name in (lookup.rpartition('__') for lookup in cls.TRANSLATED_ONLY_FIELDS)
+            for language in mt_settings.AVAILABLE_LANGUAGES
+        ]
+        return [*cls.QUERYSET_ONLY_FIELDS, *cls.TRANSLATED_ONLY_FIELDS, *localized_fields]
+
+    def _get_schedule_display(self, obj: Order) -> dict:
+        schedule_display = getattr(obj, '_schedule_display', None)
+        if schedule_display is None:
+            subscription_times_display = super().get_subscription_times_display(obj)
+            schedule_display = {
+                'subscription_days_display': super().get_subscription_days_display(obj),
+                'subscription_times_display': subscription_times_display,
+                'display_time_range': subscription_times_display if obj.order_type == Order.TYPE_SUBSCRIPTION else super().get_display_time_range(obj),
+                'display_date_period': super().get_display_date_period(obj),
+            }
+            obj._schedule_display = schedule_display
+        return schedule_display
+
+    def get_subscription_days_display(self, obj: Order) -> str:
+        return self._get_schedule_display(obj)['subscription_days_display']
+
+    def get_subscription_times_display(self, obj: Order) -> str:
+        return self._get_schedule_display(obj)['subscription_times_display']
+
+    def get_display_time_range(self, obj: Order) -> str:
+        return self._get_schedule_display(obj)['display_time_range']
+
+    def get_display_date_period(self, obj: Order) -> str:
+        return self._get_schedule_display(obj)['display_date_period']
+
+
 # Сериализатор для PaymentTransaction (адаптируем, если нужно)
 class PaymentTransactionSerializer(serializers.ModelSerializer):
     user_email = serializers.EmailField(source='user.email', read_only=True)
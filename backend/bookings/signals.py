@@ -0,0 +1,11 @@
+# bookings/signals.py
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .models import Order, DailyOrderStats
+
+
+@receiver(post_delete, sender=Order)
+def remove_deleted_order_from_daily_stats(sender, instance, **kwargs):
+    # Удаление заказа (в т.ч. каскадное) вычитает его вклад из дневных агрегатов
+    DailyOrderStats.objects.record_order_change(getattr(instance, '_stats_snapshot', None) or instance.get_stats_snapshot(), None)
@@ -0,0 +1,89 @@
+# bookings/status_events.py
+"""
+Уведомления об изменении статуса заказа для long-poll страницы оплаты.
+
+Обработчики Payme (handle_successfully_payment / handle_cancelled_payment) публикуют новый статус
+после коммита транзакции, а async-представление OrderPaymentStatusWaitView ждет публикации вместо
+того, чтобы клиент опрашивал полный OrderPaymentStatusView.
+
+Брокер задается настройкой ORDER_STATUS_BROKER_CLASS. LocalOrderStatusBroker — замена внешнего брокера
+в памяти процесса: доставляет события только ожидающим в этом же процессе. Поэтому представление
+дополнительно перечитывает статус из БД раз в ORDER_STATUS_RECHECK_SECONDS — так событие из другого
+воркера (или пропущенное между чтением статуса и подпиской) все равно будет получено.
+"""
+import asyncio
+import logging
+import threading
+from collections import defaultdict
+from typing import Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+def _resolve_waiter(future: asyncio.Future, status: str) -> None:
+    if not future.done():
+        future.set_result(status)
+
+
+class LocalOrderStatusBroker:
+    """ Брокер в памяти процесса: order_id -> ожидающие future (каждый в своем event loop). """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waiters = defaultdict(set)
+
+    def publish(self, order_id: int, status: str) -> None:
+        """ Потокобезопасно: вызывается из синхронного кода (обработчики Payme). """
+        with self._lock:
+            waiters = self._waiters.pop(order_id, set())
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(_resolve_waiter, future, status)
+            except RuntimeError: # Event loop ожидающего уже закрыт
+                pass
+
+    async def wait(self, order_id: int, timeout: float) -> Optional[str]:
+        """ Новый статус заказа или None, если за timeout секунд публикаций не было. """
+        loop = asyncio.get_running_loop()
+        waiter = (loop, loop.create_future())
+        with self._lock:
+            self._waiters[order_id].add(waiter)
+        try:
+            return await asyncio.wait_for(waiter[1], timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            with self._lock:
+                order_waiters = self._waiters.get(order_id)
+                if order_waiters is not None:
+                    order_waiters.discard(waiter)
+                    if not order_waiters: del self._waiters[order_id]
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_order_status_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                broker_class_path = getattr(settings, 'ORDER_STATUS_BROKER_CLASS', 'bookings.status_events.LocalOrderStatusBroker')
+                _broker = import_string(broker_class_path)()
+    return _broker
+
+
+def publish_order_status(order_id: int, status: str) -> None:
+    """ Публикует статус после коммита текущей транзакции (ожидающие не увидят откаченное изменение). """
+    def _publish():
+        try:
+            get_order_status_broker().publish(order_id, status)
+        except Exception as e:
+            # Ошибка брокера не должна ломать обработку платежа — клиент получит статус при перечитывании
+            logger.error(f"Order status publish failed for order {order_id}: {e}", exc_info=True)
+    transaction.on_commit(_publish)
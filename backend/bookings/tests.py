@@ -1,23 +1,40 @@
-from django.test import TestCase, override_settings
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, AsyncRequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
 from datetime import datetime, time, date as dt_date, timedelta
 from decimal import Decimal
+from io import StringIO
+import asyncio
+import base64
 import uuid
 import json
-from unittest import mock # Для моканья Stripe API
+from urllib.parse import parse_qs, urlparse
+from unittest import mock, skip # mock — для моканья Stripe API
 
 from rest_framework import status
-from rest_framework.test import APIClient
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
 
 from core.models import User
 from universities.models import University
-from facilities.models import Facility
-from .models import PaymentTransaction, SlotBooking, Subscription, Booking
+from facilities.models import Facility, SlotOccupancy
+from .models import DailyOrderStats, Order, PaymeCallbackResponse, PaymentTransaction
+from .order_utils import bulk_transition_orders
+from .paycom_handler import CustomPaymeCallbackView
+from .serializers import OrderSerializer
+from .status_events import get_order_status_broker
+from .views import OrderPaymentStatusWaitView
 # Импортируем константы причин для проверки сообщений об ошибках
 from facilities.availability_checker import REASON_MAX_CAPACITY_REACHED, REASON_FULLY_BOOKED_EXCLUSIVE
 
 
+# Stripe-поток (create-checkout-session, stripe-webhook) и модели SlotBooking/Subscription/Booking удалены:
+# оплата идет через Payme, все заказы — модель Order. Тесты ниже оставлены как архив и пропускаются.
+LEGACY_STRIPE_SKIP_REASON = "Stripe-поток и модели SlotBooking/Subscription/Booking удалены (Payme + Order)"
+
 # Мокаем stripe перед импортом views, если stripe используется на уровне модуля views
 # Но лучше мокать его внутри каждого тестового метода или в setUp/tearDown.
 # Здесь мы будем мокать конкретные вызовы Stripe внутри тестов.
@@ -29,6 +46,7 @@ from facilities.availability_checker import REASON_MAX_CAPACITY_REACHED, REASON_
     FRONTEND_BASE_URL='http://testfrontend.com',
     STRIPE_CHECKOUT_SESSION_TIMEOUT_MINUTES=30
 )
+@skip(LEGACY_STRIPE_SKIP_REASON)
 class CreateCheckoutSessionViewTests(TestCase):
     @classmethod
     def setUpTestData(cls):
@@ -277,6 +295,7 @@ class CreateCheckoutSessionViewTests(TestCase):
 # Тесты для StripeWebhookView будут сложнее из-за необходимости мокать Stripe Webhook event
 # и проверять создание заказов / инициацию возвратов.
 # @override_settings(...) # Аналогично для StripeWebhookViewTests
+@skip(LEGACY_STRIPE_SKIP_REASON)
 class StripeWebhookViewTests(TestCase):
     @classmethod
     def setUpTestData(cls):
@@ -492,4 +511,310 @@ class StripeWebhookViewTests(TestCase):
 
     # TODO: Тесты для других типов событий (payment_intent.succeeded, payment_intent.payment_failed)
     # TODO: Тесты для идемпотентности (повторная отправка того же вебхука checkout.session.completed)
-    # TODO: Тесты для создания Subscription и Booking (entry_fee) через вебхук
\ No newline at end of file
+    # TODO: Тесты для создания Subscription и Booking (entry_fee) через вебхук
+
+class OrderFixtureMixin:
+    """ Общие данные тестов заказов: пользователь, университет и объект, открытый ежедневно с 8:00 до 22:00. """
+
+    @classmethod
+    def create_order_fixture(cls, prefix, university_fields=None, **facility_fields):
+        slug = prefix.lower()
+        cls.user = User.objects.create_user(email=f'{slug}@example.com', password='password123', first_name=prefix, last_name='User', username=f'{slug}user')
+        cls.university = University.objects.create(name=f"{prefix} Uni", city=f"{prefix} City", **(university_fields or {}))
+        facility_fields = {
+            'facility_type': Facility.TYPE_TENNIS, 'price_per_hour': 30000, 'booking_type': Facility.BOOKING_TYPE_OVERLAPPING, 'max_capacity': 5,
+            **facility_fields,
+        }
+        cls.facility = Facility.objects.create(
+            name=f"{prefix} Court", university=cls.university, open_time=time(8, 0), close_time=time(22, 0),
+            working_days="0,1,2,3,4,5,6", **facility_fields,
+        )
+
+    def create_pending_order(self, start_time, end_time, booking_date=None, expires_at=None,
+                             tx_status=PaymentTransaction.STATUS_AWAITING_PROVIDER_REDIRECT):
+        """ Заказ слота в ожидании оплаты со связанной PaymentTransaction (цена — один час объекта). """
+        price = Decimal(self.facility.price_per_hour)
+        payment_transaction = PaymentTransaction.objects.create(
+            user=self.user, item_type_at_creation=Order.TYPE_SLOT_BOOKING, item_parameters={},
+            amount=price, status=tx_status, expires_at=expires_at,
+        )
+        return Order.objects.create(
+            user=self.user, facility=self.facility, order_type=Order.TYPE_SLOT_BOOKING,
+            status=Order.STATUS_PENDING_PAYMENT, total_price=price, booking_date=booking_date or timezone.localdate() + timedelta(days=1),
+            slots=[{"start_time": start_time, "end_time": end_time}], payment_transaction_link=payment_transaction,
+        )
+
+
+class ExpirePendingOrdersTests(OrderFixtureMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_order_fixture("Expire", price_per_hour=50000, booking_type=Facility.BOOKING_TYPE_EXCLUSIVE, max_capacity=None)
+
+    def _create_pending_order(self, expires_at, slot="10:00", tx_status=PaymentTransaction.STATUS_AWAITING_PROVIDER_REDIRECT):
+        return self.create_pending_order(slot, "23:00", expires_at=expires_at, tx_status=tx_status)
+
+    def test_command_expires_stale_orders_and_releases_slots(self):
+        now = timezone.now()
+        stale = [self._create_pending_order(now - timedelta(minutes=1), slot=f"1{i}:00") for i in range(3)]
+        fresh = self._create_pending_order(now + timedelta(minutes=10), slot="18:00")
+        processing = self._create_pending_order(now + timedelta(hours=11), slot="19:00", tx_status=PaymentTransaction.STATUS_PROVIDER_PROCESSING)
+
+        out = StringIO()
+        call_command('expire_pending_orders', '--batch-size', '2', stdout=out)
+        self.assertIn("3", out.getvalue())
+
+        for order in stale:
+            order.refresh_from_db()
+            self.assertEqual(order.status, Order.STATUS_EXPIRED_AWAITING_PAYMENT)
+            self.assertEqual(order.payment_transaction_link.status, PaymentTransaction.STATUS_PROVIDER_EXPIRED)
+        self.assertFalse(SlotOccupancy.objects.filter(order__in=stale).exists())
+        for order in (fresh, processing):
+            order.refresh_from_db()
+            self.assertEqual(order.status, Order.STATUS_PENDING_PAYMENT)
+        self.assertEqual(SlotOccupancy.objects.filter(order__in=[fresh, processing]).count(), 2)
+
+
+class DailyOrderStatsTests(OrderFixtureMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_order_fixture("Rollup", price_per_hour=20000)
+        cls.tomorrow = timezone.localdate() + timedelta(days=1)
+
+    def _create_order(self, status, price=20000):
+        return Order.objects.create(
+            user=self.user, facility=self.facility, order_type=Order.TYPE_SLOT_BOOKING,
+            status=status, total_price=Decimal(price), booking_date=self.tomorrow,
+            slots=[{"start_time": "10:00", "end_time": "11:00"}],
+        )
+
+    def _snapshot(self):
+        return {
+            (row.date, row.university_id, row.facility_id, row.order_type, row.status): (row.order_count, row.revenue)
+            for row in DailyOrderStats.objects.exclude(order_count=0)
+        }
+
+    def test_status_transitions_move_counts_incrementally(self):
+        confirmed = self._create_order(Order.STATUS_PENDING_PAYMENT, price=30000)
+        expiring = self._create_order(Order.STATUS_PENDING_PAYMENT)
+        confirmed = Order.objects.get(pk=confirmed.pk)
+        confirmed.status = Order.STATUS_CONFIRMED
+        confirmed.save(update_fields=['status', 'updated_at'])
+        with transaction.atomic():
+            bulk_transition_orders([expiring.pk], Order.STATUS_PENDING_PAYMENT, Order.STATUS_EXPIRED_AWAITING_PAYMENT)
+
+        key = (timezone.localdate(), self.university.id, self.facility.id, Order.TYPE_SLOT_BOOKING)
+        self.assertEqual(self._snapshot(), {
+            key + (Order.STATUS_CONFIRMED,): (1, Decimal(30000)),
+            key + (Order.STATUS_EXPIRED_AWAITING_PAYMENT,): (1, Decimal(20000)),
+        })
+
+        Order.objects.filter(pk=expiring.pk).delete()
+        self.assertEqual(self._snapshot(), {key + (Order.STATUS_CONFIRMED,): (1, Decimal(30000))})
+
+    def test_rebuild_matches_incremental_rollup(self):
+        for status in (Order.STATUS_CONFIRMED, Order.STATUS_CONFIRMED, Order.STATUS_PAYMENT_FAILED):
+            self._create_order(status)
+        incremental = self._snapshot()
+        DailyOrderStats.objects.all().delete()
+        call_command('rebuild_daily_order_stats', stdout=StringIO())
+        self.assertEqual(self._snapshot(), incremental)
+
+
+class PaymeCallbackQueryTests(OrderFixtureMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_order_fixture("Payme")
+
+    def setUp(self):
+        self.order = self.create_pending_order("10:00", "11:00")
+        self.view = CustomPaymeCallbackView()
+        self.view.current_university_id = self.university.id
+        self.create_params = {"id": "payme-tx-1", "time": 1700000000000, "amount": 3000000, "account": {"id": self.order.id}}
+
+    def _count_order_selects(self, queries):
+        order_table = Order._meta.db_table
+        return sum(1 for query in queries if query['sql'].startswith('SELECT') and f'FROM "{order_table}"' in query['sql'])
+
+    def test_create_transaction_reads_order_once(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.view.create_transaction(self.create_params)
+        self.assertEqual(response['result']['state'], 1)
+        # Заказ+объект+PaymentTransaction, транзакции Payme, создание транзакции Payme, обновление PaymentTransaction
+        self.assertEqual(len([query for query in queries if 'SAVEPOINT' not in query['sql']]), 4)
+        self.assertEqual(self._count_order_selects(queries), 1)
+        self.order.payment_transaction_link.refresh_from_db()
+        self.assertEqual(self.order.payment_transaction_link.paycom_id, "payme-tx-1")
+
+        # Повтор того же CreateTransaction идемпотентен
+        self.assertEqual(self.view.create_transaction(self.create_params)['result']['state'], 1)
+
+    def test_perform_and_cancel_lock_order_with_single_query(self):
+        self.view.create_transaction(self.create_params)
+        with CaptureQueriesContext(connection) as queries:
+            self.view.perform_transaction({"id": "payme-tx-1"})
+        self.assertEqual(self._count_order_selects(queries), 1)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, Order.STATUS_CONFIRMED)
+        self.assertEqual(self.order.payment_transaction_link.status, PaymentTransaction.STATUS_ORDER_CONFIRMED_BY_PROVIDER)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.view.cancel_transaction({"id": "payme-tx-1", "reason": 5})
+        self.assertEqual(self._count_order_selects(queries), 1)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, Order.STATUS_REFUNDED)
+        self.assertEqual(self.order.payment_transaction_link.status, PaymentTransaction.STATUS_REFUNDED)
+
+
+class PaymeIdempotencyTests(OrderFixtureMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_order_fixture("Replay", university_fields={'payme_cash_id': "replay-cash", 'payme_secret_key': "replay-secret"})
+
+    def setUp(self):
+        self.order = self.create_pending_order("12:00", "13:00")
+
+    def _call(self, method, params, request_id=1):
+        auth_token = base64.b64encode(b"replay-cash:replay-secret").decode('ascii')
+        request = APIRequestFactory().post(
+            '/payme/', {"method": method, "params": params, "id": request_id}, format='json', HTTP_AUTHORIZATION=f"Basic {auth_token}"
+        )
+        # Доступ проверяет check_authorize (Basic-авторизация кассы), а не DRF permissions
+        view = CustomPaymeCallbackView.as_view(permission_classes=())
+        return view(request, university_webhook_slug=self.university.webhook_slug).data
+
+    def _count_order_queries(self, queries):
+        return sum(1 for query in queries if f'"{Order._meta.db_table}"' in query['sql'])
+
+    def test_perform_replay_returns_stored_response_without_touching_order(self):
+        self._call("CreateTransaction", {"id": "replay-tx", "time": 1700000000000, "amount": 3000000, "account": {"id": self.order.id}})
+        first_response = self._call("PerformTransaction", {"id": "replay-tx"}, request_id=2)
+        with CaptureQueriesContext(connection) as queries:
+            replay_response = self._call("PerformTransaction", {"id": "replay-tx"}, request_id=3)
+        self.assertEqual(self._count_order_queries(queries), 0)
+        self.assertEqual(replay_response['result'], first_response['result'])
+        self.assertEqual(replay_response['id'], 3)
+
+        # После отмены повтор PerformTransaction снова обрабатывается (сохраненный ответ удален)
+        cancel_response = self._call("CancelTransaction", {"id": "replay-tx", "reason": 5}, request_id=4)
+        self.assertEqual(cancel_response['result']['state'], -2)
+        self.assertFalse(PaymeCallbackResponse.objects.filter(method="PerformTransaction").exists())
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, Order.STATUS_REFUNDED)
+
+        PaymeCallbackResponse.objects.update(created_at=timezone.now() - timedelta(days=2))
+        self.assertEqual(PaymeCallbackResponse.objects.purge_expired(), 1)
+
+
+class OrderPaymentStatusWaitTests(OrderFixtureMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_order_fixture("Wait")
+        cls.other_user = User.objects.create_user(email='stranger@example.com', password='password123', username='stranger')
+        cls.order = Order.objects.create(
+            user=cls.user, facility=cls.facility, order_type=Order.TYPE_SLOT_BOOKING,
+            status=Order.STATUS_PENDING_PAYMENT, total_price=Decimal('30000'), booking_date=timezone.localdate() + timedelta(days=1),
+            slots=[{"start_time": "14:00", "end_time": "15:00"}],
+        )
+
+    async def _wait(self, user, known_status, timeout=5):
+        request = AsyncRequestFactory().get(
+            '/wait/', {'status': known_status, 'timeout': timeout}, headers={'Authorization': f"Bearer {AccessToken.for_user(user)}"}
+        )
+        response = await OrderPaymentStatusWaitView.as_view()(request, order_identifier=str(self.order.id))
+        return response.status_code, json.loads(response.content) if response.status_code == 200 else None
+
+    async def test_returns_immediately_when_status_already_differs(self):
+        status_code, data = await self._wait(self.user, 'confirmed')
+        self.assertEqual(status_code, 200)
+        self.assertEqual(data, {'id': self.order.id, 'status': 'pending_payment', 'changed': True})
+        status_code, _data = await self._wait(self.other_user, 'pending_payment')
+        self.assertEqual(status_code, 404)
+
+    async def test_wakes_up_on_published_status(self):
+        waiting = asyncio.ensure_future(self._wait(self.user, 'pending_payment'))
+        await asyncio.sleep(0.2)
+        self.assertFalse(waiting.done())
+        get_order_status_broker().publish(self.order.id, 'confirmed')
+        status_code, data = await asyncio.wait_for(waiting, 2)
+        self.assertEqual((status_code, data['status'], data['changed']), (200, 'confirmed', True))
+
+    @override_settings(ORDER_STATUS_RECHECK_SECONDS=1)
+    async def test_times_out_without_change(self):
+        status_code, data = await self._wait(self.user, 'pending_payment', timeout=1)
+        self.assertEqual((status_code, data['changed']), (200, False))
+
+
+
+
+class MyOrdersListQueryTests(OrderFixtureMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_order_fixture("List", university_fields={'short_name': "LU"})
+        cls.booking_date = timezone.localdate() + timedelta(days=2)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('bookings_api:my-unified-orders-list')
+
+    def _create_orders(self, count):
+        for index in range(count):
+            Order.objects.create(
+                user=self.user, facility=self.facility, order_type=Order.TYPE_SLOT_BOOKING,
+                status=Order.STATUS_CONFIRMED, total_price=Decimal('30000'), booking_date=self.booking_date,
+                slots=[{"start_time": f"{10 + index}:00", "end_time": f"{11 + index}:00"}],
+            )
+        Order.objects.create(
+            user=self.user, facility=self.facility, order_type=Order.TYPE_SUBSCRIPTION,
+            status=Order.STATUS_CONFIRMED, total_price=Decimal('90000'),
+            subscription_start_date=timezone.localdate(), subscription_end_date=self.booking_date + timedelta(days=30),
+            days_of_week="1,3", subscription_times="19:00",
+        )
+
+    def _get(self, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, {'status_group': 'active', **(params or {})})
+        self.assertEqual(response.status_code, 200)
+        return response.data['results'], len(queries)
+
+    def test_list_matches_order_serializer_with_constant_queries(self):
+        self._create_orders(1)
+        _results, queries_for_two = self._get()
+        self._create_orders(3)
+        results, queries_for_six = self._get()
+        self.assertEqual(len(results), 6)
+        self.assertEqual(queries_for_two, queries_for_six)
+
+        full_orders = {order.id: order for order in Order.objects.select_related('facility__university', 'user')}
+        for row in results:
+            expected = OrderSerializer(full_orders[row['id']]).data
+            self.assertEqual({key: row[key] for key in row if key != 'facility'}, {key: expected[key] for key in row if key != 'facility'})
+            self.assertEqual(row['facility']['university_short_name'], "LU")
+        subscription_row = next(row for row in results if row['order_type'] == Order.TYPE_SUBSCRIPTION)
+        self.assertEqual(subscription_row['display_time_range'], "19:00-20:00")
+
+    def test_sparse_fieldset(self):
+        self._create_orders(1)
+        results, _queries = self._get({'fields': 'id,status,display_date_period'})
+        self.assertEqual(set(results[0]), {'id', 'status', 'display_date_period'})
+
+    def test_cursor_pagination_walks_all_orders(self):
+        self._create_orders(4)
+        seen_ids, cursor = [], ''
+        while cursor is not None:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(self.url, {'status_group': 'active', 'cursor': cursor, 'page_size': 2})
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)
+            self.assertFalse(any('COUNT(' in query['sql'].upper() for query in queries.captured_queries)) # Без COUNT(*) на каждой странице
+            seen_ids += [row['id'] for row in response.data['results']]
+            cursor = response.data['next'] and parse_qs(urlparse(response.data['next']).query)['cursor'][0]
+        self.assertEqual(seen_ids, list(Order.objects.filter(user=self.user).order_by('-created_at', '-id').values_list('id', flat=True)))
+        # Без ?cursor= — прежние номера страниц с count
+        self.assertEqual(self.client.get(self.url, {'status_group': 'active', 'page_size': 2}).data['count'], 5)
+
+    def test_tampered_cursor_values_return_404(self):
+        self._create_orders(1)
+        for position in (["abc", 1], [{"a": 1}, 1], [[1, 2], 1], [timezone.now().isoformat(), "x"], [timezone.now().isoformat(), None]):
+            cursor = base64.urlsafe_b64encode(json.dumps({'p': position}).encode('utf-8')).decode('ascii')
+            self.assertEqual(self.client.get(self.url, {'cursor': cursor}).status_code, 404, position)
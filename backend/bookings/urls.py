@@ -3,7 +3,8 @@ from .views import (
     MyUnifiedOrderListView,
     PreparePaycomPaymentView,
     GetPaycomCheckoutLinkView,
-    OrderPaymentStatusView
+    OrderPaymentStatusView,
+    OrderPaymentStatusWaitView,
 )
 app_name = 'bookings'
 urlpatterns = [
@@ -11,4 +12,5 @@ urlpatterns = [
     path('prepare-paycom-payment/', PreparePaycomPaymentView.as_view(), name='prepare-paycom-payment'),
     path('orders/<str:order_identifier>/get-paycom-checkout-url/', GetPaycomCheckoutLinkView.as_view(), name='get-paycom-checkout-url'),
     path('orders/<str:order_identifier>/payment-status/', OrderPaymentStatusView.as_view(), name='order-payment-status'),
+    path('orders/<str:order_identifier>/payment-status/wait/', OrderPaymentStatusWaitView.as_view(), name='order-payment-status-wait'),
 ]
\ No newline at end of file
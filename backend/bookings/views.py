@@ -2,7 +2,9 @@
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework.pagination import PageNumberPagination 
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from core.pagination import CursorOrPageNumberPagination
 from django.db import transaction as django_db_transaction
 from django.shortcuts import get_object_or_404
 from django.db.models import Q
@@ -11,31 +13,37 @@ from django.utils import timezone, translation
 from dateutil.relativedelta import relativedelta
 from datetime import time, timedelta, datetime, date as dt_date
 from decimal import Decimal
+import asyncio
 import uuid 
 import logging
 
 from django.conf import settings
 from django.core.exceptions import ValidationError as DjangoValidationError
 from rest_framework import serializers
-from django.http import Http404
+from django.http import Http404, JsonResponse
+from django.views import View
+from asgiref.sync import sync_to_async
 from django.utils.translation import gettext_lazy as _
 
 from payme import Payme as PaymeInitializer # Для генерации ссылки
 
 from .models import Order, PaymentTransaction, Facility # Facility для InputSerializer
-from .serializers import OrderSerializer # Для OrderPaymentStatusView
-from .order_utils import check_order_conflicts # Для PreparePaycomPaymentView
+from facilities.models import SlotAlreadyOccupied # Конфликт занятости эксклюзивного слота при создании заказа
+from .serializers import OrderSerializer, OrderListSerializer # OrderSerializer — для OrderPaymentStatusView
+from .order_utils import reserve_and_check_order_conflicts # Для PreparePaycomPaymentView
+from .status_events import get_order_status_broker # Для OrderPaymentStatusWaitView
 from .constants import DAYS_OF_WEEK_NUMERIC # Если используется в логике расчета
 
 logger = logging.getLogger(__name__)
 
-class StandardResultsSetPagination(PageNumberPagination):
+class StandardResultsSetPagination(CursorOrPageNumberPagination):
     page_size = 10
     page_size_query_param = 'page_size'
     max_page_size = 50
+    cursor_ordering = ('-created_at', '-id') # ?cursor= — новые заказы первыми, индекс (user, created_at, id)
 
 class MyUnifiedOrderListView(generics.ListAPIView):
-    serializer_class = OrderSerializer
+    serializer_class = OrderListSerializer
     permission_classes = [permissions.IsAuthenticated]
     pagination_class = StandardResultsSetPagination
 
@@ -43,9 +51,10 @@ class MyUnifiedOrderListView(generics.ListAPIView):
         user = self.request.user
         status_group = self.request.query_params.get('status_group', None) 
         order_type_filter = self.request.query_params.get('order_type')
+        # Только колонки, которые отдает OrderListSerializer; удобства/фото объекта в списке не нужны
         queryset = Order.objects.filter(user=user).select_related(
-            'facility', 'facility__university', 'payment_transaction_link'
-        ).prefetch_related('facility__amenities', 'facility__images')
+            'user', 'facility', 'facility__university'
+        ).only(*OrderListSerializer.get_queryset_only_fields())
         if order_type_filter: queryset = queryset.filter(order_type=order_type_filter)
         today = timezone.localdate()
         if status_group == 'active':
@@ -153,19 +162,23 @@ class PreparePaycomPaymentView(generics.GenericAPIView):
             order_specific_data.update({'booking_date': booking_date_param})
         item_parameters_for_tx['calculated_amount_decimal_sum'] = str(calculated_backend_amount)
 
-        if item_type != Order.TYPE_ENTRY_FEE:
-            conflict_message = check_order_conflicts(facility=facility, order_type=item_type, params_for_check=params_for_conflict_check, exclude_order_id=None, request_time_for_service=timezone.localtime(timezone.now()))
-            if conflict_message: return Response({"error": conflict_message, "type": "conflict"}, status=status.HTTP_409_CONFLICT)
-        
         try:
             with django_db_transaction.atomic():
+                # 0. Блокируем журнал объекта на даты заказа и проверяем конфликты в той же транзакции,
+                # чтобы два одновременных заказа на один слот не прошли проверку оба
+                if item_type != Order.TYPE_ENTRY_FEE:
+                    conflict_message = reserve_and_check_order_conflicts(facility=facility, order_type=item_type, params_for_check=params_for_conflict_check, exclude_order_id=None, request_time_for_service=timezone.localtime(timezone.now()))
+                    if conflict_message: return Response({"error": conflict_message, "type": "conflict"}, status=status.HTTP_409_CONFLICT)
+
                 # 1. Создаем PaymentTransaction
                 payment_transaction = PaymentTransaction.objects.create(
                     user=user,
                     item_type_at_creation=item_type,
                     item_parameters=item_parameters_for_tx,
                     amount=calculated_backend_amount,
-                    status=PaymentTransaction.STATUS_AWAITING_PROVIDER_REDIRECT
+                    status=PaymentTransaction.STATUS_AWAITING_PROVIDER_REDIRECT,
+                    # Неоплаченный заказ держит слот не дольше TTL (см. manage.py expire_pending_orders)
+                    expires_at=timezone.now() + timedelta(minutes=settings.PENDING_ORDER_TTL_MINUTES)
                 )
                 # 2. Создаем Order и связываем с PaymentTransaction
                 order_data_for_creation = {
@@ -187,6 +200,10 @@ class PreparePaycomPaymentView(generics.GenericAPIView):
                 order_identifier_for_payme = getattr(new_order, settings.PAYME_ACCOUNT_FIELD, new_order.id)
                 return Response({"order_identifier": order_identifier_for_payme}, status=status.HTTP_201_CREATED)
 
+        except SlotAlreadyOccupied as e:
+            # unique_exclusive_slot_occupancy: параллельный заказ успел занять эксклюзивный слот
+            logger.warning(f"Slot occupancy conflict in PreparePaycomPaymentView for user {user.email}: {e}")
+            return Response({"error": _("Выбранное время уже занято."), "type": "conflict"}, status=status.HTTP_409_CONFLICT)
         except DjangoValidationError as e:
             logger.warning(f"ValidationError in PreparePaycomPaymentView for user {user.email}: {e.message_dict}")
             return Response({"error": e.message_dict}, status=status.HTTP_400_BAD_REQUEST)
@@ -263,4 +280,59 @@ class OrderPaymentStatusView(generics.RetrieveAPIView):
         obj = get_object_or_404(queryset, **{identifier_field_name: order_identifier_from_url})
         return obj
 
+
+class OrderPaymentStatusWaitView(View):
+    """
+    Long-poll статуса оплаты (async, ASGI): GET .../payment-status/wait/?status=<известный клиенту статус>&timeout=<сек>.
+    Отвечает сразу, если статус уже другой, иначе ждет публикации из обработчиков Payme (bookings.status_events)
+    не дольше timeout. Ответ — только {"id", "status", "changed"}; полные данные клиент берет из
+    OrderPaymentStatusView один раз, когда changed=true.
+    """
+
+    async def get(self, request, order_identifier):
+        try:
+            user = await sync_to_async(self._authenticate)(request)
+        except AuthenticationFailed as e:
+            return JsonResponse({"detail": str(e.detail)}, status=status.HTTP_401_UNAUTHORIZED)
+        if user is None:
+            return JsonResponse({"detail": str(_("Учетные данные не были предоставлены."))}, status=status.HTTP_401_UNAUTHORIZED)
+
+        known_status = request.GET.get('status')
+        max_timeout = getattr(settings, 'ORDER_STATUS_LONG_POLL_TIMEOUT_SECONDS', 25)
+        try:
+            timeout = min(max(float(request.GET.get('timeout', max_timeout)), 0), max_timeout)
+        except ValueError:
+            timeout = max_timeout
+
+        orders_qs = Order.objects.filter(user=user)
+        try:
+            order_row = await orders_qs.filter(**{settings.PAYME_ACCOUNT_FIELD: order_identifier}).values_list('pk', 'status').afirst()
+        except (ValueError, DjangoValidationError):
+            order_row = None
+        if order_row is None:
+            return JsonResponse({"detail": str(_("Заказ не найден."))}, status=status.HTTP_404_NOT_FOUND)
+        order_id, current_status = order_row
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        recheck_seconds = max(getattr(settings, 'ORDER_STATUS_RECHECK_SECONDS', 5), 1)
+        broker = get_order_status_broker()
+        while current_status == known_status:
+            remaining = deadline - loop.time()
+            if remaining <= 0: break
+            published_status = await broker.wait(order_id, min(remaining, recheck_seconds))
+            if published_status is not None:
+                current_status = published_status
+            else: # Событие могло прийти в другой процесс — перечитываем статус одним запросом по PK
+                current_status = await orders_qs.filter(pk=order_id).values_list('status', flat=True).afirst()
+        return JsonResponse({"id": order_id, "status": current_status, "changed": current_status != known_status})
+
+    def _authenticate(self, request):
+        # Те же JWT-токены, что и у DRF-представлений; иначе — сессия (AuthenticationMiddleware)
+        jwt_result = JWTAuthentication().authenticate(request)
+        if jwt_result is not None:
+            return jwt_result[0]
+        session_user = getattr(request, 'user', None)
+        return session_user if session_user is not None and session_user.is_authenticated else None
+
 # --- END OF FULL CORRECTED backend/bookings/views.py ---
\ No newline at end of file
@@ -0,0 +1,79 @@
+import random
+import statistics
+import time as time_module
+from datetime import time, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from bookings.models import Order
+from core.models import User
+from facilities.models import Facility
+from universities.models import University
+
+
+class Command(BaseCommand):
+    help = (
+        "Замеряет поиск заказа по коду QR (order_code__iexact против точного совпадения по нормализованному коду) "
+        "на синтетических заказах. Все созданные данные откатываются."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=1_000_000, help="Сколько синтетических заказов создать.")
+        parser.add_argument('--lookups', type=int, default=1000, help="Сколько поисков выполнить для каждого варианта.")
+        parser.add_argument('--batch-size', type=int, default=10_000, help="Размер пачки bulk_create.")
+
+    def handle(self, *args, **options):
+        orders_count = max(1, options['orders'])
+        with transaction.atomic():
+            sample_codes = self._create_orders(orders_count, options['batch_size'], options['lookups'])
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute(f"ANALYZE {Order._meta.db_table}")
+
+            # Сканер присылает код как есть (регистр может отличаться) — имитируем нижним регистром.
+            # order_by() без полей — как в QuerySet.get(), который сбрасывает сортировку Meta.ordering
+            variants = [
+                ("order_code__iexact", lambda code: Order.objects.filter(order_code__iexact=code.lower()).order_by()),
+                ("order_code (normalised)", lambda code: Order.objects.filter(order_code=Order.normalize_order_code(code.lower())).order_by()),
+            ]
+            for label, build_queryset in variants:
+                timings_ms = []
+                for code in sample_codes:
+                    started = time_module.perf_counter()
+                    found = list(build_queryset(code).values_list('pk', flat=True))
+                    timings_ms.append((time_module.perf_counter() - started) * 1000)
+                    assert len(found) == 1, f"{label}: code {code} not found"
+                timings_ms.sort()
+                self.stdout.write(self.style.SUCCESS(
+                    f"{label}: {len(timings_ms)} lookups over {orders_count} orders — "
+                    f"mean {statistics.mean(timings_ms):.3f} ms, p50 {timings_ms[len(timings_ms) // 2]:.3f} ms, "
+                    f"p95 {timings_ms[int(len(timings_ms) * 0.95) - 1]:.3f} ms"
+                ))
+                self.stdout.write(build_queryset(sample_codes[0]).explain())
+            transaction.set_rollback(True)
+
+    def _create_orders(self, orders_count, batch_size, lookups):
+        user = User.objects.create_user(email='qr-benchmark@example.com', password=None, username='qr-benchmark', first_name='QR', last_name='Benchmark')
+        university = University.objects.create(name="QR Benchmark University", city="Benchmark")
+        facility = Facility.objects.create(
+            name="QR Benchmark Facility", university=university, facility_type=Facility.TYPE_TENNIS,
+            price_per_hour=10000, open_time=time(8, 0), close_time=time(22, 0), working_days="0,1,2,3,4,5,6",
+        )
+        booking_date = timezone.localdate() + timedelta(days=1)
+        date_part = booking_date.strftime('%y%m%d')
+        # Формат как у Order.save(): SB-YYMMDD-XXXXXX (верхний регистр)
+        codes = [f"SB-{date_part}-{index:06X}" for index in range(orders_count)]
+        for batch_start in range(0, orders_count, batch_size):
+            Order.objects.bulk_create([
+                Order(
+                    order_code=code, user=user, facility=facility, order_type=Order.TYPE_SLOT_BOOKING,
+                    status=Order.STATUS_CONFIRMED, total_price=10000, booking_date=booking_date,
+                    slots=[{"start_time": "10:00", "end_time": "11:00"}],
+                )
+                for code in codes[batch_start:batch_start + batch_size]
+            ])
+            self.stdout.write(f"Created {min(batch_start + batch_size, orders_count)}/{orders_count} orders", ending='\r')
+        self.stdout.write("")
+        return random.sample(codes, min(lookups, orders_count))
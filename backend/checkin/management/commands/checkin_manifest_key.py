@@ -0,0 +1,25 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from checkin.manifest import get_manifest_signing_key
+from universities.models import University
+
+
+class Command(BaseCommand):
+    help = (
+        "Выводит ключ проверки подписи офлайн-манифеста для сканеров ВУЗа (производный от CHECKIN_MANIFEST_SIGNING_KEY). "
+        "Ключ позволяет и подписывать манифесты этого ВУЗа — выдавайте его только доверенным устройствам."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('university_id', type=int, help="ID университета.")
+
+    def handle(self, *args, **options):
+        university_id = options['university_id']
+        if not University.objects.filter(pk=university_id).exists():
+            raise CommandError(f"University {university_id} not found.")
+        try:
+            signing_key = get_manifest_signing_key(university_id)
+        except ImproperlyConfigured as e:
+            raise CommandError(str(e))
+        self.stdout.write(signing_key.decode('utf-8'))
@@ -0,0 +1,99 @@
+# checkin/manifest.py
+"""
+Манифест для офлайн-проверки QR-кодов на сканерах.
+
+Манифест — список действующих сегодня кодов заказов по объектам ВУЗа: подтвержденные брони слотов,
+оплата за вход на сегодня и подписки с занятием в сегодняшний день недели. Запись компактная:
+[order_code, facility_id, order_type, ["HH:MM-HH:MM", ...]] (пустой список времени — весь день).
+
+Дельта: клиент передает generated_at предыдущего манифеста (since) и получает только заказы,
+измененные с тех пор: действующие — в valid, ставшие недействительными (использованы, отменены) — в revoked.
+
+Подпись: payload — это строка канонического JSON, signature — HMAC-SHA256 (hex) от нее ключом ВУЗа.
+Ключ ВУЗа производный от мастер-ключа CHECKIN_MANIFEST_SIGNING_KEY (без него манифест не выдается)
+и выдается сканерам командой manage.py checkin_manifest_key. Подпись симметричная: она защищает от
+подмены манифеста по дороге и от чужих ключей, но любой сканер ВУЗа, хранящий ключ, может сам
+подписать поддельный манифест своего ВУЗа. Ключи других ВУЗов и мастер-ключ из него не вычисляются.
+"""
+import hashlib
+import hmac
+import json
+from collections import defaultdict
+from datetime import datetime
+from typing import Optional
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from bookings.models import Order, OrderSlot
+
+MANIFEST_VERSION = 1
+
+
+def get_manifest_signing_key(university_id: int) -> bytes:
+    """ Ключ подписи манифестов ВУЗа (hex); его же получают сканеры ВУЗа. """
+    master_key = getattr(settings, 'CHECKIN_MANIFEST_SIGNING_KEY', None)
+    if not master_key:
+        raise ImproperlyConfigured("CHECKIN_MANIFEST_SIGNING_KEY is not set: check-in manifests cannot be signed.")
+    return hmac.new(
+        master_key.encode('utf-8'), f"checkin.manifest:university:{university_id}".encode('utf-8'), hashlib.sha256
+    ).hexdigest().encode('utf-8')
+
+
+def sign_manifest_payload(payload: str, university_id: int) -> str:
+    return hmac.new(get_manifest_signing_key(university_id), payload.encode('utf-8'), hashlib.sha256).hexdigest()
+
+
+def build_checkin_manifest(university_id: int, since: Optional[datetime] = None, now: Optional[datetime] = None) -> dict:
+    """
+    Собирает манифест ВУЗа на сегодня. since (aware datetime) — дельта относительно предыдущего
+    манифеста; манифест прошлого дня или без since отдается целиком (full=True).
+    """
+    now = now or timezone.now()
+    today = timezone.localdate(now)
+    is_delta = since is not None and timezone.localdate(since) == today
+
+    q_bookings_today = Q(order_type__in=[Order.TYPE_SLOT_BOOKING, Order.TYPE_ENTRY_FEE], booking_date=today)
+    q_subscriptions_today = Q(
+        order_type=Order.TYPE_SUBSCRIPTION, subscription_start_date__lte=today, subscription_end_date__gte=today
+    ) & Exists(OrderSlot.objects.filter(order=OuterRef('pk'), weekday=today.weekday()))
+    orders_qs = Order.objects.filter(facility__university_id=university_id).filter(q_bookings_today | q_subscriptions_today)
+    if is_delta:
+        orders_qs = orders_qs.filter(updated_at__gte=since) # >= — запись на границе лучше отдать дважды, чем потерять
+    else:
+        orders_qs = orders_qs.filter(status=Order.STATUS_CONFIRMED)
+    order_rows = list(orders_qs.values_list('id', 'order_code', 'facility_id', 'order_type', 'status').order_by('order_code'))
+
+    # Время занятий на сегодня — одним запросом по нормализованным слотам
+    time_ranges_by_order = defaultdict(list)
+    valid_order_ids = [order_id for order_id, _code, _facility_id, order_type, order_status in order_rows
+                       if order_status == Order.STATUS_CONFIRMED and order_type != Order.TYPE_ENTRY_FEE]
+    if valid_order_ids:
+        for order_id, start_time, duration_hours in OrderSlot.objects.filter(
+            Q(date=today) | Q(weekday=today.weekday()), order_id__in=valid_order_ids, start_time__isnull=False
+        ).order_by('start_time').values_list('order_id', 'start_time', 'duration_hours'):
+            time_ranges_by_order[order_id].append(OrderSlot.format_time_range(start_time, duration_hours))
+
+    valid_entries, revoked_codes = [], []
+    for order_id, order_code, facility_id, order_type, order_status in order_rows:
+        if order_status == Order.STATUS_CONFIRMED:
+            valid_entries.append([order_code, facility_id, order_type, time_ranges_by_order.get(order_id, [])])
+        else:
+            revoked_codes.append(order_code)
+
+    return {
+        'version': MANIFEST_VERSION,
+        'university_id': university_id,
+        'date': today.isoformat(),
+        'generated_at': now.isoformat(),
+        'full': not is_delta,
+        'valid': valid_entries,
+        'revoked': revoked_codes,
+    }
+
+
+def serialize_signed_manifest(manifest: dict) -> dict:
+    payload = json.dumps(manifest, ensure_ascii=False, separators=(',', ':'), sort_keys=True)
+    return {'payload': payload, 'signature': sign_manifest_payload(payload, manifest['university_id']), 'algorithm': 'HMAC-SHA256'}
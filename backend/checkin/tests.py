@@ -0,0 +1,267 @@
+import io
+import json
+from datetime import time, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import Group
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+
+from core.models import User
+from universities.models import University
+from facilities.models import Facility
+from bookings.models import Order
+from .manifest import sign_manifest_payload
+
+
+class QRCheckinLookupTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff_user = User.objects.create_user(email='scanner@example.com', password='password', username='scanner', is_staff=True)
+        cls.customer = User.objects.create_user(email='visitor@example.com', password='password', username='visitor')
+        university = University.objects.create(name="Checkin University", city="Checkin City")
+        cls.facility = Facility.objects.create(
+            name="Checkin Pool", university=university, facility_type=Facility.TYPE_SWIMMING,
+            price_per_hour=20000, open_time=time(7, 0), close_time=time(21, 0),
+            working_days="0,1,2,3,4,5,6", booking_type=Facility.BOOKING_TYPE_ENTRY,
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.staff_user)
+
+    def _create_order(self, **kwargs):
+        return Order.objects.create(
+            user=self.customer, facility=self.facility, order_type=Order.TYPE_ENTRY_FEE,
+            status=Order.STATUS_CONFIRMED, total_price=Decimal(20000), booking_date=timezone.localdate(), **kwargs
+        )
+
+    def test_order_code_is_stored_upper_case(self):
+        order = self._create_order(order_code=" e-261018-ab12cd ")
+        order.refresh_from_db()
+        self.assertEqual(order.order_code, "E-261018-AB12CD")
+
+    def test_lookup_is_case_insensitive_via_exact_match(self):
+        order = self._create_order()
+        url = reverse('checkin_api:qr_order_details', args=[order.order_code.lower()])
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['order_code'], order.order_code)
+        self.assertEqual(
+            self.client.get(reverse('checkin_api:qr_order_details', args=["E-000000-NOPE00"])).status_code,
+            status.HTTP_404_NOT_FOUND,
+        )
+
+
+class QRCheckinCompletionTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff_user = User.objects.create_user(email='gate@example.com', password='password', username='gate', is_staff=True)
+        cls.customer = User.objects.create_user(email='guest@example.com', password='password', username='guest')
+        cls.university = University.objects.create(name="Gate University", city="Gate City")
+        cls.facility = Facility.objects.create(
+            name="Gate Court", university=cls.university, facility_type=Facility.TYPE_TENNIS,
+            price_per_hour=20000, open_time=time(7, 0), close_time=time(21, 0),
+            working_days="0,1,2,3,4,5,6", booking_type=Facility.BOOKING_TYPE_OVERLAPPING, max_capacity=5,
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.staff_user)
+
+    def _create_order(self, order_type=Order.TYPE_SLOT_BOOKING, order_status=Order.STATUS_CONFIRMED):
+        extra = {'booking_date': timezone.localdate(), 'slots': [{"start_time": "18:00", "end_time": "19:00"}]}
+        if order_type == Order.TYPE_SUBSCRIPTION:
+            extra = {
+                'subscription_start_date': timezone.localdate(), 'subscription_end_date': timezone.localdate() + timedelta(days=30),
+                'days_of_week': "0,1,2,3,4,5,6", 'subscription_times': "18:00",
+            }
+        return Order.objects.create(
+            user=self.customer, facility=self.facility, order_type=order_type,
+            status=order_status, total_price=Decimal(20000), **extra
+        )
+
+    def _complete(self, order_code):
+        return self.client.post(reverse('checkin_api:qr_complete_order', args=[order_code]))
+
+    def test_completion_is_compare_and_set(self):
+        from bookings.models import DailyOrderStats
+        from facilities.models import SlotOccupancy
+        order = self._create_order()
+        self.assertTrue(SlotOccupancy.objects.filter(order=order).exists())
+
+        response = self._complete(order.order_code.lower())
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['status'], Order.STATUS_COMPLETED)
+        self.assertEqual(response.data['order_code'], order.order_code)
+        order.refresh_from_db()
+        self.assertEqual(order.status, Order.STATUS_COMPLETED)
+        self.assertFalse(SlotOccupancy.objects.filter(order=order).exists())
+        self.assertEqual(
+            dict(DailyOrderStats.objects.filter(facility=self.facility).values_list('status', 'order_count')),
+            {Order.STATUS_CONFIRMED: 0, Order.STATUS_COMPLETED: 1},
+        )
+
+        # Повторное сканирование не меняет заказ второй раз
+        repeat_response = self._complete(order.order_code)
+        self.assertEqual(repeat_response.status_code, status.HTTP_200_OK)
+        self.assertIn('message', repeat_response.data)
+        self.assertEqual(DailyOrderStats.objects.get(facility=self.facility, status=Order.STATUS_COMPLETED).order_count, 1)
+
+    def test_completion_rejects_other_types_and_statuses(self):
+        subscription = self._create_order(order_type=Order.TYPE_SUBSCRIPTION)
+        pending = self._create_order(order_status=Order.STATUS_PENDING_PAYMENT)
+        self.assertEqual(self._complete(subscription.order_code).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self._complete(pending.order_code).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self._complete("SB-000000-NOPE00").status_code, status.HTTP_404_NOT_FOUND)
+        subscription.refresh_from_db(); pending.refresh_from_db()
+        self.assertEqual((subscription.status, pending.status), (Order.STATUS_CONFIRMED, Order.STATUS_PENDING_PAYMENT))
+
+
+    def _complete_batch(self, order_codes):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('checkin_api:qr_complete_orders_batch'), {'order_codes': order_codes}, format='json')
+        return response, len(queries)
+
+    def test_batch_completion_is_set_based(self):
+        _response, queries_for_two = self._complete_batch([self._create_order().order_code, "SB-000000-NOPE01"])
+
+        eligible = [self._create_order() for _i in range(4)]
+        already_completed = self._create_order(order_status=Order.STATUS_COMPLETED)
+        pending = self._create_order(order_status=Order.STATUS_PENDING_PAYMENT)
+        subscription = self._create_order(order_type=Order.TYPE_SUBSCRIPTION)
+        order_codes = [order.order_code.lower() for order in eligible] + [
+            already_completed.order_code, pending.order_code, subscription.order_code, "SB-000000-NOPE00", eligible[0].order_code,
+        ]
+        response, queries_for_batch = self._complete_batch(order_codes)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(queries_for_batch, queries_for_two) # Число запросов не зависит от количества кодов
+        self.assertEqual(response.data['completed_count'], 4)
+        self.assertEqual([item['result'] for item in response.data['results']], [
+            'completed', 'completed', 'completed', 'completed',
+            'already_completed', 'invalid_status', 'invalid_type', 'not_found',
+        ])
+        self.assertEqual(Order.objects.filter(pk__in=[order.pk for order in eligible], status=Order.STATUS_COMPLETED).count(), 4)
+
+
+@override_settings(CHECKIN_MANIFEST_SIGNING_KEY='test-manifest-master-key')
+class CheckinManifestTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff_user = User.objects.create_user(email='manifest@example.com', password='password', username='manifest', is_staff=True)
+        cls.staff_user.groups.add(Group.objects.create(name='University Admins'))
+        cls.customer = User.objects.create_user(email='member@example.com', password='password', username='member')
+        cls.university = University.objects.create(name="Manifest University", city="Manifest City", administrator=cls.staff_user)
+        cls.other_university = University.objects.create(name="Other University", city="Other City")
+        cls.facility = Facility.objects.create(
+            name="Manifest Court", university=cls.university, facility_type=Facility.TYPE_TENNIS,
+            price_per_hour=20000, open_time=time(7, 0), close_time=time(23, 0),
+            working_days="0,1,2,3,4,5,6", booking_type=Facility.BOOKING_TYPE_OVERLAPPING, max_capacity=5,
+        )
+        cls.other_facility = Facility.objects.create(
+            name="Other Court", university=cls.other_university, facility_type=Facility.TYPE_TENNIS,
+            price_per_hour=20000, open_time=time(7, 0), close_time=time(23, 0),
+            working_days="0,1,2,3,4,5,6", booking_type=Facility.BOOKING_TYPE_OVERLAPPING, max_capacity=5,
+        )
+        cls.today = timezone.localdate()
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.staff_user)
+
+    def _create_order(self, facility=None, order_type=Order.TYPE_SLOT_BOOKING, order_status=Order.STATUS_CONFIRMED, **extra):
+        if order_type == Order.TYPE_SLOT_BOOKING:
+            extra.setdefault('booking_date', self.today)
+            extra.setdefault('slots', [{"start_time": "18:00", "end_time": "19:00"}])
+        return Order.objects.create(
+            user=self.customer, facility=facility or self.facility, order_type=order_type,
+            status=order_status, total_price=Decimal(20000), **extra
+        )
+
+    def _get_manifest(self, **params):
+        response = self.client.get(reverse('checkin_api:qr_manifest'), {'university_id': self.university.id, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['signature'], sign_manifest_payload(response.data['payload'], self.university.id))
+        return json.loads(response.data['payload'])
+
+    def test_full_manifest_lists_todays_valid_codes(self):
+        slot_order = self._create_order()
+        entry_order = self._create_order(order_type=Order.TYPE_ENTRY_FEE, booking_date=self.today)
+        subscription = self._create_order(
+            order_type=Order.TYPE_SUBSCRIPTION, subscription_start_date=self.today - timedelta(days=7),
+            subscription_end_date=self.today + timedelta(days=7), days_of_week=str(self.today.weekday()), subscription_times="07:00",
+        )
+        self._create_order(
+            order_type=Order.TYPE_SUBSCRIPTION, subscription_start_date=self.today - timedelta(days=7),
+            subscription_end_date=self.today + timedelta(days=7), days_of_week=str((self.today.weekday() + 1) % 7), subscription_times="07:00",
+        )
+        self._create_order(booking_date=self.today + timedelta(days=1))
+        self._create_order(order_status=Order.STATUS_PENDING_PAYMENT)
+        self._create_order(facility=self.other_facility)
+
+        manifest = self._get_manifest()
+        self.assertTrue(manifest['full'])
+        self.assertEqual(sorted(manifest['valid']), sorted([
+            [slot_order.order_code, self.facility.id, Order.TYPE_SLOT_BOOKING, ["18:00-19:00"]],
+            [entry_order.order_code, self.facility.id, Order.TYPE_ENTRY_FEE, []],
+            [subscription.order_code, self.facility.id, Order.TYPE_SUBSCRIPTION, ["07:00-08:00"]],
+        ]))
+
+    def test_delta_manifest_reports_changes_since_previous(self):
+        used_order = self._create_order()
+        untouched_order = self._create_order()
+        first_manifest = self._get_manifest()
+        self.assertEqual(len(first_manifest['valid']), 2)
+
+        response = self.client.post(
+            reverse('checkin_api:qr_complete_orders_batch'),
+            {'order_codes': [used_order.order_code.lower(), "SB-000000-NOPE00"]}, format='json'
+        )
+        self.assertEqual(response.data['results'], [
+            {'order_code': used_order.order_code, 'result': 'completed'},
+            {'order_code': "SB-000000-NOPE00", 'result': 'not_found'},
+        ])
+        new_order = self._create_order()
+
+        delta = self._get_manifest(since=first_manifest['generated_at'])
+        self.assertFalse(delta['full'])
+        self.assertEqual(delta['revoked'], [used_order.order_code])
+        self.assertEqual([entry[0] for entry in delta['valid']], [new_order.order_code])
+        self.assertNotIn(untouched_order.order_code, delta['revoked'])
+
+    def test_university_is_chosen_by_role(self):
+        self._create_order(facility=self.other_facility)
+        manifest_url = reverse('checkin_api:qr_manifest')
+        # Админ ВУЗа получает свой ВУЗ, даже если просит чужой
+        manifest = self._get_manifest(university_id=self.other_university.id)
+        self.assertEqual((manifest['university_id'], manifest['valid']), (self.university.id, []))
+
+        plain_staff = User.objects.create_user(email='scanner@example.com', password='password', username='scanner', is_staff=True)
+        self.client.force_authenticate(user=plain_staff)
+        response = self.client.get(manifest_url, {'university_id': self.other_university.id})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        superuser = User.objects.create_superuser(email='root@example.com', password='password', username='root')
+        self.client.force_authenticate(user=superuser)
+        self.assertEqual(self.client.get(manifest_url).status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(manifest_url, {'university_id': self.other_university.id})
+        self.assertEqual(response.data['signature'], sign_manifest_payload(response.data['payload'], self.other_university.id))
+        self.assertEqual(len(json.loads(response.data['payload'])['valid']), 1)
+
+    def test_signing_keys_are_per_university_and_required(self):
+        payload = self.client.get(reverse('checkin_api:qr_manifest')).data['payload']
+        self.assertNotEqual(sign_manifest_payload(payload, self.university.id), sign_manifest_payload(payload, self.other_university.id))
+        output = io.StringIO()
+        call_command('checkin_manifest_key', str(self.university.id), stdout=output)
+        self.assertEqual(len(output.getvalue().strip()), 64)
+        with override_settings(CHECKIN_MANIFEST_SIGNING_KEY=None):
+            response = self.client.get(reverse('checkin_api:qr_manifest'))
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
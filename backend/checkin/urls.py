@@ -1,11 +1,13 @@
 # --- START OF FULL FILE backend/checkin/urls.py ---
 from django.urls import path
-from .views import OrderDetailsByQRCodeView, CompleteOrderFromQRView
+from .views import OrderDetailsByQRCodeView, CompleteOrderFromQRView, CheckinManifestView, CompleteOrdersBatchView
 
 app_name = 'checkin_api'
 
 urlpatterns = [
     path('order-details/<str:order_code>/', OrderDetailsByQRCodeView.as_view(), name='qr_order_details'),
     path('complete-order/<str:order_code>/', CompleteOrderFromQRView.as_view(), name='qr_complete_order'),
+    path('manifest/', CheckinManifestView.as_view(), name='qr_manifest'),
+    path('complete-orders/', CompleteOrdersBatchView.as_view(), name='qr_complete_orders_batch'),
 ]
 # --- END OF FULL FILE ---
\ No newline at end of file
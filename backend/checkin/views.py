@@ -5,10 +5,17 @@ from rest_framework import status
 from django.shortcuts import get_object_or_404
 from django.utils.translation import gettext_lazy as _
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
 import logging
 
 from bookings.models import Order
+from bookings.order_utils import complete_order_by_code, complete_orders_by_codes
 from bookings.serializers import OrderSerializer # Используем существующий OrderSerializer
+from core.utils import get_admin_university_details
+from .manifest import build_checkin_manifest, serialize_signed_manifest
 from .permissions import IsStaffUserPermission 
 
 logger = logging.getLogger(__name__)
@@ -21,7 +28,7 @@ class OrderDetailsByQRCodeView(APIView):
         try:
             order = Order.objects.select_related(
                 'user', 'facility', 'facility__university', 'payment_transaction_link'
-            ).get(order_code__iexact=order_code)
+            ).get(order_code=Order.normalize_order_code(order_code)) # Коды хранятся в верхнем регистре — используется уникальный индекс
         except Order.DoesNotExist:
             logger.warning(f"[QRCheckin] Order with code '{order_code}' not found.")
             return Response({"error": _("Заказ с таким кодом не найден.")}, status=status.HTTP_404_NOT_FOUND)
@@ -30,40 +37,152 @@ class OrderDetailsByQRCodeView(APIView):
         logger.info(f"[QRCheckin] Successfully retrieved details for order {order.id}.")
         return Response(serializer.data)
 
+def _build_checkin_payload(order_id, order_code, order_type, order_status, booking_date, facility_id) -> dict:
+    """ Короткий ответ сканеру: без полного OrderSerializer и связанных объектов. """
+    return {
+        'id': order_id,
+        'order_code': order_code,
+        'order_type': order_type,
+        'order_type_display': str(dict(Order.ORDER_TYPE_CHOICES).get(order_type, order_type)),
+        'status': order_status,
+        'status_display': str(dict(Order.ORDER_STATUS_CHOICES).get(order_status, order_status)),
+        'booking_date': booking_date.isoformat() if booking_date else None,
+        'facility_id': facility_id,
+    }
+
 class CompleteOrderFromQRView(APIView):
     permission_classes = [IsStaffUserPermission]
 
     def post(self, request, order_code, format=None):
         logger.info(f"[QRCheckin] Staff user {request.user.email} attempting to complete order_code: {order_code}")
-        try:
-            order = Order.objects.get(order_code__iexact=order_code)
-        except Order.DoesNotExist:
+        # Основной путь — один атомарный UPDATE ... RETURNING (confirmed → completed)
+        order = complete_order_by_code(order_code)
+        if order is not None:
+            logger.info(f"[QRCheckin] Order {order.id} successfully completed by {request.user.email}.")
+            return Response(_build_checkin_payload(
+                order.id, order.order_code, order.order_type, order.status, order.booking_date, order.facility_id
+            ))
+
+        # Заказ не изменен — выясняем причину (редкий путь)
+        current_order = Order.objects.filter(order_code=Order.normalize_order_code(order_code)).values(
+            'id', 'order_code', 'order_type', 'status', 'booking_date', 'facility_id'
+        ).first()
+        if current_order is None:
             logger.warning(f"[QRCheckin] Order with code '{order_code}' not found for completion.")
             return Response({"error": _("Заказ с таким кодом не найден.")}, status=status.HTTP_404_NOT_FOUND)
 
-        if order.order_type not in [Order.TYPE_SLOT_BOOKING, Order.TYPE_ENTRY_FEE]:
-            logger.warning(f"[QRCheckin] Attempt to complete non-completable order type: {order.order_type} for order {order.id}.")
+        if current_order['order_type'] not in [Order.TYPE_SLOT_BOOKING, Order.TYPE_ENTRY_FEE]:
+            logger.warning(f"[QRCheckin] Attempt to complete non-completable order type: {current_order['order_type']} for order {current_order['id']}.")
             return Response(
-                {"error": _("Этот тип заказа ('{order_type}') не может быть завершен через сканер QR-кода таким образом.").format(order_type=order.get_order_type_display())},
+                {"error": _("Этот тип заказа ('{order_type}') не может быть завершен через сканер QR-кода таким образом.").format(order_type=dict(Order.ORDER_TYPE_CHOICES).get(current_order['order_type']))},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        if order.status == Order.STATUS_CONFIRMED:
-            order.status = Order.STATUS_COMPLETED
-            order.save(update_fields=['status', 'updated_at'])
-            serializer = OrderSerializer(order, context={'request': request})
-            logger.info(f"[QRCheckin] Order {order.id} successfully completed by {request.user.email}.")
-            return Response(serializer.data)
-        elif order.status == Order.STATUS_COMPLETED:
-            logger.info(f"[QRCheckin] Order {order.id} was already completed.")
+        if current_order['status'] == Order.STATUS_COMPLETED:
+            logger.info(f"[QRCheckin] Order {current_order['id']} was already completed.")
             return Response(
-                {"message": _("Заказ уже был отмечен как использованный."), "order": OrderSerializer(order, context={'request': request}).data},
+                {"message": _("Заказ уже был отмечен как использованный."), "order": _build_checkin_payload(
+                    current_order['id'], current_order['order_code'], current_order['order_type'],
+                    current_order['status'], current_order['booking_date'], current_order['facility_id']
+                )},
                 status=status.HTTP_200_OK
             )
-        else:
-            logger.warning(f"[QRCheckin] Attempt to complete order {order.id} with invalid status: {order.status}.")
-            return Response(
-                {"error": _("Заказ не может быть отмечен как использованный. Текущий статус: {status}.").format(status=order.get_status_display())},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+        logger.warning(f"[QRCheckin] Attempt to complete order {current_order['id']} with invalid status: {current_order['status']}.")
+        return Response(
+            {"error": _("Заказ не может быть отмечен как использованный. Текущий статус: {status}.").format(status=dict(Order.ORDER_STATUS_CHOICES).get(current_order['status']))},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+class CheckinManifestView(APIView):
+    """
+    Подписанный манифест действующих сегодня кодов для офлайн-проверки на сканере.
+    GET ?university_id=<id>&since=<generated_at предыдущего манифеста>
+    Админ ВУЗа всегда получает манифест своего ВУЗа, university_id выбирает только суперюзер;
+    остальному персоналу — 403. Подпись — HMAC ключом ВУЗа (см. checkin.manifest): сканер с этим
+    ключом может подделать манифест своего ВУЗа, поэтому ключ выдается только доверенным устройствам.
+    """
+    permission_classes = [IsStaffUserPermission]
+
+    def get(self, request, format=None):
+        admin_university_obj = get_admin_university_details(request.user)
+        if admin_university_obj == -1:
+            return Response({"error": _("Манифест доступен только администратору ВУЗа.")}, status=status.HTTP_403_FORBIDDEN)
+        if admin_university_obj is not None:
+            university_id = admin_university_obj.id
+        else: # Суперюзер
+            try:
+                university_id = int(request.query_params.get('university_id', ''))
+            except ValueError:
+                return Response({"error": _("Укажите university_id.")}, status=status.HTTP_400_BAD_REQUEST)
+
+        since = None
+        since_str = request.query_params.get('since')
+        if since_str:
+            since = parse_datetime(since_str)
+            if since is None or timezone.is_naive(since):
+                return Response({"error": _("Параметр since должен быть значением generated_at предыдущего манифеста.")}, status=status.HTTP_400_BAD_REQUEST)
+
+        manifest = build_checkin_manifest(university_id, since=since)
+        try:
+            signed_manifest = serialize_signed_manifest(manifest)
+        except ImproperlyConfigured as e:
+            logger.error(f"[QRCheckin] Manifest signing is not configured: {e}")
+            return Response({"error": _("Офлайн-манифест не настроен на сервере.")}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        logger.info(
+            f"[QRCheckin] Manifest for university {university_id} served to {request.user.email}: "
+            f"full={manifest['full']}, valid={len(manifest['valid'])}, revoked={len(manifest['revoked'])}."
+        )
+        return Response(signed_manifest)
+
+class CompleteOrdersBatchView(APIView):
+    """
+    Пакетная отметка (загрузка очереди сканера/турникета): POST {"order_codes": ["SB-...", ...]}.
+    Подходящие заказы завершаются одним UPDATE, для каждого кода возвращается результат:
+    completed / already_completed / invalid_status / invalid_type / not_found.
+    """
+    permission_classes = [IsStaffUserPermission]
+
+    RESULT_COMPLETED = 'completed'
+    RESULT_ALREADY_COMPLETED = 'already_completed'
+    RESULT_INVALID_STATUS = 'invalid_status'
+    RESULT_INVALID_TYPE = 'invalid_type'
+    RESULT_NOT_FOUND = 'not_found'
+
+    def post(self, request, format=None):
+        order_codes = request.data.get('order_codes')
+        max_codes = getattr(settings, 'CHECKIN_BATCH_MAX_CODES', 500)
+        if not isinstance(order_codes, list) or not all(isinstance(code, str) for code in order_codes):
+            return Response({"error": _("order_codes должен быть списком строк.")}, status=status.HTTP_400_BAD_REQUEST)
+        if len(order_codes) > max_codes:
+            return Response({"error": _("Не более {max_codes} кодов за запрос.").format(max_codes=max_codes)}, status=status.HTTP_400_BAD_REQUEST)
+
+        normalized_codes = list(dict.fromkeys(Order.normalize_order_code(code) for code in order_codes if code.strip()))
+        with transaction.atomic():
+            # Все подходящие заказы завершаются одним UPDATE ... WHERE order_code IN (...)
+            completed_codes = {order.order_code for order in complete_orders_by_codes(normalized_codes)}
+            unresolved_codes = [code for code in normalized_codes if code not in completed_codes]
+            # Причину для остальных кодов выясняем одним запросом
+            current_orders = {
+                order_code: (order_type, order_status)
+                for order_code, order_type, order_status in Order.objects.filter(
+                    order_code__in=unresolved_codes
+                ).values_list('order_code', 'order_type', 'status')
+            } if unresolved_codes else {}
+        results = {code: self.RESULT_COMPLETED for code in completed_codes}
+        for order_code in unresolved_codes:
+            results[order_code] = self._describe_failure(current_orders.get(order_code))
+
+        completed_count = sum(1 for result in results.values() if result == self.RESULT_COMPLETED)
+        logger.info(f"[QRCheckin] Batch of {len(normalized_codes)} codes from {request.user.email}: {completed_count} completed.")
+        return Response({
+            'completed_count': completed_count,
+            'results': [{'order_code': code, 'result': results[code]} for code in normalized_codes],
+        })
+
+    def _describe_failure(self, current_order) -> str:
+        if current_order is None: return self.RESULT_NOT_FOUND
+        order_type, order_status = current_order
+        if order_type not in [Order.TYPE_SLOT_BOOKING, Order.TYPE_ENTRY_FEE]: return self.RESULT_INVALID_TYPE
+        if order_status == Order.STATUS_COMPLETED: return self.RESULT_ALREADY_COMPLETED
+        return self.RESULT_INVALID_STATUS
 # --- END OF FULL FILE ---
\ No newline at end of file
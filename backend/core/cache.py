@@ -0,0 +1,136 @@
+# core/cache.py
+"""
+Кэш ответов публичного каталога (объекты, университеты, удобства).
+
+Ключ строится из пространства имен, его текущей версии, языка (i18n-префикс URL),
+хоста, пути и отсортированных query-параметров. Инвалидация — увеличение версии
+пространства имен (старые записи просто перестают читаться и истекают по TTL),
+поэтому работает одинаково для LocMem/файлового кэша и Redis.
+"""
+import hashlib
+import logging
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import translation
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+CATALOG_FACILITIES = 'facilities'
+CATALOG_UNIVERSITIES = 'universities'
+CATALOG_AMENITIES = 'amenities'
+CATALOG_NAMESPACES = (CATALOG_FACILITIES, CATALOG_UNIVERSITIES, CATALOG_AMENITIES)
+
+
+def _version_key(namespace: str) -> str:
+    return f"catalog:{namespace}:version"
+
+
+def _stats_key(namespace: str, outcome: str) -> str:
+    return f"catalog:stats:{namespace}:{outcome}"
+
+
+def _incr(key: str) -> None:
+    """ Атомарный счетчик без срока жизни (cache.incr падает, если ключа нет). """
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def get_catalog_version(namespace: str) -> int:
+    version = cache.get(_version_key(namespace))
+    if version is None:
+        cache.add(_version_key(namespace), 1, timeout=None)
+        version = cache.get(_version_key(namespace)) or 1
+    return version
+
+
+def invalidate_catalog_cache(*namespaces: str) -> None:
+    """
+    Делает недействительными все закэшированные ответы указанных пространств имен.
+    Версия увеличивается после коммита транзакции (вне транзакции — сразу): иначе параллельный
+    запрос успеет закэшировать под новой версией еще не закоммиченные (старые) данные.
+    """
+    def _bump_versions():
+        for namespace in namespaces:
+            try:
+                _incr(_version_key(namespace))
+            except Exception as e:
+                # Ошибка кэша не должна ломать сохранение модели
+                logger.error(f"Catalog cache invalidation failed for '{namespace}': {e}", exc_info=True)
+
+    transaction.on_commit(_bump_versions)
+
+
+def _record_outcome(namespace: str, outcome: str) -> None:
+    """ Счетчик статистики; ошибка кэша не должна превращать ответ в 500. """
+    try:
+        _incr(_stats_key(namespace, outcome))
+    except Exception as e:
+        logger.error(f"Catalog cache stats update failed for '{namespace}': {e}", exc_info=True)
+
+
+def build_catalog_cache_key(namespace: str, request) -> str:
+    query_string = urlencode(sorted(request.query_params.lists()), doseq=True)
+    raw_key = f"{translation.get_language()}|{request.get_host()}|{request.path}|{query_string}"
+    digest = hashlib.md5(raw_key.encode('utf-8')).hexdigest()
+    return f"catalog:{namespace}:v{get_catalog_version(namespace)}:{digest}"
+
+
+def get_catalog_cache_stats() -> dict:
+    """ Счетчики попаданий/промахов по пространствам имен. """
+    stats = {}
+    for namespace in CATALOG_NAMESPACES:
+        hits = cache.get(_stats_key(namespace, 'hits')) or 0
+        misses = cache.get(_stats_key(namespace, 'misses')) or 0
+        stats[namespace] = {
+            'hits': hits, 'misses': misses,
+            'hit_ratio': round(hits / (hits + misses), 4) if hits + misses else None,
+            'version': get_catalog_version(namespace),
+        }
+    return stats
+
+
+class CatalogCacheMixin:
+    """
+    Миксин для ReadOnlyModelViewSet: кэширует сериализованные ответы list/retrieve.
+    Ответ содержит заголовок X-Cache: HIT/MISS.
+    """
+    cache_namespace = None
+    cache_timeout = None # None — settings.CATALOG_CACHE_TIMEOUT
+
+    def list(self, request, *args, **kwargs):
+        return self._get_cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._get_cached_response(super().retrieve, request, *args, **kwargs)
+
+    def _get_cached_response(self, handler, request, *args, **kwargs):
+        try:
+            cache_key = build_catalog_cache_key(self.cache_namespace, request)
+            cached_data = cache.get(cache_key)
+        except Exception as e:
+            logger.error(f"Catalog cache read failed for '{self.cache_namespace}': {e}", exc_info=True)
+            return handler(request, *args, **kwargs)
+
+        if cached_data is not None:
+            _record_outcome(self.cache_namespace, 'hits')
+            response = Response(cached_data)
+            response['X-Cache'] = 'HIT'
+            return response
+
+        _record_outcome(self.cache_namespace, 'misses')
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            timeout = self.cache_timeout if self.cache_timeout is not None else getattr(settings, 'CATALOG_CACHE_TIMEOUT', 600)
+            try:
+                cache.set(cache_key, response.data, timeout=timeout)
+            except Exception as e:
+                logger.error(f"Catalog cache write failed for '{self.cache_namespace}': {e}", exc_info=True)
+        response['X-Cache'] = 'MISS'
+        return response
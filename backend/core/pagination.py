@@ -0,0 +1,178 @@
+# core/pagination.py
+"""
+Пагинация списков: номера страниц (как раньше) или keyset-курсор.
+
+Курсорный режим включается параметром ?cursor= (для первой страницы — пустым). Страница выбирается
+условием по всем колонкам сортировки сразу — (name > 'последнее') OR (name = 'последнее' AND id > последний id)
+ORDER BY name, id LIMIT N — а не OFFSET, поэтому глубокие страницы стоят столько же, сколько первая,
+и не требуют COUNT(*). Курсор хранит значения всех колонок крайней строки страницы, так что повторы
+первой колонки (одинаковые названия) не смещают страницы, в отличие от CursorPagination DRF.
+Ответ в этом режиме — {next, previous, results} без count; next/previous содержат готовый cursor.
+
+Колонки курсора: сортировка OrderingFilter представления (view.ordering или ?ordering=),
+а без него — cursor_ordering класса пагинации; первичный ключ всегда добавляется в конец как
+уникальный хвост. Переводимые поля (modeltranslation) берутся в колонке текущего языка, как в
+filter()/order_by(); NULL в nullable-колонках идут в конце. Под сортировку по умолчанию заведены
+составные индексы.
+"""
+import base64
+import binascii
+import json
+from datetime import date, datetime, time
+from decimal import Decimal
+from uuid import UUID
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import F, Q
+from django.utils.translation import gettext_lazy as _
+from modeltranslation.manager import rewrite_lookup_key
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def _encode_cursor_value(value):
+    if isinstance(value, (datetime, date, time)): return value.isoformat()
+    if isinstance(value, (Decimal, UUID)): return str(value)
+    return value # Обратно строки приводит to_python поля (_parse_cursor_value)
+
+
+class CursorOrPageNumberPagination(PageNumberPagination):
+    cursor_query_param = 'cursor'
+    cursor_ordering = ('-created_at', '-id') # Ключ курсора, если у представления нет OrderingFilter
+    invalid_cursor_message = _('Invalid cursor')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        # Экземпляр пагинатора создается на каждый запрос (GenericAPIView.paginator), состояние можно хранить
+        self.is_keyset_mode = self.cursor_query_param in request.query_params
+        if not self.is_keyset_mode:
+            return super().paginate_queryset(queryset, request, view)
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        self.request = request
+        self.keyset = self._get_keyset(queryset, request, view)
+        position, is_reverse = self._decode_cursor(request, queryset.model)
+        queryset = queryset.order_by(*self._get_order_expressions(is_reverse))
+        if position is not None:
+            queryset = queryset.filter(self._get_after_position_q(position, is_reverse))
+
+        rows = list(queryset[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if is_reverse: # Страница «назад» выбирается в обратном порядке и разворачивается
+            rows.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        self.page_rows = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        if not getattr(self, 'is_keyset_mode', False):
+            return super().get_paginated_response(data)
+        return Response({'next': self.get_next_link(), 'previous': self.get_previous_link(), 'results': data})
+
+    def get_next_link(self):
+        if not getattr(self, 'is_keyset_mode', False):
+            return super().get_next_link()
+        if not (self.has_next and self.page_rows): return None
+        return self._build_cursor_link(self.page_rows[-1], is_reverse=False)
+
+    def get_previous_link(self):
+        if not getattr(self, 'is_keyset_mode', False):
+            return super().get_previous_link()
+        if not (self.has_previous and self.page_rows): return None
+        return self._build_cursor_link(self.page_rows[0], is_reverse=True)
+
+    def _get_keyset(self, queryset, request, view) -> list:
+        """ [(колонка, по убыванию, nullable)] — сортировка курсора с первичным ключом в конце. """
+        ordering = None
+        for backend in getattr(view, 'filter_backends', None) or []:
+            if issubclass(backend, OrderingFilter):
+                ordering = backend().get_ordering(request, queryset, view)
+                break
+        model = queryset.model
+        pk_name = model._meta.pk.name
+        keyset = []
+        for field_name in ordering or self.cursor_ordering:
+            is_descending = field_name.startswith('-')
+            field_name = field_name.lstrip('-')
+            column = pk_name if field_name == 'pk' else rewrite_lookup_key(model, field_name)
+            try:
+                is_nullable = model._meta.get_field(column).null
+            except FieldDoesNotExist:
+                is_nullable = True
+            keyset.append((column, is_descending, is_nullable))
+        if pk_name not in [column for column, _is_descending, _is_nullable in keyset]:
+            keyset.append((pk_name, keyset[-1][1] if keyset else False, False))
+        return keyset
+
+    def _get_order_expressions(self, is_reverse: bool) -> list:
+        expressions = []
+        for column, is_descending, is_nullable in self.keyset:
+            is_descending = is_descending != is_reverse
+            if not is_nullable:
+                expressions.append(F(column).desc() if is_descending else F(column).asc())
+            else: # NULL — в конце прямого порядка (значит, в начале обратного)
+                null_placement = {'nulls_first': True} if is_reverse else {'nulls_last': True}
+                expressions.append(F(column).desc(**null_placement) if is_descending else F(column).asc(**null_placement))
+        return expressions
+
+    def _get_after_position_q(self, position: list, is_reverse: bool) -> Q:
+        """ Строки строго после position в порядке _get_order_expressions(is_reverse). """
+        after_q, equal_q = Q(pk__in=[]), Q()
+        for (column, is_descending, is_nullable), value in zip(self.keyset, position):
+            lookup = 'lt' if is_descending != is_reverse else 'gt'
+            if value is None: # NULL последние в прямом порядке: после NULL идут только другие NULL (по следующим колонкам)
+                column_after_q = Q(**{f'{column}__isnull': False}) if is_reverse else None
+                column_equal_q = Q(**{f'{column}__isnull': True})
+            else:
+                column_after_q = Q(**{f'{column}__{lookup}': value})
+                if is_nullable and not is_reverse: column_after_q |= Q(**{f'{column}__isnull': True})
+                column_equal_q = Q(**{column: value})
+            if column_after_q is not None: after_q |= equal_q & column_after_q
+            equal_q &= column_equal_q
+        return after_q
+
+    def _build_cursor_link(self, row, is_reverse: bool) -> str:
+        position = [_encode_cursor_value(getattr(row, column)) for column, _is_descending, _is_nullable in self.keyset]
+        cursor_data = {'p': position, 'r': is_reverse}
+        cursor = base64.urlsafe_b64encode(json.dumps(cursor_data, separators=(',', ':')).encode('utf-8')).decode('ascii')
+        url = remove_query_param(self.request.build_absolute_uri(), self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def _decode_cursor(self, request, model):
+        """
+        (значения колонок крайней строки или None для первой страницы, направление «назад»).
+        Значения приводятся полями модели (to_python): подделанный курсор — 404, а не ошибка в ORM.
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            cursor_data = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            position, is_reverse = cursor_data['p'], bool(cursor_data.get('r'))
+        except (TypeError, ValueError, KeyError, UnicodeError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.keyset):
+            raise NotFound(self.invalid_cursor_message)
+        return [self._parse_cursor_value(model, column, is_nullable, value) for (column, _is_descending, is_nullable), value in zip(self.keyset, position)], is_reverse
+
+    def _parse_cursor_value(self, model, column: str, is_nullable: bool, value):
+        if value is None:
+            if is_nullable: return None
+            raise NotFound(self.invalid_cursor_message)
+        if isinstance(value, (list, dict)):
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            field = model._meta.get_field(column)
+        except FieldDoesNotExist:
+            return value
+        try:
+            return field.to_python(value)
+        except (ValidationError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
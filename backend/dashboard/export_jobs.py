@@ -0,0 +1,101 @@
+# dashboard/export_jobs.py
+"""
+Очередь фоновых выгрузок заказов (ExportJob) в БД.
+
+Веб-запрос только создает задачу; воркер (manage.py run_export_jobs) забирает ее через
+SELECT ... FOR UPDATE SKIP LOCKED, пишет файл потоково (dashboard.exports) и обновляет прогресс.
+"""
+import logging
+import tempfile
+from datetime import timedelta
+from typing import Optional
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone, translation
+
+from bookings.models import Order
+from .exports import EXPORT_CHUNK_SIZE, iter_order_export_rows, iter_orders_csv, write_orders_xlsx
+from .models import ExportJob
+
+logger = logging.getLogger(__name__)
+
+
+def claim_next_export_job() -> Optional[ExportJob]:
+    """ Забирает самую старую задачу из очереди; параллельные воркеры получают разные задачи. """
+    with transaction.atomic():
+        job = ExportJob.objects.select_for_update(skip_locked=True).filter(
+            status=ExportJob.STATUS_PENDING
+        ).order_by('created_at').first()
+        if job is None:
+            return None
+        job.status = ExportJob.STATUS_RUNNING
+        job.started_at = timezone.now()
+        job.save(update_fields=['status', 'started_at'])
+    return job
+
+
+def _iter_with_progress(rows, job: ExportJob, step: int):
+    processed_rows = 0
+    for row in rows:
+        yield row
+        processed_rows += 1
+        if processed_rows % step == 0:
+            ExportJob.objects.filter(pk=job.pk).update(processed_rows=processed_rows)
+    job.processed_rows = processed_rows
+
+
+def get_export_filename(job: ExportJob) -> str:
+    filename_suffix = (job.university.short_name or str(job.university.id)) if job.university else "global"
+    filename_date_part = timezone.localtime(job.created_at).strftime('%Y%m%d_%H%M')
+    return f"unisport_orders_{filename_suffix}_{filename_date_part}.{job.export_format}"
+
+
+def run_export_job(job: ExportJob) -> ExportJob:
+    """ Выполняет взятую задачу: пишет файл во временный файл, затем сохраняет его в закрытое хранилище (EXPORT_FILES_ROOT). """
+    queryset = Order.objects.all()
+    if job.university_id:
+        queryset = queryset.filter(facility__university_id=job.university_id)
+    try:
+        job.total_rows = queryset.count()
+        job.save(update_fields=['total_rows'])
+        with translation.override(job.language), tempfile.TemporaryFile() as export_file:
+            rows = _iter_with_progress(iter_order_export_rows(queryset), job, step=EXPORT_CHUNK_SIZE)
+            if job.export_format == ExportJob.FORMAT_CSV:
+                for csv_chunk in iter_orders_csv(rows):
+                    export_file.write(csv_chunk.encode('utf-8'))
+            else:
+                write_orders_xlsx(rows, export_file)
+            export_file.seek(0)
+            job.file.save(get_export_filename(job), File(export_file), save=False)
+        job.status = ExportJob.STATUS_DONE
+    except Exception as e:
+        logger.error(f"Export job {job.pk} failed: {e}", exc_info=True)
+        job.status = ExportJob.STATUS_FAILED
+        job.error_message = str(e)
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'processed_rows', 'file', 'error_message', 'finished_at'])
+    return job
+
+
+def cleanup_export_jobs(now=None) -> int:
+    """
+    Удаляет завершенные задачи старше EXPORT_JOB_RETENTION_HOURS вместе с файлами и помечает
+    ошибкой задачи, зависшие в 'running' дольше EXPORT_JOB_STALE_MINUTES (воркер упал).
+    Возвращает количество удаленных задач.
+    """
+    now = now or timezone.now()
+    stale_cutoff = now - timedelta(minutes=getattr(settings, 'EXPORT_JOB_STALE_MINUTES', 60))
+    ExportJob.objects.filter(status=ExportJob.STATUS_RUNNING, started_at__lt=stale_cutoff).update(
+        status=ExportJob.STATUS_FAILED, error_message="Worker stopped before the export finished.", finished_at=now
+    )
+    retention_cutoff = now - timedelta(hours=getattr(settings, 'EXPORT_JOB_RETENTION_HOURS', 24))
+    deleted_count = 0
+    for job in ExportJob.objects.filter(
+        status__in=[ExportJob.STATUS_DONE, ExportJob.STATUS_FAILED], finished_at__lt=retention_cutoff
+    ).iterator():
+        if job.file: job.file.delete(save=False)
+        job.delete()
+        deleted_count += 1
+    return deleted_count
@@ -0,0 +1,160 @@
+# dashboard/exports.py
+"""
+Потоковая выгрузка заказов (XLSX/CSV) с постоянным расходом памяти.
+
+Заказы читаются через values().iterator(chunk_size=...), слоты подгружаются одним запросом
+на пачку, каждая строка форматируется один раз и сразу пишется в файл/поток.
+XLSX строится write-only книгой openpyxl (строки сбрасываются на диск по мере записи).
+"""
+import csv
+from collections import defaultdict
+from decimal import Decimal
+from itertools import islice
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.translation import gettext
+from modeltranslation.utils import build_localized_fieldname, get_language as get_translation_language
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, Alignment, Border, Side, PatternFill
+from openpyxl.utils import get_column_letter
+
+from bookings.models import Order, OrderSlot
+
+EXPORT_CHUNK_SIZE = getattr(settings, 'ORDER_EXPORT_CHUNK_SIZE', 2000)
+# Ширина колонок XLSX (в порядке get_order_export_columns)
+EXPORT_COLUMN_WIDTHS = (20, 25, 30, 30, 20, 20, 18, 20, 35, 15, 18)
+AMOUNT_COLUMN_INDEX = 9
+CREATED_AT_COLUMN_INDEX = 10
+
+
+def get_order_export_columns() -> list:
+    return [
+        gettext("Код Заказа"), gettext("Пользователь (Имя)"), gettext("Пользователь (Email)"),
+        gettext("Объект"), gettext("Университет"), gettext("Тип Заказа"), gettext("Статус"),
+        gettext("Дата/Период"), gettext("Детали (Слоты/Время)"),
+        gettext("Сумма (сум)"), gettext("Дата Создания")
+    ]
+
+
+def _localized_lookup(lookup: str, language: str) -> str:
+    # facility__name -> facility__name_ru (переводимые поля modeltranslation)
+    prefix, _sep, field_name = lookup.rpartition('__')
+    return f"{prefix}__{build_localized_fieldname(field_name, language)}"
+
+
+def _format_order_dates(row: dict) -> str:
+    if row['order_type'] in (Order.TYPE_ENTRY_FEE, Order.TYPE_SLOT_BOOKING):
+        return row['booking_date'].strftime('%d.%m.%Y') if row['booking_date'] else '-'
+    if row['order_type'] == Order.TYPE_SUBSCRIPTION:
+        start = row['subscription_start_date'].strftime('%d.%m.%Y') if row['subscription_start_date'] else '?'
+        end = row['subscription_end_date'].strftime('%d.%m.%Y') if row['subscription_end_date'] else '?'
+        return f"{start} - {end}"
+    return "-"
+
+
+def iter_order_export_rows(queryset, chunk_size: int = EXPORT_CHUNK_SIZE):
+    """
+    Отдает строки выгрузки (списки значений в порядке get_order_export_columns) для заказов queryset.
+    В памяти одновременно находится не больше одной пачки из chunk_size заказов.
+    """
+    language = get_translation_language()
+    translated_lookups = ('facility__name', 'facility__university__short_name', 'facility__university__name')
+    localized_lookups = {lookup: _localized_lookup(lookup, language) for lookup in translated_lookups}
+    type_labels = {key: str(label) for key, label in Order.ORDER_TYPE_CHOICES}
+    status_labels = {key: str(label) for key, label in Order.ORDER_STATUS_CHOICES}
+
+    rows_iterator = queryset.order_by('-created_at', '-pk').values(
+        'id', 'order_code', 'user__first_name', 'user__last_name', 'user__email',
+        *translated_lookups, *localized_lookups.values(),
+        'order_type', 'status', 'booking_date', 'subscription_start_date', 'subscription_end_date',
+        'total_price', 'created_at',
+    ).iterator(chunk_size=chunk_size)
+
+    while True:
+        chunk = list(islice(rows_iterator, chunk_size))
+        if not chunk: break
+        slots_by_order = defaultdict(list)
+        slot_order_ids = [row['id'] for row in chunk if row['order_type'] in (Order.TYPE_SLOT_BOOKING, Order.TYPE_SUBSCRIPTION)]
+        if slot_order_ids:
+            for order_id, weekday, start_time, duration_hours in OrderSlot.objects.filter(
+                order_id__in=slot_order_ids, start_time__isnull=False
+            ).values_list('order_id', 'weekday', 'start_time', 'duration_hours'):
+                slots_by_order[order_id].append((weekday, start_time, duration_hours))
+
+        for row in chunk:
+            localized = {lookup: row[localized_lookups[lookup]] or row[lookup] for lookup in translated_lookups}
+            user_name = f"{row['user__first_name'] or ''} {row['user__last_name'] or ''}".strip()
+            order_specifics = "-"
+            if row['order_type'] in (Order.TYPE_SLOT_BOOKING, Order.TYPE_SUBSCRIPTION):
+                order_specifics = Order.format_order_slots_display(row['order_type'], slots_by_order.get(row['id'], ()))
+            created_at_naive = None
+            if row['created_at']:
+                created_at_naive = timezone.localtime(row['created_at']).replace(tzinfo=None) # openpyxl не принимает aware datetime
+            yield [
+                row['order_code'], user_name or "-", row['user__email'] or "-",
+                localized['facility__name'] or "-",
+                localized['facility__university__short_name'] or localized['facility__university__name'] or "-",
+                type_labels.get(row['order_type'], row['order_type']), status_labels.get(row['status'], row['status']),
+                _format_order_dates(row), order_specifics,
+                row['total_price'], created_at_naive,
+            ]
+
+
+def write_orders_xlsx(rows, file_obj) -> int:
+    """
+    Пишет строки в XLSX (write-only книга) в file_obj. Стили задаются при создании ячейки,
+    второго прохода по листу нет. Возвращает количество строк данных.
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(gettext("Заказы"))
+    for column_index, width in enumerate(EXPORT_COLUMN_WIDTHS, 1):
+        ws.column_dimensions[get_column_letter(column_index)].width = width
+
+    thin_border = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'), bottom=Side(style='thin'))
+    header_font = Font(bold=True, color="FFFFFF")
+    header_fill = PatternFill(start_color="4F81BD", end_color="4F81BD", fill_type="solid")
+    header_alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
+    right_alignment = Alignment(horizontal='right')
+    amount_format = '#,##0" {}"'.format(gettext('сум'))
+
+    header_cells = []
+    for title in get_order_export_columns():
+        cell = WriteOnlyCell(ws, value=title)
+        cell.font = header_font; cell.fill = header_fill; cell.alignment = header_alignment; cell.border = thin_border
+        header_cells.append(cell)
+    ws.append(header_cells)
+
+    rows_written = 0
+    for row in rows:
+        cells = []
+        for column_index, value in enumerate(row):
+            cell = WriteOnlyCell(ws, value=value)
+            cell.border = thin_border
+            if isinstance(value, (int, float, Decimal)):
+                cell.alignment = right_alignment
+                if column_index == AMOUNT_COLUMN_INDEX: cell.number_format = amount_format
+            elif column_index == CREATED_AT_COLUMN_INDEX and value is not None:
+                cell.number_format = 'DD.MM.YYYY HH:MM'
+            cells.append(cell)
+        ws.append(cells)
+        rows_written += 1
+    wb.save(file_obj)
+    return rows_written
+
+
+class _EchoBuffer:
+    """ Псевдо-файл для csv.writer: write() возвращает строку вместо записи. """
+    def write(self, value):
+        return value
+
+
+def iter_orders_csv(rows):
+    """ Генератор CSV для StreamingHttpResponse (с BOM, чтобы Excel распознал UTF-8). """
+    writer = csv.writer(_EchoBuffer())
+    yield '\ufeff' + writer.writerow(get_order_export_columns())
+    for row in rows:
+        created_at = row[CREATED_AT_COLUMN_INDEX]
+        row[CREATED_AT_COLUMN_INDEX] = created_at.strftime('%d.%m.%Y %H:%M') if created_at else ''
+        yield writer.writerow(row)
@@ -0,0 +1,42 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from dashboard.export_jobs import claim_next_export_job, run_export_job, cleanup_export_jobs
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Выполняет фоновые выгрузки заказов из очереди ExportJob."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help="Работать постоянно, проверяя очередь каждые --interval секунд.")
+        parser.add_argument(
+            '--interval', type=int, default=getattr(settings, 'EXPORT_JOB_POLL_INTERVAL_SECONDS', 5),
+            help="Пауза между проверками пустой очереди в режиме --loop (секунды)."
+        )
+
+    def handle(self, *args, **options):
+        interval = max(1, options['interval'])
+        while True:
+            try:
+                cleanup_export_jobs()
+                job = claim_next_export_job()
+                while job is not None:
+                    run_export_job(job)
+                    self.stdout.write(f"Выгрузка #{job.pk}: {job.status}")
+                    job = claim_next_export_job()
+            except Exception as e:
+                if not options['loop']: raise
+                logger.error(f"run_export_jobs pass failed: {e}", exc_info=True)
+            if not options['loop']:
+                break
+            close_old_connections() # Долгоживущий процесс не должен держать устаревшее соединение
+            try:
+                time.sleep(interval)
+            except KeyboardInterrupt:
+                break
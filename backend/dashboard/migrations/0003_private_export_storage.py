@@ -0,0 +1,38 @@
+# Generated by Django 5.2 on 2026-10-18 11:37
+
+import os
+import secrets
+import shutil
+
+import dashboard.models
+from django.conf import settings
+from django.db import migrations, models
+
+
+def move_existing_exports(apps, schema_editor):
+    """ Уже готовые файлы выгрузок переносятся из публичного MEDIA_ROOT в EXPORT_FILES_ROOT под случайный каталог. """
+    ExportJob = apps.get_model('dashboard', 'ExportJob')
+    for job in ExportJob.objects.exclude(file='').only('id', 'file'):
+        old_path = os.path.join(settings.MEDIA_ROOT, job.file.name)
+        if not os.path.isfile(old_path): continue
+        new_name = os.path.join(os.path.dirname(job.file.name), secrets.token_urlsafe(16), os.path.basename(job.file.name))
+        new_path = os.path.join(settings.EXPORT_FILES_ROOT, new_name)
+        os.makedirs(os.path.dirname(new_path), exist_ok=True)
+        shutil.move(old_path, new_path)
+        ExportJob.objects.filter(pk=job.pk).update(file=new_name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0002_exportjob'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='exportjob',
+            name='file',
+            field=models.FileField(blank=True, max_length=255, storage=dashboard.models.PrivateExportStorage(), upload_to=dashboard.models.export_upload_to, verbose_name='Файл'),
+        ),
+        migrations.RunPython(move_existing_exports, migrations.RunPython.noop),
+    ]
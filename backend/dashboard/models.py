@@ -1,5 +1,12 @@
 # dashboard/models.py
+import os
+import secrets
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
 from django.db import models
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
 from django.utils.translation import gettext_lazy as _
 
 # Эта модель не создает таблицу в БД (managed = False)
@@ -14,4 +21,80 @@ class StatisticsDashboard(models.Model):
         # Указываем app_label, чтобы она точно попала в наше приложение dashboard
         app_label = 'dashboard'
         # Права доступа по умолчанию (можно переопределить)
-        # default_permissions = ('view',)
\ No newline at end of file
+        # default_permissions = ('view',)
+
+@deconstructible
+class PrivateExportStorage(FileSystemStorage):
+    """
+    Хранилище выгрузок (персональные данные клиентов) в settings.EXPORT_FILES_ROOT, вне MEDIA_ROOT.
+    Публичного URL у файлов нет (url() бросает ValueError): отдает их только download_export_job.
+    """
+    @property
+    def base_location(self):
+        return settings.EXPORT_FILES_ROOT
+
+    @property
+    def location(self):
+        return os.path.abspath(self.base_location)
+
+    @property
+    def base_url(self):
+        return None
+
+
+def export_upload_to(instance, filename: str) -> str:
+    # Случайный каталог: путь к файлу нельзя угадать по дате и ВУЗу из имени файла
+    return f"exports/{timezone.now():%Y/%m}/{secrets.token_urlsafe(16)}/{filename}"
+
+
+class ExportJob(models.Model):
+    """
+    Фоновая выгрузка заказов. Создается из дашборда, выполняется командой run_export_jobs
+    (очередь в БД), готовый файл сохраняется в EXPORT_FILES_ROOT (не в MEDIA_ROOT)
+    и скачивается только через download_export_job.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, _('В очереди')),
+        (STATUS_RUNNING, _('Выполняется')),
+        (STATUS_DONE, _('Готово')),
+        (STATUS_FAILED, _('Ошибка')),
+    ]
+    FORMAT_XLSX = 'xlsx'
+    FORMAT_CSV = 'csv'
+    FORMAT_CHOICES = [(FORMAT_XLSX, 'Excel (XLSX)'), (FORMAT_CSV, 'CSV')]
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='export_jobs', verbose_name=_("Пользователь")
+    )
+    university = models.ForeignKey(
+        'universities.University', on_delete=models.CASCADE, null=True, blank=True,
+        related_name='export_jobs', verbose_name=_("Университет"), help_text=_("Пусто — выгрузка по всей платформе.")
+    )
+    export_format = models.CharField(_("Формат"), max_length=10, choices=FORMAT_CHOICES, default=FORMAT_XLSX)
+    language = models.CharField(_("Язык"), max_length=10, default=settings.LANGUAGE_CODE)
+    status = models.CharField(_("Статус"), max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING, db_index=True)
+    total_rows = models.PositiveIntegerField(_("Всего строк"), null=True, blank=True)
+    processed_rows = models.PositiveIntegerField(_("Обработано строк"), default=0)
+    file = models.FileField(_("Файл"), upload_to=export_upload_to, storage=PrivateExportStorage(), max_length=255, blank=True)
+    error_message = models.TextField(_("Ошибка"), blank=True)
+    created_at = models.DateTimeField(_("Создано"), auto_now_add=True)
+    started_at = models.DateTimeField(_("Начато"), null=True, blank=True)
+    finished_at = models.DateTimeField(_("Завершено"), null=True, blank=True)
+
+    class Meta:
+        verbose_name = _('Выгрузка заказов')
+        verbose_name_plural = _('Выгрузки заказов')
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['status', 'created_at'])]
+
+    def __str__(self):
+        return f"Выгрузка #{self.pk} ({self.get_status_display()})"
+
+    def get_progress_percent(self) -> int:
+        if self.status == self.STATUS_DONE: return 100
+        if not self.total_rows: return 0
+        return min(99, int(self.processed_rows * 100 / self.total_rows))
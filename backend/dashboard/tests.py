@@ -1,3 +1,197 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+from datetime import time, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from openpyxl import load_workbook
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from universities.models import University
+from facilities.models import Facility
+from bookings.models import Order
+from .export_jobs import claim_next_export_job
+from .exports import iter_order_export_rows
+from .models import ExportJob
+from .views import (
+    statistics_dashboard_view, export_orders_to_excel, create_export_job, export_job_status, download_export_job,
+)
+
+User = get_user_model()
+
+
+class StatisticsDashboardQueryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = User.objects.create_superuser(email='stats-admin@example.com', password='password', username='statsadmin')
+        cls.customer = User.objects.create_user(email='stats-customer@example.com', password='password', username='statscustomer')
+        cls.booking_date = timezone.localdate()
+
+    def _create_university_with_orders(self, index, orders_count):
+        university = University.objects.create(name=f"Stats University {index}", city="Stats City", is_active=True)
+        facility = Facility.objects.create(
+            name=f"Stats Court {index}", university=university, facility_type=Facility.TYPE_TENNIS,
+            price_per_hour=10000, open_time=time(0, 0), close_time=time(23, 59),
+            working_days="0,1,2,3,4,5,6", booking_type=Facility.BOOKING_TYPE_OVERLAPPING, max_capacity=50,
+        )
+        for order_index in range(orders_count):
+            Order.objects.create(
+                user=self.customer, facility=facility, order_type=Order.TYPE_SLOT_BOOKING,
+                status=Order.STATUS_CONFIRMED, total_price=Decimal(15000), booking_date=self.booking_date,
+                slots=[{"start_time": f"{order_index:02d}:00", "end_time": f"{order_index + 1:02d}:00"}],
+            )
+        return university
+
+    def _render_context(self):
+        request = RequestFactory().get('/admin/dashboard/statistics/')
+        request.user = self.admin_user
+        with mock.patch('dashboard.views.render') as render_mock, CaptureQueriesContext(connection) as queries:
+            statistics_dashboard_view(request)
+        return render_mock.call_args[0][2], len(queries)
+
+    def test_per_university_table_uses_grouped_queries(self):
+        first_university = self._create_university_with_orders(1, orders_count=2)
+        context, queries_for_one = self._render_context()
+
+        self._create_university_with_orders(2, orders_count=1)
+        self._create_university_with_orders(3, orders_count=0)
+        context, queries_for_three = self._render_context()
+
+        self.assertEqual(queries_for_one, queries_for_three)
+        rows_by_id = {row['id']: row for row in context['universities_stats_table']}
+        self.assertEqual(len(rows_by_id), 3)
+        first_row = rows_by_id[first_university.id]
+        self.assertEqual(first_row['month_orders'], 2)
+        self.assertEqual(first_row['total_orders_ever'], 2)
+        self.assertEqual(first_row['month_revenue'], "30 000")
+        self.assertEqual(first_row['active_facilities'], 1)
+        self.assertEqual(context['stats_kpi_cards']['month_orders_count']['value'], 3)
+        self.assertEqual(context['stats_kpi_cards']['week_orders_count']['value'], 3)
+
+
+class OrderExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user(
+            email='export-customer@example.com', password='password', username='exportcustomer', first_name='Export', last_name='Customer'
+        )
+        university = University.objects.create(name="Export University", short_name="EXU", city="Export City")
+        cls.facility = Facility.objects.create(
+            name="Export Court", university=university, facility_type=Facility.TYPE_TENNIS,
+            price_per_hour=10000, open_time=time(8, 0), close_time=time(22, 0),
+            working_days="0,1,2,3,4,5,6", booking_type=Facility.BOOKING_TYPE_OVERLAPPING, max_capacity=50,
+        )
+        cls.booking_date = timezone.localdate() + timedelta(days=1)
+        for hour in range(10, 15):
+            Order.objects.create(
+                user=cls.customer, facility=cls.facility, order_type=Order.TYPE_SLOT_BOOKING,
+                status=Order.STATUS_CONFIRMED, total_price=Decimal(10000), booking_date=cls.booking_date,
+                slots=[{"start_time": f"{hour}:00", "end_time": f"{hour + 1}:00"}],
+            )
+        Order.objects.create(
+            user=cls.customer, facility=cls.facility, order_type=Order.TYPE_SUBSCRIPTION,
+            status=Order.STATUS_CONFIRMED, total_price=Decimal(80000),
+            subscription_start_date=cls.booking_date, subscription_end_date=cls.booking_date + timedelta(days=30),
+            days_of_week="0,2", subscription_times="18:00",
+        )
+
+    def test_rows_match_order_display_across_chunks(self):
+        orders = Order.objects.prefetch_related('order_slots').order_by('-created_at', '-pk')
+        with CaptureQueriesContext(connection) as queries:
+            rows = list(iter_order_export_rows(Order.objects.all(), chunk_size=2))
+        # Один запрос заказов (читается пачками) + по запросу слотов на каждую из 3 пачек
+        self.assertEqual(len(queries), 4)
+        self.assertEqual([row[0] for row in rows], [order.order_code for order in orders])
+        for row, order in zip(rows, orders):
+            self.assertEqual(row[8], order.get_order_slots_display())
+            self.assertEqual(row[1], "Export Customer")
+            self.assertEqual(row[4], "EXU")
+
+    def test_xlsx_and_csv_exports(self):
+        admin_user = User.objects.create_superuser(email='export-admin@example.com', password='password', username='exportadmin')
+        request = RequestFactory().get('/export/')
+        request.user = admin_user
+        response = export_orders_to_excel(request)
+        self.assertEqual(response.status_code, 200)
+        worksheet = load_workbook(io.BytesIO(b''.join(response.streaming_content))).active
+        self.assertEqual(worksheet.max_row, 7)
+        self.assertEqual(worksheet.cell(row=2, column=10).number_format, '#,##0" сум"')
+
+        request = RequestFactory().get('/export/', {'format': 'csv'})
+        request.user = admin_user
+        response = export_orders_to_excel(request)
+        csv_rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode('utf-8-sig'))))
+        self.assertEqual(len(csv_rows), 7)
+        self.assertIn("18:00-19:00", csv_rows[1][8])
+
+
+class ExportJobTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = User.objects.create_superuser(email='job-admin@example.com', password='password', username='jobadmin')
+        university = University.objects.create(name="Job University", short_name="JOBU", city="Job City")
+        facility = Facility.objects.create(
+            name="Job Court", university=university, facility_type=Facility.TYPE_TENNIS,
+            price_per_hour=10000, open_time=time(8, 0), close_time=time(22, 0),
+            working_days="0,1,2,3,4,5,6", booking_type=Facility.BOOKING_TYPE_OVERLAPPING, max_capacity=50,
+        )
+        for hour in range(10, 13):
+            Order.objects.create(
+                user=cls.admin_user, facility=facility, order_type=Order.TYPE_SLOT_BOOKING,
+                status=Order.STATUS_CONFIRMED, total_price=Decimal(10000), booking_date=timezone.localdate() + timedelta(days=1),
+                slots=[{"start_time": f"{hour}:00", "end_time": f"{hour + 1}:00"}],
+            )
+
+    def setUp(self):
+        self.export_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.export_root, ignore_errors=True)
+        export_root_override = override_settings(EXPORT_FILES_ROOT=self.export_root)
+        export_root_override.enable()
+        self.addCleanup(export_root_override.disable)
+
+    def _request(self, method, data=None):
+        request = getattr(RequestFactory(), method)('/export-jobs/', data or {})
+        request.user = self.admin_user
+        request._dont_enforce_csrf_checks = True
+        return request
+
+    def test_job_is_queued_processed_and_downloadable(self):
+        response = create_export_job(self._request('post', {'format': 'csv', 'university_id': 'global'}))
+        self.assertEqual(response.status_code, 202)
+        job = ExportJob.objects.get(pk=json.loads(response.content)['id'])
+        self.assertEqual(job.status, ExportJob.STATUS_PENDING)
+        self.assertEqual(download_export_job(self._request('get'), job.id).status_code, 409)
+
+        call_command('run_export_jobs', stdout=io.StringIO())
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ExportJob.STATUS_DONE)
+        self.assertEqual((job.total_rows, job.processed_rows, job.get_progress_percent()), (3, 3, 100))
+        status_data = json.loads(export_job_status(self._request('get'), job.id).content)
+        self.assertIsNotNone(status_data['download_url'])
+        download = download_export_job(self._request('get'), job.id)
+        csv_rows = list(csv.reader(io.StringIO(b''.join(download.streaming_content).decode('utf-8-sig'))))
+        self.assertEqual(len(csv_rows), 4)
+
+        # Файл лежит вне MEDIA_ROOT, в случайном каталоге, и не имеет публичного URL
+        self.assertTrue(job.file.path.startswith(os.path.abspath(self.export_root) + os.sep))
+        self.assertNotEqual(os.path.dirname(job.file.name), timezone.localtime(job.created_at).strftime('exports/%Y/%m'))
+        with self.assertRaises(ValueError):
+            job.file.url
+
+    def test_worker_claims_each_job_once(self):
+        first = ExportJob.objects.create(user=self.admin_user)
+        second = ExportJob.objects.create(user=self.admin_user)
+        self.assertEqual(claim_next_export_job().pk, first.pk)
+        self.assertEqual(claim_next_export_job().pk, second.pk)
+        self.assertIsNone(claim_next_export_job())
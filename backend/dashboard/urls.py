@@ -1,10 +1,17 @@
 # dashboard/urls.py
 from django.urls import path
-from .views import get_user_dashboard_stats_api, export_orders_to_excel # Добавили export_orders_to_excel
+from .views import (
+    get_user_dashboard_stats_api, export_orders_to_excel, catalog_cache_stats_api, # Добавили export_orders_to_excel
+    create_export_job, export_job_status, download_export_job,
+)
 
 app_name = 'dashboard'
 
 urlpatterns = [
     path('user-stats/', get_user_dashboard_stats_api, name='user-dashboard-stats-api'),
     path('export-orders-excel/', export_orders_to_excel, name='export-orders-excel'), # Новый URL
+    path('catalog-cache-stats/', catalog_cache_stats_api, name='catalog-cache-stats'),
+    path('export-jobs/', create_export_job, name='export-job-create'),
+    path('export-jobs/<int:job_id>/', export_job_status, name='export-job-status'),
+    path('export-jobs/<int:job_id>/download/', download_export_job, name='export-job-download'),
 ]
\ No newline at end of file
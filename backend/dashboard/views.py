@@ -3,28 +3,31 @@ from django.shortcuts import render, get_object_or_404
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import user_passes_test
 from django.utils.translation import gettext_lazy as _, gettext
-from django.utils import timezone
-from django.db.models import Sum, Count, Q, Avg 
+from django.utils import timezone, translation
+from django.db.models import Sum, Count, Q, Avg, Exists, OuterRef
 from django.db.models.functions import Coalesce, TruncDay, TruncMonth
 from decimal import Decimal, ROUND_HALF_UP
 from datetime import timedelta, date as dt_date, datetime, time 
 import json 
 import logging
-from .models import StatisticsDashboard # <--- ВОТ ДОБАВЛЕННЫЙ ИМПОРТ
+from .models import StatisticsDashboard, ExportJob # <--- ВОТ ДОБАВЛЕННЫЙ ИМПОРТ
 
 from django.contrib import admin, messages
 from django.contrib.auth import get_user_model
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 from rest_framework import status
 
-from django.http import HttpResponse
-from openpyxl import Workbook
-from openpyxl.utils.datetime import to_excel
-from openpyxl.styles import Font, Alignment, Border, Side, PatternFill
+import os
+import tempfile
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse, FileResponse, JsonResponse
+from django.urls import reverse
+from django.views.decorators.http import require_POST
 
 from core.utils import get_admin_university_details
+from core.cache import get_catalog_cache_stats
 
 try:
     from universities.models import University, Staff, SportClub
@@ -39,10 +42,11 @@ except ImportError:
     Facility = None # type: ignore
     FACILITY_APP_AVAILABLE = False
 try:
-    from bookings.models import Order 
+    from bookings.models import Order, OrderSlot, DailyOrderStats
+    from .exports import iter_order_export_rows, iter_orders_csv, write_orders_xlsx
     BOOKING_APP_AVAILABLE = True
 except ImportError:
-     Order = None # type: ignore
+     Order = OrderSlot = DailyOrderStats = None # type: ignore
      BOOKING_APP_AVAILABLE = False
 
 User = get_user_model()
@@ -118,73 +122,118 @@ def statistics_dashboard_view(request):
         start_of_this_week = today_date - timedelta(days=today_date.weekday())
         
         base_orders_qs = Order.objects.all()
+        base_stats_qs = DailyOrderStats.objects.all()
         if target_university_for_stats: # Если выбран конкретный ВУЗ
             base_orders_qs = base_orders_qs.filter(facility__university=target_university_for_stats)
+            base_stats_qs = base_stats_qs.filter(university=target_university_for_stats)
         
         successful_statuses = [Order.STATUS_CONFIRMED, Order.STATUS_COMPLETED]
-        all_orders_ever_successful_qs = base_orders_qs.filter(status__in=successful_statuses)
+        current_tz = timezone.get_current_timezone()
+        start_of_month_dt = timezone.make_aware(datetime.combine(start_of_this_month, time.min), current_tz)
+        q_successful = Q(status__in=successful_statuses)
+        # Заказы/доход за периоды берутся из дневных агрегатов (DailyOrderStats), а не из таблицы заказов
+        q_this_month = q_successful & Q(date__gte=start_of_this_month, date__lte=today_date)
+        q_this_week = q_successful & Q(date__gte=start_of_this_week, date__lte=today_date)
+
+        # Произвольный период из GET-параметров date_from/date_to (YYYY-MM-DD)
+        period_start = period_end = None
+        try:
+            if request.GET.get('date_from'): period_start = dt_date.fromisoformat(request.GET['date_from'])
+            if request.GET.get('date_to'): period_end = dt_date.fromisoformat(request.GET['date_to'])
+        except ValueError:
+            messages.warning(request, _("Некорректный период. Используйте формат ГГГГ-ММ-ДД."))
+            period_start = period_end = None
+        context['period_date_from'] = period_start
+        context['period_date_to'] = period_end
+        q_period = q_successful
+        if period_start: q_period &= Q(date__gte=period_start)
+        if period_end: q_period &= Q(date__lte=period_end)
+
+        stats_agg = base_stats_qs.aggregate(
+            month_count=Coalesce(Sum('order_count', filter=q_this_month), 0),
+            month_revenue=Coalesce(Sum('revenue', filter=q_this_month), Decimal(0)),
+            month_subscriptions_revenue=Coalesce(Sum('revenue', filter=q_this_month & Q(order_type=Order.TYPE_SUBSCRIPTION)), Decimal(0)),
+            week_count=Coalesce(Sum('order_count', filter=q_this_week), 0),
+            week_revenue=Coalesce(Sum('revenue', filter=q_this_week), Decimal(0)),
+            period_count=Coalesce(Sum('order_count', filter=q_period), 0),
+            period_revenue=Coalesce(Sum('revenue', filter=q_period), Decimal(0)),
+        )
+
+        # Активные заказы сегодня
+        # Логика для active_orders_today_count (нужно уточнить, как в MyUnifiedOrderListView)
+        q_bookings_active_today = Q(order_type__in=[Order.TYPE_SLOT_BOOKING, Order.TYPE_ENTRY_FEE]) & \
+                                  Q(status=Order.STATUS_CONFIRMED) & Q(booking_date=today_date) & \
+                                  Q(facility__close_time__gt=now.time())
+        q_subscriptions_active_today = Q(order_type=Order.TYPE_SUBSCRIPTION) & \
+                                       Q(status=Order.STATUS_CONFIRMED) & \
+                                       Q(subscription_start_date__lte=today_date) & \
+                                       Q(subscription_end_date__gte=today_date) & \
+                                       Exists(OrderSlot.objects.filter(order=OuterRef('pk'), weekday=today_date.weekday())) # Есть занятие сегодня
+        # Всего активных подписок (подписка еще не закончилась)
+        q_active_subscriptions = Q(order_type=Order.TYPE_SUBSCRIPTION, status=Order.STATUS_CONFIRMED, subscription_end_date__gte=today_date)
+
+        # Активность на сегодня зависит от дат брони/подписки, а не от даты создания — считаем по заказам одним запросом
+        orders_agg = base_orders_qs.aggregate(
+            active_today_count=Count('id', filter=q_bookings_active_today | q_subscriptions_active_today),
+            active_subscriptions_count=Count('id', filter=q_active_subscriptions),
+        )
 
         # --- KPI Карточки ---
         kpi_cards = {}
 
         # Заказы (Этот месяц)
-        orders_this_month_qs = all_orders_ever_successful_qs.filter(created_at__date__gte=start_of_this_month, created_at__date__lte=today_date)
-        month_agg = orders_this_month_qs.aggregate(total_count=Count('id'), total_revenue=Coalesce(Sum('total_price'), Decimal(0)))
         kpi_cards['month_orders_count'] = {
             'label': _('Заказов (Этот месяц)'),
-            'value': month_agg['total_count'],
+            'value': stats_agg['month_count'],
         }
-        month_subscriptions_revenue = orders_this_month_qs.filter(order_type=Order.TYPE_SUBSCRIPTION).aggregate(total=Coalesce(Sum('total_price'), Decimal(0)))['total']
         kpi_cards['month_revenue'] = {
             'label': _('Доход (Этот месяц)'),
-            'value': f"{month_agg['total_revenue']:,} {gettext('сум')}".replace(",", " "),
-            'sub_text': _('Вкл. подписки: {amount_sub} {currency}').format(amount_sub=f"{month_subscriptions_revenue:,}".replace(",", " "), currency=gettext('сум'))
+            'value': f"{stats_agg['month_revenue']:,} {gettext('сум')}".replace(",", " "),
+            'sub_text': _('Вкл. подписки: {amount_sub} {currency}').format(amount_sub=f"{stats_agg['month_subscriptions_revenue']:,}".replace(",", " "), currency=gettext('сум'))
         }
 
         # Заказы (Эта неделя)
-        orders_this_week_qs = all_orders_ever_successful_qs.filter(created_at__date__gte=start_of_this_week, created_at__date__lte=today_date)
-        week_agg = orders_this_week_qs.aggregate(total_count=Count('id'),total_revenue=Coalesce(Sum('total_price'), Decimal(0)))
         kpi_cards['week_orders_count'] = {
             'label': _('Заказов (Эта неделя)'),
-            'value': week_agg['total_count'],
+            'value': stats_agg['week_count'],
         }
         kpi_cards['week_revenue'] = {
             'label': _('Доход (Эта неделя)'),
-            'value': f"{week_agg['total_revenue']:,} {gettext('сум')}".replace(",", " "),
+            'value': f"{stats_agg['week_revenue']:,} {gettext('сум')}".replace(",", " "),
         }
         
-        # Активные заказы сегодня
-        # Логика для active_orders_today_count (нужно уточнить, как в MyUnifiedOrderListView)
-        q_bookings_active_today = Q(order_type__in=[Order.TYPE_SLOT_BOOKING, Order.TYPE_ENTRY_FEE]) & \
-                                  Q(status=Order.STATUS_CONFIRMED) & Q(booking_date=today_date) & \
-                                  Q(facility__close_time__gt=now.time())
-        q_subscriptions_active_today = Q(order_type=Order.TYPE_SUBSCRIPTION) & \
-                                       Q(status=Order.STATUS_CONFIRMED) & \
-                                       Q(subscription_start_date__lte=today_date) & \
-                                       Q(subscription_end_date__gte=today_date)
-        active_orders_today_count = base_orders_qs.filter(q_bookings_active_today | q_subscriptions_active_today).count()
+        if period_start or period_end:
+            period_label = f"{period_start.strftime('%d.%m.%Y') if period_start else '...'} - {period_end.strftime('%d.%m.%Y') if period_end else '...'}"
+            kpi_cards['period_orders_count'] = {
+                'label': _('Заказов (Период)'),
+                'value': stats_agg['period_count'],
+                'sub_text': period_label,
+            }
+            kpi_cards['period_revenue'] = {
+                'label': _('Доход (Период)'),
+                'value': f"{stats_agg['period_revenue']:,} {gettext('сум')}".replace(",", " "),
+                'sub_text': period_label,
+            }
+
         kpi_cards['active_orders_today'] = {
             'label': _('Активных заказов сегодня'),
-            'value': active_orders_today_count,
+            'value': orders_agg['active_today_count'],
         }
-
-        # Всего активных подписок
-        total_active_subscriptions_count = base_orders_qs.filter(
-            order_type=Order.TYPE_SUBSCRIPTION, 
-            status=Order.STATUS_CONFIRMED, 
-            subscription_end_date__gte=today_date # Подписка еще не закончилась
-        ).count()
         kpi_cards['total_active_subscriptions'] = {
             'label': _('Всего активных подписок'),
-            'value': total_active_subscriptions_count,
+            'value': orders_agg['active_subscriptions_count'],
         }
         
         # Дополнительные KPI (если глобальный вид)
         if is_global_view_active:
             if User: 
+                users_agg = User.objects.aggregate(
+                    new_this_month=Count('id', filter=Q(date_joined__gte=start_of_month_dt)),
+                    active_total=Count('id', filter=Q(is_active=True)),
+                )
                 kpi_cards['new_users_this_month'] = {
                     'label': _('Новых пользователей (Этот месяц)'),
-                    'value': User.objects.filter(date_joined__gte=start_of_this_month).count()
+                    'value': users_agg['new_this_month']
                 }
             if University:
                 kpi_cards['total_active_universities'] = {
@@ -199,7 +248,7 @@ def statistics_dashboard_view(request):
             if User:
                 kpi_cards['total_active_users_platform'] = {
                     'label': _('Всего активных пользователей'),
-                    'value': User.objects.filter(is_active=True).count()
+                    'value': users_agg['active_total']
                 }
         
         # KPI для конкретного ВУЗа
@@ -215,27 +264,34 @@ def statistics_dashboard_view(request):
         # --------------------
         
         # Статистика по ВУЗам для таблицы (только для суперюзера и глобального вида)
+        # Один сгруппированный запрос по агрегатам и один по объектам — число запросов не зависит от количества ВУЗов
         if is_global_view_active and University and context.get('universities_list_for_select'):
+            orders_by_university = {
+                row['university']: row
+                for row in DailyOrderStats.objects.filter(q_successful).values('university').annotate(
+                    month_orders=Coalesce(Sum('order_count', filter=q_this_month), 0),
+                    month_revenue=Coalesce(Sum('revenue', filter=q_this_month), Decimal(0)),
+                    total_orders_ever=Coalesce(Sum('order_count'), 0),
+                    total_revenue_ever=Coalesce(Sum('revenue'), Decimal(0)),
+                ).order_by()
+            }
+            active_facilities_by_university = dict(
+                Facility.objects.filter(is_active=True).values('university').annotate(total=Count('id')).order_by().values_list('university', 'total')
+            ) if Facility else {}
+
             universities_stats_list = []
+            empty_row = {'month_orders': 0, 'month_revenue': Decimal(0), 'total_orders_ever': 0, 'total_revenue_ever': Decimal(0)}
             for uni_in_loop in context['universities_list_for_select']: # Изменил имя переменной цикла
-                uni_base_orders_loop = Order.objects.filter(facility__university=uni_in_loop)
-                uni_successful_orders_loop = uni_base_orders_loop.filter(status__in=successful_statuses)
-                
-                uni_revenue_month_loop = uni_successful_orders_loop.filter(created_at__date__gte=start_of_this_month, created_at__date__lte=today_date).aggregate(total=Coalesce(Sum('total_price'), Decimal(0)))['total']
-                uni_orders_month_count_loop = uni_successful_orders_loop.filter(created_at__date__gte=start_of_this_month, created_at__date__lte=today_date).count()
-                
-                uni_total_revenue_ever_loop = uni_successful_orders_loop.aggregate(total=Coalesce(Sum('total_price'), Decimal(0)))['total']
-                uni_total_orders_ever_loop = uni_successful_orders_loop.count()
-                
+                uni_row = orders_by_university.get(uni_in_loop.id, empty_row)
                 universities_stats_list.append({
                     'id': uni_in_loop.id, 
                     'name': uni_in_loop.name, 
                     'short_name': uni_in_loop.short_name,
-                    'month_orders': uni_orders_month_count_loop, 
-                    'month_revenue': f"{uni_revenue_month_loop:,}".replace(",", " "),
-                    'total_orders_ever': uni_total_orders_ever_loop, 
-                    'total_revenue_ever': f"{uni_total_revenue_ever_loop:,}".replace(",", " "),
-                    'active_facilities': Facility.objects.filter(university=uni_in_loop, is_active=True).count() if Facility else 0,
+                    'month_orders': uni_row['month_orders'], 
+                    'month_revenue': f"{uni_row['month_revenue']:,}".replace(",", " "),
+                    'total_orders_ever': uni_row['total_orders_ever'], 
+                    'total_revenue_ever': f"{uni_row['total_revenue_ever']:,}".replace(",", " "),
+                    'active_facilities': active_facilities_by_university.get(uni_in_loop.id, 0),
                 })
             context['universities_stats_table'] = universities_stats_list
             
@@ -261,29 +317,33 @@ def get_user_dashboard_stats_api(request):
                                   Q(subscription_end_date__gte=today) & \
                                   Q(subscription_start_date__lte=today)
                                   
-    active_orders_count = Order.objects.filter(user=user).filter(q_user_bookings_active | q_user_subscriptions_active).count()
-    total_orders_count = Order.objects.filter(user=user, status__in=[Order.STATUS_CONFIRMED, Order.STATUS_COMPLETED]).count()
-    active_subscriptions_count = Order.objects.filter(user=user, order_type=Order.TYPE_SUBSCRIPTION, status=Order.STATUS_CONFIRMED, subscription_end_date__gte=today, subscription_start_date__lte=today).count()
-
-    stats_data = {
-        'active_orders_count': active_orders_count,
-        'total_orders_count': total_orders_count,
-        'active_subscriptions_count': active_subscriptions_count,
-    }
+    # Счетчики пользователя (в DailyOrderStats нет разреза по пользователю) — одним запросом по индексу (user, status)
+    stats_data = Order.objects.filter(user=user).aggregate(
+        active_orders_count=Count('id', filter=q_user_bookings_active | q_user_subscriptions_active),
+        total_orders_count=Count('id', filter=Q(status__in=[Order.STATUS_CONFIRMED, Order.STATUS_COMPLETED])),
+        active_subscriptions_count=Count('id', filter=q_user_subscriptions_active),
+    )
     return Response(stats_data, status=status.HTTP_200_OK)
 
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def catalog_cache_stats_api(request):
+    """ Счетчики попаданий/промахов кэша публичного каталога (только для персонала). """
+    return Response(get_catalog_cache_stats(), status=status.HTTP_200_OK)
+
 def staff_user_check(user):
     return user.is_staff
 
-@user_passes_test(staff_user_check)
-def export_orders_to_excel(request):
-    user = request.user
+def _resolve_export_university(user, uni_id_str):
+    """
+    Определяет область выгрузки: (разрешено, университет или None для всей платформы, суффикс имени файла).
+    Суперюзер выбирает ВУЗ параметром university_id, админ ВУЗа всегда выгружает свой ВУЗ.
+    """
     admin_university_obj = get_admin_university_details(user)
     target_university_for_export = None # Изменил имя переменной для ясности
     filename_suffix = "global"
 
     if user.is_superuser:
-        uni_id_str = request.GET.get('university_id')
         if uni_id_str and uni_id_str != "global" and University: # Проверяем, что это не "global"
             try: 
                 target_university_for_export = University.objects.get(pk=int(uni_id_str))
@@ -295,122 +355,87 @@ def export_orders_to_excel(request):
         target_university_for_export = admin_university_obj
         filename_suffix = target_university_for_export.short_name or str(target_university_for_export.id)
     # Если не суперюзер и не админ ВУЗа (admin_university_obj == -1), то экспорт не разрешен
-    elif not user.is_superuser and (not admin_university_obj or admin_university_obj == -1):
+    else:
         logger.warning(f"User {user.email} attempted to export Excel without sufficient permissions.")
+        return False, None, filename_suffix
+    return True, target_university_for_export, filename_suffix
+
+@user_passes_test(staff_user_check)
+def export_orders_to_excel(request):
+    is_allowed, target_university_for_export, filename_suffix = _resolve_export_university(request.user, request.GET.get('university_id'))
+    if not is_allowed:
         return HttpResponse("Unauthorized", status=403)
 
     queryset = Order.objects.all()
     if target_university_for_export:
         queryset = queryset.filter(facility__university=target_university_for_export)
-    
-    orders_to_export = queryset.select_related(
-        'user', 'facility', 'facility__university'
-    ).order_by('-created_at')
-
-    wb = Workbook()
-    ws = wb.active
-    ws.title = gettext("Заказы") 
-
-    columns = [
-        gettext("Код Заказа"), gettext("Пользователь (Имя)"), gettext("Пользователь (Email)"), 
-        gettext("Объект"), gettext("Университет"), gettext("Тип Заказа"), gettext("Статус"), 
-        gettext("Дата/Период"), gettext("Детали (Слоты/Время)"),
-        gettext("Сумма (сум)"), gettext("Дата Создания")
-    ]
-    ws.append(columns)
-    header_font = Font(bold=True, color="FFFFFF")
-    header_fill = PatternFill(start_color="4F81BD", end_color="4F81BD", fill_type="solid")
-    for cell_idx, cell in enumerate(ws[1]): # Используем enumerate для индекса колонки
-        cell.font = header_font; cell.fill = header_fill
-        cell.alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
-        # Устанавливаем ширину колонки (пример)
-        column_letter = chr(65 + cell_idx) # A, B, C...
-        if column_letter == 'A': ws.column_dimensions[column_letter].width = 20 # Код заказа
-        elif column_letter == 'B': ws.column_dimensions[column_letter].width = 25 # Имя
-        elif column_letter == 'C': ws.column_dimensions[column_letter].width = 30 # Email
-        elif column_letter == 'D': ws.column_dimensions[column_letter].width = 30 # Объект
-        elif column_letter == 'E': ws.column_dimensions[column_letter].width = 20 # ВУЗ
-        elif column_letter == 'F': ws.column_dimensions[column_letter].width = 20 # Тип
-        elif column_letter == 'G': ws.column_dimensions[column_letter].width = 18 # Статус
-        elif column_letter == 'H': ws.column_dimensions[column_letter].width = 20 # Дата/Период
-        elif column_letter == 'I': ws.column_dimensions[column_letter].width = 35 # Детали
-        elif column_letter == 'J': ws.column_dimensions[column_letter].width = 15 # Сумма
-        elif column_letter == 'K': ws.column_dimensions[column_letter].width = 18 # Дата создания
-
-
-    thin_border = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'), bottom=Side(style='thin'))
-
-    for order in orders_to_export:
-        user_email = order.user.email if order.user else "-"
-        user_name = order.user.get_full_name() if order.user else "-"
-        facility_name = order.facility.name if order.facility else "-"
-        uni_name = order.facility.university.short_name or order.facility.university.name if order.facility and order.facility.university else "-"
-        
-        order_dates = "-"
-        if order.order_type == Order.TYPE_ENTRY_FEE or order.order_type == Order.TYPE_SLOT_BOOKING:
-            order_dates = order.booking_date.strftime('%d.%m.%Y') if order.booking_date else '-'
-        elif order.order_type == Order.TYPE_SUBSCRIPTION:
-            start = order.subscription_start_date.strftime('%d.%m.%Y') if order.subscription_start_date else '?'
-            end = order.subscription_end_date.strftime('%d.%m.%Y') if order.subscription_end_date else '?'
-            order_dates = f"{start} - {end}"
-        
-        order_specifics = "-"
-        if order.order_type == Order.TYPE_SLOT_BOOKING:
-            order_specifics = order.get_ordered_slots_display() or "-"
-        elif order.order_type == Order.TYPE_SUBSCRIPTION:
-            days_str_list = order.get_parsed_days_of_week_display() 
-            days_str = ", ".join(days_str_list) if days_str_list else '-'
-            times_list = order.get_parsed_subscription_times()
-            times_str_formatted = "-"
-            if times_list:
-                duration = order.duration_per_slot_hours or 1
-                formatted_times_list = []
-                for t_str_item in times_list:
-                    try:
-                        start_time_obj_item = time.fromisoformat(t_str_item)
-                        end_time_obj_item = (datetime.combine(dt_date.min, start_time_obj_item) + timedelta(hours=duration)).time()
-                        formatted_times_list.append(f"{start_time_obj_item.strftime('%H:%M')}-{end_time_obj_item.strftime('%H:%M')}")
-                    except ValueError: formatted_times_list.append(t_str_item)
-                times_str_formatted = ", ".join(formatted_times_list)
-            order_specifics = f"{gettext('Дни')}: {days_str}; {gettext('Время')}: {times_str_formatted or '-'}"
-        
-        created_at_naive = None
-        if order.created_at:
-            aware_dt = timezone.localtime(order.created_at) # Конвертируем в локальное время
-            created_at_naive = aware_dt.replace(tzinfo=None) # Убираем tzinfo для openpyxl
-
-        row_data = [
-            order.order_code, user_name, user_email, facility_name, uni_name,
-            order.get_order_type_display(), order.get_status_display(),
-            order_dates, order_specifics,
-            order.total_price, 
-            created_at_naive # Используем naive datetime
-        ]
-        ws.append(row_data)
-    
-    for row_idx, row_val in enumerate(ws.iter_rows(min_row=1, max_row=ws.max_row, min_col=1, max_col=len(columns)), 1):
-        for cell in row_val:
-            cell.border = thin_border
-            if row_idx > 1: # Пропускаем заголовки
-                if isinstance(cell.value, (int, float, Decimal)):
-                     cell.alignment = Alignment(horizontal='right')
-                     if columns[cell.column -1] == gettext("Сумма (сум)"): # Проверяем по заголовку
-                         cell.number_format = '#,##0" {}"'.format(gettext('сум'))
-                elif isinstance(cell.value, datetime): 
-                    cell.number_format = 'DD.MM.YYYY HH:MM'
-                elif isinstance(cell.value, dt_date): 
-                    cell.number_format = 'DD.MM.YYYY'
-            elif row_idx == 1: # Заголовки
-                 cell.alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
-
-    response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+
     filename_date_part = timezone.localtime(timezone.now()).strftime('%Y%m%d_%H%M')
-    final_filename = f"unisport_orders_{filename_suffix}_{filename_date_part}.xlsx"
-    response['Content-Disposition'] = f'attachment; filename="{final_filename}"'
-    
-    try: wb.save(response)
+    final_filename = f"unisport_orders_{filename_suffix}_{filename_date_part}"
+
+    # Строки читаются пачками через values().iterator() и пишутся сразу — память не растет с числом заказов
+    if request.GET.get('format') == 'csv':
+        response = StreamingHttpResponse(iter_orders_csv(iter_order_export_rows(queryset)), content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="{final_filename}.csv"'
+        return response
+
+    export_file = tempfile.TemporaryFile() # Удаляется при закрытии (FileResponse закроет его после отправки)
+    try:
+        write_orders_xlsx(iter_order_export_rows(queryset), export_file)
     except Exception as e:
+        export_file.close()
         logger.error(f"Error saving workbook to response: {e}", exc_info=True)
         return HttpResponse("Error generating Excel file.", status=500)
-    return response
+    export_file.seek(0)
+    return FileResponse(
+        export_file, as_attachment=True, filename=f"{final_filename}.xlsx",
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    )
+
+def _serialize_export_job(request, job) -> dict:
+    return {
+        'id': job.id,
+        'status': job.status,
+        'status_display': str(job.get_status_display()),
+        'export_format': job.export_format,
+        'total_rows': job.total_rows,
+        'processed_rows': job.processed_rows,
+        'progress_percent': job.get_progress_percent(),
+        'error': job.error_message or None,
+        'status_url': request.build_absolute_uri(reverse('dashboard_api:export-job-status', args=[job.id])),
+        'download_url': request.build_absolute_uri(reverse('dashboard_api:export-job-download', args=[job.id])) if job.status == ExportJob.STATUS_DONE else None,
+    }
+
+def _get_user_export_job(request, job_id):
+    jobs_qs = ExportJob.objects.select_related('university')
+    if not request.user.is_superuser:
+        jobs_qs = jobs_qs.filter(user=request.user)
+    return get_object_or_404(jobs_qs, pk=job_id)
+
+@user_passes_test(staff_user_check)
+@require_POST
+def create_export_job(request):
+    """ Ставит выгрузку в очередь (выполняет команда run_export_jobs) и сразу отвечает 202. """
+    is_allowed, target_university_for_export, _filename_suffix = _resolve_export_university(request.user, request.POST.get('university_id'))
+    if not is_allowed:
+        return JsonResponse({'error': 'Unauthorized'}, status=403)
+    export_format = request.POST.get('format', ExportJob.FORMAT_XLSX)
+    if export_format not in dict(ExportJob.FORMAT_CHOICES):
+        return JsonResponse({'error': f"Unsupported format '{export_format}'."}, status=400)
+    job = ExportJob.objects.create(
+        user=request.user, university=target_university_for_export,
+        export_format=export_format, language=translation.get_language() or settings.LANGUAGE_CODE,
+    )
+    return JsonResponse(_serialize_export_job(request, job), status=202)
+
+@user_passes_test(staff_user_check)
+def export_job_status(request, job_id):
+    return JsonResponse(_serialize_export_job(request, _get_user_export_job(request, job_id)))
+
+@user_passes_test(staff_user_check)
+def download_export_job(request, job_id):
+    job = _get_user_export_job(request, job_id)
+    if job.status != ExportJob.STATUS_DONE or not job.file:
+        return JsonResponse({'error': 'Export is not ready.', 'status': job.status}, status=409)
+    return FileResponse(job.file.open('rb'), as_attachment=True, filename=os.path.basename(job.file.name))
 # --- END OF FULL FILE ---
\ No newline at end of file
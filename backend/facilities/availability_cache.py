@@ -0,0 +1,60 @@
+# facilities/availability_cache.py
+"""
+Короткоживущий кэш дневной доступности объекта: ключ (facility_id, дата, язык).
+Записи удаляются точечно при изменении занятости (SlotOccupancyManager.sync_for_order,
+bulk_transition_orders) после коммита транзакции; TTL страхует от устаревания по lead time.
+"""
+import logging
+from datetime import date as dt_date
+from typing import Iterable, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+
+def _availability_cache_key(facility_id: int, day: dt_date, language_code: str) -> str:
+    return f"availability:{facility_id}:{day.isoformat()}:{language_code}"
+
+
+def get_cached_day_availability(facility_id: int, day: dt_date, language_code: str, facility_version: str) -> Optional[dict]:
+    """ Возвращает закэшированный ответ или None; запись с другой версией объекта считается промахом. """
+    try:
+        cached = cache.get(_availability_cache_key(facility_id, day, language_code))
+    except Exception as e:
+        logger.error(f"Availability cache read failed for facility {facility_id} on {day}: {e}", exc_info=True)
+        return None
+    if cached and cached.get('facility_version') == facility_version:
+        return cached['data']
+    return None
+
+
+def set_cached_day_availability(facility_id: int, day: dt_date, language_code: str, facility_version: str, data: dict) -> None:
+    try:
+        cache.set(
+            _availability_cache_key(facility_id, day, language_code),
+            {'facility_version': facility_version, 'data': data},
+            timeout=getattr(settings, 'AVAILABILITY_CACHE_TIMEOUT', 30)
+        )
+    except Exception as e:
+        logger.error(f"Availability cache write failed for facility {facility_id} on {day}: {e}", exc_info=True)
+
+
+def invalidate_availability_cache(facility_id: int, dates: Iterable[dt_date]) -> None:
+    """ Удаляет записи объекта на указанные даты для всех языков после коммита текущей транзакции. """
+    keys = [
+        _availability_cache_key(facility_id, day, language_code)
+        for day in set(dates) for language_code, _name in settings.LANGUAGES
+    ]
+    if not keys:
+        return
+
+    def _delete_keys():
+        try:
+            cache.delete_many(keys)
+        except Exception as e:
+            logger.error(f"Availability cache invalidation failed for facility {facility_id}: {e}", exc_info=True)
+
+    transaction.on_commit(_delete_keys)
@@ -1,13 +1,16 @@
+from collections import Counter
 from datetime import datetime, time, timedelta, date as dt_date
-from typing import Optional, Dict, Any, Tuple, Union
+from typing import Optional, Dict, Any, Tuple, Union, Iterable, List
 from uuid import UUID
 import logging # Используем logging
 
 from django.conf import settings
+from django.db.models import Q, Count
 from django.utils import timezone
 from typing import TYPE_CHECKING
 
 from bookings.models import Order # Модель Order для доступа к TYPE_CHOICES и статусам
+from .models import SlotOccupancy
 
 if TYPE_CHECKING:
     from .models import Facility # Для type hinting
@@ -55,18 +58,14 @@ class FacilityAvailabilityService:
         self.FacilityModel = FacilityModelAlias
 
 
-    def _is_facility_operational_at(self, check_datetime_start: datetime) -> Tuple[bool, Optional[str]]:
+    def _get_closed_reason(self, day_of_week_py: int, check_time_start_local: time) -> Optional[str]:
         """
-        Проверяет, работает ли объект в указанный день и время, и не нарушено ли время до бронирования.
-        Возвращает (is_operational, reason_if_not_operational).
+        Проверяет рабочий день и рабочие часы объекта для слота длительностью 1 час.
+        Зависит только от дня недели и времени, поэтому результат можно переиспользовать для всех дат.
         """
-        check_date_local = timezone.localtime(check_datetime_start).date()
-        check_time_start_local = timezone.localtime(check_datetime_start).time()
-
         # 1. Проверка рабочего дня
-        day_of_week_py = check_date_local.weekday()
         if not self.facility.is_working_on_day(day_of_week_py):
-            return False, REASON_CLOSED_DAY
+            return REASON_CLOSED_DAY
 
         # 2. Проверка рабочего времени
         facility_open_time = self.facility.open_time
@@ -77,12 +76,25 @@ class FacilityAvailabilityService:
             if check_time_start_local >= facility_open_time:
                 is_within_working_hours = True
         else: 
-            slot_end_time_local = (datetime.combine(check_date_local, check_time_start_local) + timedelta(hours=1)).time()
+            slot_end_time_local = (datetime.combine(dt_date.min, check_time_start_local) + timedelta(hours=1)).time()
             if check_time_start_local >= facility_open_time and slot_end_time_local <= facility_close_time:
                  is_within_working_hours = True
         
         if not is_within_working_hours:
-            return False, REASON_CLOSED_TIME
+            return REASON_CLOSED_TIME
+        return None
+
+    def _is_facility_operational_at(self, check_datetime_start: datetime) -> Tuple[bool, Optional[str]]:
+        """
+        Проверяет, работает ли объект в указанный день и время, и не нарушено ли время до бронирования.
+        Возвращает (is_operational, reason_if_not_operational).
+        """
+        check_date_local = timezone.localtime(check_datetime_start).date()
+        check_time_start_local = timezone.localtime(check_datetime_start).time()
+
+        closed_reason = self._get_closed_reason(check_date_local.weekday(), check_time_start_local)
+        if closed_reason:
+            return False, closed_reason
 
         # 3. Проверка ограничения по времени до начала бронирования
         booking_lead_time_minutes = getattr(settings, 'BOOKING_LEAD_TIME_MINUTES', 10)
@@ -99,20 +111,59 @@ class FacilityAvailabilityService:
     ) -> int:
         """
         Подсчитывает количество активных заказов (Order), конфликтующих с указанным временем.
+        Один индексированный запрос к SlotOccupancy (facility, date, start_time);
+        строки со start_time=NULL (оплата за вход) занимают весь день.
         """
-        count = 0
-        potential_conflicts_qs = Order.objects.filter(
-            facility_id=self.facility.id, # Используем facility_id для фильтрации
-            status__in=Order.STATUS_CREATES_CONFLICT
-        )
+        occupancy_qs = SlotOccupancy.objects.filter(
+            facility_id=self.facility.id,
+            date=check_date,
+        ).filter(Q(start_time=check_time) | Q(start_time__isnull=True))
 
         if exclude_order_id:
-            potential_conflicts_qs = potential_conflicts_qs.exclude(id=exclude_order_id)
-        
-        for order in potential_conflicts_qs:
-            if order.is_active_for_conflict_check(check_date, check_time):
-                count += 1
-        return count
+            occupancy_qs = occupancy_qs.exclude(order_id=exclude_order_id)
+        return occupancy_qs.count()
+
+    def _get_base_max_capacity(self) -> int:
+        """ Базовая максимальная вместимость слота для ответа. """
+        if self.facility.booking_type == self.FacilityModel.BOOKING_TYPE_EXCLUSIVE:
+            return 1
+        elif self.facility.booking_type == self.FacilityModel.BOOKING_TYPE_OVERLAPPING:
+            return self.facility.max_capacity if self.facility.max_capacity and self.facility.max_capacity > 0 else 0
+        return 0
+
+    def _build_capacity_result(self, total_booked_count: int, capacity_needed: int, base_max_capacity: int) -> AvailabilityResult:
+        """
+        Формирует результат для работающего слота по количеству уже занятых мест.
+        """
+        current_max_capacity = base_max_capacity
+
+        if self.facility.booking_type == self.FacilityModel.BOOKING_TYPE_EXCLUSIVE:
+            # current_max_capacity уже 1
+            if total_booked_count >= current_max_capacity:
+                return { "is_available": False, "reason": REASON_FULLY_BOOKED_EXCLUSIVE, "booked_slots_count": total_booked_count, "available_spots": 0, "max_capacity": current_max_capacity }
+
+        elif self.facility.booking_type == self.FacilityModel.BOOKING_TYPE_OVERLAPPING:
+            if current_max_capacity == 0: # Это уже REASON_FACILITY_MISCONFIGURED_CAPACITY
+                return { "is_available": False, "reason": REASON_FACILITY_MISCONFIGURED_CAPACITY, "booked_slots_count": total_booked_count, "available_spots": 0, "max_capacity": 0 }
+
+            if (total_booked_count + capacity_needed) > current_max_capacity:
+                return { "is_available": False, "reason": REASON_MAX_CAPACITY_REACHED, "booked_slots_count": total_booked_count, "available_spots": max(0, current_max_capacity - total_booked_count), "max_capacity": current_max_capacity }
+
+        # Если все проверки пройдены, слот доступен
+        available_spots_calculated = 0
+        if current_max_capacity > 0 : # Для EXCLUSIVE или OVERLAPPING
+             available_spots_calculated = max(0, current_max_capacity - total_booked_count)
+
+        # Для эксклюзивного, если не занято, всегда 1 свободное место
+        if self.facility.booking_type == self.FacilityModel.BOOKING_TYPE_EXCLUSIVE and total_booked_count == 0:
+            available_spots_calculated = 1
+
+        return {
+            "is_available": True, "reason": REASON_AVAILABLE,
+            "booked_slots_count": total_booked_count,
+            "available_spots": available_spots_calculated,
+            "max_capacity": current_max_capacity
+        }
 
     def check_slot_availability(
         self,
@@ -122,14 +173,9 @@ class FacilityAvailabilityService:
     ) -> AvailabilityResult:
         """
         Проверяет доступность ОДНОГО конкретного временного слота.
+        Для нескольких слотов используйте check_range — он делает один запрос на весь диапазон.
         """
-        # Определяем базовую максимальную вместимость для ответа
-        if self.facility.booking_type == self.FacilityModel.BOOKING_TYPE_EXCLUSIVE:
-            base_max_capacity = 1
-        elif self.facility.booking_type == self.FacilityModel.BOOKING_TYPE_OVERLAPPING:
-            base_max_capacity = self.facility.max_capacity if self.facility.max_capacity and self.facility.max_capacity > 0 else 0
-        else:
-            base_max_capacity = 0 
+        base_max_capacity = self._get_base_max_capacity()
 
         try:
             is_operational, reason_not_operational = self._is_facility_operational_at(check_datetime_start)
@@ -148,36 +194,7 @@ class FacilityAvailabilityService:
                 check_time_start_local, 
                 exclude_order_id
             )
-
-            current_max_capacity = base_max_capacity # Используем уже определенную base_max_capacity
-            
-            if self.facility.booking_type == self.FacilityModel.BOOKING_TYPE_EXCLUSIVE:
-                # current_max_capacity уже 1
-                if total_booked_count >= current_max_capacity:
-                    return { "is_available": False, "reason": REASON_FULLY_BOOKED_EXCLUSIVE, "booked_slots_count": total_booked_count, "available_spots": 0, "max_capacity": current_max_capacity }
-            
-            elif self.facility.booking_type == self.FacilityModel.BOOKING_TYPE_OVERLAPPING:
-                if current_max_capacity == 0: # Это уже REASON_FACILITY_MISCONFIGURED_CAPACITY
-                    return { "is_available": False, "reason": REASON_FACILITY_MISCONFIGURED_CAPACITY, "booked_slots_count": total_booked_count, "available_spots": 0, "max_capacity": 0 }
-                
-                if (total_booked_count + capacity_needed) > current_max_capacity:
-                    return { "is_available": False, "reason": REASON_MAX_CAPACITY_REACHED, "booked_slots_count": total_booked_count, "available_spots": max(0, current_max_capacity - total_booked_count), "max_capacity": current_max_capacity }
-            
-            # Если все проверки пройдены, слот доступен
-            available_spots_calculated = 0
-            if current_max_capacity > 0 : # Для EXCLUSIVE или OVERLAPPING
-                 available_spots_calculated = max(0, current_max_capacity - total_booked_count)
-            
-            # Для эксклюзивного, если не занято, всегда 1 свободное место
-            if self.facility.booking_type == self.FacilityModel.BOOKING_TYPE_EXCLUSIVE and total_booked_count == 0:
-                available_spots_calculated = 1
-            
-            return { 
-                "is_available": True, "reason": REASON_AVAILABLE, 
-                "booked_slots_count": total_booked_count, 
-                "available_spots": available_spots_calculated, 
-                "max_capacity": current_max_capacity 
-            }
+            return self._build_capacity_result(total_booked_count, capacity_needed, base_max_capacity)
         except Exception as e:
             logger.error(f"Error in check_slot_availability for facility {self.facility.id} at {check_datetime_start}: {e}", exc_info=True)
             return {
@@ -186,6 +203,166 @@ class FacilityAvailabilityService:
                 "max_capacity": base_max_capacity, "error_message": str(e)
             }
 
+    def _load_occupancy_counter(
+        self,
+        start_date: dt_date,
+        end_date: dt_date,
+        exclude_order_id: Optional[Union[int, str, UUID]] = None,
+    ) -> Tuple[Counter, Counter]:
+        """
+        Загружает занятость объекта за период ОДНИМ сгруппированным запросом.
+        Возвращает (счетчик по (дата, время), счетчик заказов на весь день по дате).
+        """
+        occupancy_qs = SlotOccupancy.objects.filter(facility_id=self.facility.id, date__range=(start_date, end_date))
+        if exclude_order_id:
+            occupancy_qs = occupancy_qs.exclude(order_id=exclude_order_id)
+
+        slot_counter: Counter = Counter()
+        whole_day_counter: Counter = Counter()
+        for row in occupancy_qs.values('date', 'start_time').annotate(orders_count=Count('id')).order_by():
+            if row['start_time'] is None:
+                whole_day_counter[row['date']] += row['orders_count']
+            else:
+                slot_counter[(row['date'], row['start_time'])] += row['orders_count']
+        return slot_counter, whole_day_counter
+
+    def check_range(
+        self,
+        start_date: dt_date,
+        end_date: dt_date,
+        hours: Iterable[time],
+        capacity_needed: int = 1,
+        exclude_order_id: Optional[Union[int, str, UUID]] = None,
+    ) -> Dict[Tuple[dt_date, time], AvailabilityResult]:
+        """
+        Проверяет доступность всех слотов hours для каждой даты периода [start_date, end_date].
+        Занятость загружается одним запросом и раскладывается в счетчик по часам,
+        поэтому стоимость не зависит от количества слотов.
+        Возвращает словарь {(дата, время начала): результат как у check_slot_availability}.
+        """
+        base_max_capacity = self._get_base_max_capacity()
+        hours = list(hours)
+        results: Dict[Tuple[dt_date, time], AvailabilityResult] = {}
+        if start_date > end_date or not hours:
+            return results
+
+        try:
+            slot_counter, whole_day_counter = self._load_occupancy_counter(start_date, end_date, exclude_order_id)
+        except Exception as e:
+            logger.error(f"Error in check_range for facility {self.facility.id} ({start_date} - {end_date}): {e}", exc_info=True)
+            slot_counter = whole_day_counter = None
+
+        current_tz = timezone.get_current_timezone()
+        current_date = start_date
+        while current_date <= end_date:
+            for slot_time in hours:
+                check_datetime_start = timezone.make_aware(datetime.combine(current_date, slot_time), current_tz)
+                if slot_counter is None:
+                    results[(current_date, slot_time)] = {
+                        "is_available": False, "reason": REASON_UNKNOWN_ERROR,
+                        "booked_slots_count": 0, "available_spots": 0,
+                        "max_capacity": base_max_capacity,
+                    }
+                    continue
+                is_operational, reason_not_operational = self._is_facility_operational_at(check_datetime_start)
+                if not is_operational:
+                    results[(current_date, slot_time)] = {
+                        "is_available": False, "reason": reason_not_operational,
+                        "booked_slots_count": 0, "available_spots": 0,
+                        "max_capacity": base_max_capacity
+                    }
+                    continue
+                total_booked_count = slot_counter[(current_date, slot_time)] + whole_day_counter[current_date]
+                results[(current_date, slot_time)] = self._build_capacity_result(total_booked_count, capacity_needed, base_max_capacity)
+            current_date += timedelta(days=1)
+        return results
+
+    def find_subscription_conflicts(
+        self,
+        start_date: dt_date,
+        end_date: dt_date,
+        days_of_week: Iterable[int],
+        times: Iterable[time],
+        capacity_needed: int = 1,
+        exclude_order_id: Optional[Union[int, str, UUID]] = None,
+        first_only: bool = True,
+    ) -> List[Tuple[dt_date, time, AvailabilityResult]]:
+        """
+        Массовая проверка конфликтов подписки без перебора слотов через check_slot_availability.
+        Запрошенные слоты и занятость кодируются целыми ключами date.toordinal() * 1440 + минута,
+        конфликты находятся пересечением множеств ключей. Рабочие часы проверяются один раз
+        на пару (день недели, время), ограничение lead time — одним сравнением ключа с порогом.
+        Возвращает конфликты [(дата, время, результат как у check_slot_availability)]
+        в порядке проверки (дата, затем порядок times); при first_only — не более одного.
+        """
+        base_max_capacity = self._get_base_max_capacity()
+        days_set = set(days_of_week)
+        times = list(dict.fromkeys(times))
+        if start_date > end_date or not days_set or not times:
+            return []
+
+        time_by_minute = {t.hour * 60 + t.minute: t for t in times}
+        time_order = {t.hour * 60 + t.minute: index for index, t in enumerate(times)}
+
+        # 1. Запрошенные ключи (дни периода, попадающие в days_of_week, x времена)
+        first_ordinal, last_ordinal = start_date.toordinal(), end_date.toordinal()
+        requested_ordinals = [o for o in range(first_ordinal, last_ordinal + 1) if dt_date.fromordinal(o).weekday() in days_set]
+        requested_keys = {o * 1440 + m for o in requested_ordinals for m in time_by_minute}
+
+        def _result(reason: str) -> AvailabilityResult:
+            return {"is_available": False, "reason": reason, "booked_slots_count": 0, "available_spots": 0, "max_capacity": base_max_capacity}
+
+        conflicts: Dict[int, AvailabilityResult] = {}
+
+        # 2. Рабочие дни/часы: одна проверка на пару (день недели, время)
+        closed_pairs: Dict[Tuple[int, int], str] = {}
+        for day_of_week_py in days_set:
+            for minute, slot_time in time_by_minute.items():
+                closed_reason = self._get_closed_reason(day_of_week_py, slot_time)
+                if closed_reason: closed_pairs[(day_of_week_py, minute)] = closed_reason
+        if closed_pairs:
+            for key in requested_keys:
+                reason = closed_pairs.get((dt_date.fromordinal(key // 1440).weekday(), key % 1440))
+                if reason: conflicts[key] = _result(reason)
+
+        # 3. Lead time: все ключи раньше порога
+        booking_lead_time_minutes = getattr(settings, 'BOOKING_LEAD_TIME_MINUTES', 10)
+        threshold_local = timezone.localtime(self.request_time + timedelta(minutes=booking_lead_time_minutes))
+        threshold_key = threshold_local.date().toordinal() * 1440 + threshold_local.hour * 60 + threshold_local.minute
+        if threshold_local.second or threshold_local.microsecond: threshold_key += 1
+        if first_ordinal * 1440 < threshold_key:
+            for key in requested_keys:
+                if key < threshold_key and key not in conflicts: conflicts[key] = _result(REASON_LEAD_TIME_RESTRICTION)
+
+        # 4. Вместимость: пересечение запрошенных ключей с занятыми
+        try:
+            slot_counter, whole_day_counter = self._load_occupancy_counter(start_date, end_date, exclude_order_id)
+        except Exception as e:
+            logger.error(f"Error in find_subscription_conflicts for facility {self.facility.id} ({start_date} - {end_date}): {e}", exc_info=True)
+            key = min(requested_keys, key=lambda k: (k // 1440, time_order[k % 1440])) if requested_keys else None
+            return [(start_date if key is None else dt_date.fromordinal(key // 1440), times[0] if key is None else time_by_minute[key % 1440], {**_result(REASON_UNKNOWN_ERROR), "error_message": str(e)})]
+
+        occupied_counts: Counter = Counter()
+        for (slot_date, slot_time), orders_count in slot_counter.items():
+            occupied_counts[slot_date.toordinal() * 1440 + slot_time.hour * 60 + slot_time.minute] += orders_count
+        for slot_date, orders_count in whole_day_counter.items():
+            for minute in time_by_minute:
+                occupied_counts[slot_date.toordinal() * 1440 + minute] += orders_count
+
+        if self._build_capacity_result(0, capacity_needed, base_max_capacity)["is_available"]:
+            # Свободный слот доступен, значит конфликтовать могут только занятые ключи
+            candidate_keys = requested_keys & occupied_counts.keys()
+        else:
+            candidate_keys = requested_keys
+        for key in candidate_keys:
+            if key in conflicts: continue
+            capacity_result = self._build_capacity_result(occupied_counts[key], capacity_needed, base_max_capacity)
+            if not capacity_result["is_available"]: conflicts[key] = capacity_result
+
+        ordered_keys = sorted(conflicts, key=lambda k: (k // 1440, time_order[k % 1440]))
+        if first_only: ordered_keys = ordered_keys[:1]
+        return [(dt_date.fromordinal(key // 1440), time_by_minute[key % 1440], conflicts[key]) for key in ordered_keys]
+
 # Оставляем старую функцию как обертку для обратной совместимости,
 # либо полностью переходим на использование сервиса.
 # Для чистоты кода, лучше везде использовать сервис.
@@ -0,0 +1,59 @@
+# facilities/facets.py
+"""
+Счетчики фасетов каталога объектов для текущего набора фильтров.
+
+Скалярные фасеты (тип объекта, тип бронирования, ВУЗ, город, цена) считаются одним GROUP BY по
+их комбинациям: комбинаций немного, суммы по каждому измерению собираются в Python. Удобства — M2M,
+для них отдельный GROUP BY по промежуточной таблице. Названия ВУЗов, городов и удобств дочитываются
+по id (по запросу на справочник), так что число запросов не зависит от размера каталога.
+"""
+from collections import Counter
+
+from django.db.models import Count, Max, Min
+
+from universities.models import City, University
+from .models import Amenity, Facility
+
+
+def _facet_items(counts: Counter, labels: dict) -> list:
+    """ [{'value', 'label', 'count'}] по убыванию count, затем по подписи. """
+    items = [{'value': value, 'label': labels.get(value, str(value)), 'count': count} for value, count in counts.items() if value is not None]
+    return sorted(items, key=lambda item: (-item['count'], str(item['label'])))
+
+
+def _names_by_id(queryset, ids) -> dict:
+    ids = [object_id for object_id in ids if object_id is not None]
+    return dict(queryset.filter(id__in=ids).values_list('id', 'name')) if ids else {}
+
+
+def build_facility_facets(queryset) -> dict:
+    """ queryset — уже отфильтрованный список объектов (filter_queryset представления). """
+    queryset = queryset.order_by().prefetch_related(None)
+    group_rows = queryset.values(
+        'facility_type', 'booking_type', 'university_id', 'university__normalized_city_id'
+    ).annotate(total=Count('id', distinct=True), min_price=Min('price_per_hour'), max_price=Max('price_per_hour'))
+
+    type_counts, booking_type_counts, university_counts, city_counts = Counter(), Counter(), Counter(), Counter()
+    min_price = max_price = None
+    for row in group_rows:
+        type_counts[row['facility_type']] += row['total']
+        booking_type_counts[row['booking_type']] += row['total']
+        university_counts[row['university_id']] += row['total']
+        city_counts[row['university__normalized_city_id']] += row['total']
+        if min_price is None or row['min_price'] < min_price: min_price = row['min_price']
+        if max_price is None or row['max_price'] > max_price: max_price = row['max_price']
+
+    amenity_counts = Counter(dict(
+        Facility.amenities.through.objects.filter(facility_id__in=queryset.values('id'))
+        .values('amenity_id').annotate(total=Count('facility_id', distinct=True)).values_list('amenity_id', 'total')
+    ))
+
+    return {
+        'count': sum(type_counts.values()),
+        'facility_type': _facet_items(type_counts, {value: str(label) for value, label in Facility.FACILITY_TYPES}),
+        'booking_type': _facet_items(booking_type_counts, {value: str(label) for value, label in Facility.BOOKING_TYPES}),
+        'university': _facet_items(university_counts, _names_by_id(University.objects.all(), university_counts)),
+        'city': _facet_items(city_counts, _names_by_id(City.objects.all(), city_counts)),
+        'amenities': _facet_items(amenity_counts, _names_by_id(Amenity.objects.all(), amenity_counts)),
+        'price': {'min': min_price, 'max': max_price},
+    }
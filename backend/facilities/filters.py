@@ -1,7 +1,16 @@
 import django_filters
+from django.conf import settings
+from django.db.models import Case, Q, When
 from django.utils.translation import gettext_lazy as _
+from rest_framework import filters
+from rest_framework.exceptions import ValidationError
+from modeltranslation import settings as mt_settings
+from modeltranslation.utils import build_localized_fieldname
+from rest_framework.settings import api_settings
 
+from universities.models import City
 from .models import Facility
+from .search import get_query_terms, search_facility_ids
 
 class FacilityFilter(django_filters.FilterSet):
     # Для фильтрации по диапазону цен (если нужно будет явно определить)
@@ -11,8 +20,10 @@ class FacilityFilter(django_filters.FilterSet):
     # Фильтр для university (по ID) - стандартный
     university = django_filters.NumberFilter(field_name="university__id", lookup_expr='exact')
     
-    # Фильтр для города университета (по частичному совпадению без учета регистра)
-    university__city = django_filters.CharFilter(field_name="university__city", lookup_expr='icontains')
+    # Город университета — через справочник universities.City: название сводится к id городов,
+    # дальше точное совпадение по индексированному FK вместо icontains по тексту
+    university__city = django_filters.CharFilter(method='filter_university_city')
+    city = django_filters.NumberFilter(field_name="university__normalized_city_id", lookup_expr='exact')
 
     # --- ИЗМЕНЕНИЕ: Явное определение фильтра для facility_type ---
     # Используем BaseInFilter, который по умолчанию разделяет значения по запятой
@@ -48,4 +59,42 @@ class FacilityFilter(django_filters.FilterSet):
         }
         # Добавляем поля, которые не были явно определены, но нужны из старого filterset_fields
         # Если поле уже определено выше, его не нужно дублировать здесь в fields.
-        # fields = ['price_per_hour'] # Оставляем только те, что не определены явно
\ No newline at end of file
+        # fields = ['price_per_hour'] # Оставляем только те, что не определены явно
+
+    def filter_university_city(self, queryset, name, value):
+        city_key = City.objects.build_key(value)
+        if not city_key: return queryset
+        # Точное совпадение нормализованного названия на любом языке — по индексированным City.key и lookup_key_<язык>
+        city_match_q = Q(key=city_key)
+        for language in mt_settings.AVAILABLE_LANGUAGES:
+            city_match_q |= Q(**{build_localized_fieldname('lookup_key', language): city_key})
+        return queryset.filter(university__normalized_city__in=City.objects.filter(city_match_q).values('id'))
+
+
+class FacilityFullTextSearchFilter(filters.SearchFilter):
+    """
+    ?search= по поисковому индексу (facilities.search) вместо icontains по search_fields.
+    Без ?ordering= результаты отдаются по релевантности, поэтому в filter_backends фильтр стоит
+    после OrderingFilter. На БД без индекса работает как обычный SearchFilter.
+
+    В выдачу попадают только FACILITY_SEARCH_MAX_RESULTS самых релевантных объектов; если совпадений
+    больше, request.facility_search_truncated = True (представление отдает его как search_truncated).
+    Курсор (?cursor=) сортирует по колонкам, а не по релевантности, поэтому с поиском он допустим
+    только вместе с явным ?ordering=.
+    """
+    def filter_queryset(self, request, queryset, view):
+        search_query = request.query_params.get(self.search_param, '')
+        if not get_query_terms(search_query): return queryset
+        is_relevance_order = not request.query_params.get(api_settings.ORDERING_PARAM)
+        cursor_param = getattr(getattr(view, 'paginator', None), 'cursor_query_param', None)
+        if is_relevance_order and cursor_param and cursor_param in request.query_params:
+            raise ValidationError({cursor_param: _("Поиск по релевантности листается номерами страниц; для курсора укажите ?ordering=.")})
+        max_results = getattr(settings, 'FACILITY_SEARCH_MAX_RESULTS', 500)
+        ranked_ids = search_facility_ids(search_query, limit=max_results + 1) # +1 — чтобы заметить усечение
+        if ranked_ids is None: return super().filter_queryset(request, queryset, view)
+        request.facility_search_truncated = len(ranked_ids) > max_results
+        ranked_ids = ranked_ids[:max_results]
+        queryset = queryset.filter(pk__in=ranked_ids)
+        if ranked_ids and is_relevance_order:
+            queryset = queryset.order_by(Case(*[When(pk=pk, then=position) for position, pk in enumerate(ranked_ids)]), 'id')
+        return queryset
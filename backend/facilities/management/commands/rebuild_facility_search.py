@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from core.cache import invalidate_catalog_cache, CATALOG_FACILITIES
+from facilities.models import Facility
+from facilities.search import refresh_facility_search_documents
+
+
+class Command(BaseCommand):
+    help = "Пересобирает поисковые документы каталога (FacilitySearchDocument) для всех объектов."
+
+    def handle(self, *args, **options):
+        documents_count = refresh_facility_search_documents(
+            Facility.objects.select_related('university').iterator(chunk_size=500)
+        )
+        invalidate_catalog_cache(CATALOG_FACILITIES) # Закэшированные ответы ?search= могли быть собраны по старым документам
+        self.stdout.write(self.style.SUCCESS(f"Обновлено поисковых документов: {documents_count}"))
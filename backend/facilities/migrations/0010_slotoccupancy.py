@@ -0,0 +1,31 @@
+# Generated by Django 5.2 on 2026-10-18 10:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0004_alter_paymenttransaction_expires_at_and_more'),
+        ('facilities', '0009_amenity_name_ru_amenity_name_uz_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlotOccupancy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Дата')),
+                ('start_time', models.TimeField(blank=True, help_text='Пусто — заказ занимает весь день (оплата за вход).', null=True, verbose_name='Время начала слота')),
+                ('facility', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slot_occupancies', to='facilities.facility', verbose_name='Объект')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slot_occupancies', to='bookings.order', verbose_name='Заказ')),
+            ],
+            options={
+                'verbose_name': 'Занятость слота',
+                'verbose_name_plural': 'Занятость слотов',
+                'indexes': [models.Index(fields=['facility', 'date', 'start_time'], name='facilities__facilit_14b102_idx')],
+                'constraints': [models.UniqueConstraint(fields=('order', 'date', 'start_time'), name='unique_slot_occupancy_per_order')],
+            },
+        ),
+    ]
@@ -0,0 +1,63 @@
+from datetime import time, timedelta
+from django.db import migrations
+
+# Копия логики Order.iter_occupied_slots: в миграциях исторические модели не имеют методов.
+STATUS_CREATES_CONFLICT = ['confirmed', 'pending_payment']
+
+
+def _iter_occupied_slots(order):
+    if order.order_type == 'slot_booking':
+        if not order.booking_date or not isinstance(order.slots, list): return
+        seen_times = set()
+        for slot_item in order.slots:
+            try:
+                slot_time = time.fromisoformat(slot_item['start_time'])
+            except (ValueError, KeyError, TypeError): continue
+            if slot_time not in seen_times:
+                seen_times.add(slot_time)
+                yield order.booking_date, slot_time
+    elif order.order_type == 'subscription':
+        if not (order.subscription_start_date and order.subscription_end_date): return
+        parsed_days = set(int(d.strip()) for d in (order.days_of_week or '').split(',') if d.strip().isdigit())
+        parsed_times = []
+        for t_str in set(t.strip() for t in (order.subscription_times or '').split(',') if len(t.strip()) == 5):
+            try: parsed_times.append(time.fromisoformat(t_str))
+            except ValueError: continue
+        if not parsed_days or not parsed_times: return
+        current_date = order.subscription_start_date
+        while current_date <= order.subscription_end_date:
+            if current_date.weekday() in parsed_days:
+                for slot_time in parsed_times:
+                    yield current_date, slot_time
+            current_date += timedelta(days=1)
+    elif order.order_type == 'entry_fee':
+        if order.booking_date:
+            yield order.booking_date, None
+
+
+def backfill_slot_occupancy(apps, schema_editor):
+    Order = apps.get_model('bookings', 'Order')
+    SlotOccupancy = apps.get_model('facilities', 'SlotOccupancy')
+    rows = []
+    for order in Order.objects.filter(status__in=STATUS_CREATES_CONFLICT).iterator(chunk_size=500):
+        for slot_date, slot_time in _iter_occupied_slots(order):
+            rows.append(SlotOccupancy(facility_id=order.facility_id, order_id=order.pk, date=slot_date, start_time=slot_time))
+        if len(rows) >= 5000:
+            SlotOccupancy.objects.bulk_create(rows, ignore_conflicts=True); rows = []
+    if rows:
+        SlotOccupancy.objects.bulk_create(rows, ignore_conflicts=True)
+
+
+def clear_slot_occupancy(apps, schema_editor):
+    apps.get_model('facilities', 'SlotOccupancy').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('facilities', '0010_slotoccupancy'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_slot_occupancy, clear_slot_occupancy),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2 on 2026-10-18 10:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('facilities', '0011_backfill_slot_occupancy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FacilityDayLedger',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Дата')),
+                ('facility', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='day_ledgers', to='facilities.facility', verbose_name='Объект')),
+            ],
+            options={
+                'verbose_name': 'Журнал объекта на дату',
+                'verbose_name_plural': 'Журналы объектов на дату',
+                'constraints': [models.UniqueConstraint(fields=('facility', 'date'), name='unique_facility_day_ledger')],
+            },
+        ),
+    ]
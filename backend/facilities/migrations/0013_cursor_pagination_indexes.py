@@ -0,0 +1,24 @@
+# Generated by Django 5.2 on 2026-10-18 11:16
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('facilities', '0012_facilitydayledger'),
+        ('universities', '0008_cursor_pagination_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='facility',
+            index=models.Index(fields=['name_uz', 'id'], name='facility_name_uz_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='facility',
+            index=models.Index(fields=['name_ru', 'id'], name='facility_name_ru_id_idx'),
+        ),
+    ]
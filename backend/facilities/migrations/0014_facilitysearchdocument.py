@@ -0,0 +1,85 @@
+# Generated by Django 5.2 on 2026-10-18 11:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Имена таблиц совпадают с facilities.search; сборка текста скопирована — в миграциях исторические модели.
+SEARCH_DOCUMENT_TABLE = 'facilities_facilitysearchdocument'
+SQLITE_FTS_TABLE = 'facilities_facilitysearch_fts'
+POSTGRES_GIN_INDEX = 'facility_search_content_gin'
+LANGUAGES = ('uz', 'ru')
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {POSTGRES_GIN_INDEX} ON {SEARCH_DOCUMENT_TABLE} USING GIN (to_tsvector('simple', content))"
+        )
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_FTS_TABLE} USING fts5("
+            f"content, content='{SEARCH_DOCUMENT_TABLE}', content_rowid='facility_id', tokenize='unicode61 remove_diacritics 2')"
+        )
+        schema_editor.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {SQLITE_FTS_TABLE}_ai AFTER INSERT ON {SEARCH_DOCUMENT_TABLE} BEGIN "
+            f"INSERT INTO {SQLITE_FTS_TABLE}(rowid, content) VALUES (new.facility_id, new.content); END"
+        )
+        schema_editor.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {SQLITE_FTS_TABLE}_ad AFTER DELETE ON {SEARCH_DOCUMENT_TABLE} BEGIN "
+            f"INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}, rowid, content) VALUES ('delete', old.facility_id, old.content); END"
+        )
+        schema_editor.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {SQLITE_FTS_TABLE}_au AFTER UPDATE ON {SEARCH_DOCUMENT_TABLE} BEGIN "
+            f"INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}, rowid, content) VALUES ('delete', old.facility_id, old.content); "
+            f"INSERT INTO {SQLITE_FTS_TABLE}(rowid, content) VALUES (new.facility_id, new.content); END"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(f"DROP INDEX IF EXISTS {POSTGRES_GIN_INDEX}")
+    elif vendor == 'sqlite':
+        for suffix in ('ai', 'ad', 'au'):
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS {SQLITE_FTS_TABLE}_{suffix}")
+        schema_editor.execute(f"DROP TABLE IF EXISTS {SQLITE_FTS_TABLE}")
+
+
+def _translated_values(instance, field_name):
+    return [getattr(instance, name, None) or '' for name in [field_name] + [f"{field_name}_{language}" for language in LANGUAGES]]
+
+
+def backfill_search_documents(apps, schema_editor):
+    Facility = apps.get_model('facilities', 'Facility')
+    FacilitySearchDocument = apps.get_model('facilities', 'FacilitySearchDocument')
+    documents = []
+    for facility in Facility.objects.select_related('university').iterator(chunk_size=500):
+        values = _translated_values(facility, 'name') + _translated_values(facility, 'description')
+        values += _translated_values(facility.university, 'name') + _translated_values(facility.university, 'city')
+        content = '\n'.join(dict.fromkeys(value.strip().lower() for value in values if value and value.strip()))
+        documents.append(FacilitySearchDocument(facility_id=facility.pk, content=content))
+    FacilitySearchDocument.objects.bulk_create(documents, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('facilities', '0013_cursor_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FacilitySearchDocument',
+            fields=[
+                ('facility', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='facilities.facility', verbose_name='Объект')),
+                ('content', models.TextField(blank=True, verbose_name='Текст для поиска')),
+            ],
+            options={
+                'verbose_name': 'Поисковый документ объекта',
+                'verbose_name_plural': 'Поисковые документы объектов',
+            },
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+        migrations.RunPython(backfill_search_documents, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2 on 2026-10-18 11:34
+
+from django.db import migrations, models
+
+BOOKING_TYPE_EXCLUSIVE = 'exclusive_slot'
+
+
+def backfill_is_exclusive(apps, schema_editor):
+    """
+    Помечает занятость эксклюзивных объектов. Если слот уже занят несколькими заказами (двойная бронь
+    до появления ограничения), эксклюзивной помечается только строка самого раннего заказа —
+    иначе уникальное ограничение не создастся; остальные строки продолжают считаться конфликтом.
+    """
+    SlotOccupancy = apps.get_model('facilities', 'SlotOccupancy')
+    seen_slots, exclusive_ids = set(), []
+    occupancy_rows = SlotOccupancy.objects.filter(facility__booking_type=BOOKING_TYPE_EXCLUSIVE).order_by('order_id', 'id')
+    for row_id, facility_id, slot_date, slot_time in occupancy_rows.values_list('id', 'facility_id', 'date', 'start_time').iterator(chunk_size=5000):
+        if (facility_id, slot_date, slot_time) in seen_slots: continue
+        seen_slots.add((facility_id, slot_date, slot_time))
+        exclusive_ids.append(row_id)
+        if len(exclusive_ids) >= 5000:
+            SlotOccupancy.objects.filter(id__in=exclusive_ids).update(is_exclusive=True); exclusive_ids = []
+    if exclusive_ids:
+        SlotOccupancy.objects.filter(id__in=exclusive_ids).update(is_exclusive=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('facilities', '0014_facilitysearchdocument'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='slotoccupancy',
+            name='is_exclusive',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Эксклюзивный слот'),
+        ),
+        migrations.RunPython(backfill_is_exclusive, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='slotoccupancy',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_exclusive', True)), fields=('facility', 'date', 'start_time'), name='unique_exclusive_slot_occupancy'),
+        ),
+    ]
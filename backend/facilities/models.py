@@ -1,7 +1,9 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.utils.translation import gettext_lazy as _
+from django.utils import timezone
 from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
+from collections import defaultdict
 from datetime import time
 
 # Импортируем модели из других приложений правильно
@@ -23,6 +25,8 @@ except ImportError:
     USER_IMPORTED = False
     print("Warning [facilities.models]: Could not import User model via settings.AUTH_USER_MODEL.")
 
+from .availability_cache import invalidate_availability_cache
+
 
 # CHOICES для дней недели (число -> отображаемое имя)
 # Используется для удобства в коде и для генерации виджета в админке
@@ -166,6 +170,12 @@ class Facility(models.Model):
         verbose_name = _("Спортивный объект")
         verbose_name_plural = _("Спортивные объекты")
         ordering = ['university', 'name']
+        # Курсорная пагинация каталога (core.pagination): ORDER BY name, id по колонке текущего языка.
+        # Имена заданы явно: поля name_uz/name_ru добавляет modeltranslation уже после создания класса
+        indexes = [
+            models.Index(fields=['name_uz', 'id'], name='facility_name_uz_id_idx'),
+            models.Index(fields=['name_ru', 'id'], name='facility_name_ru_id_idx'),
+        ]
 
     def __str__(self):
         uni_name = self.university.short_name or self.university.name if self.university else 'N/A'
@@ -238,4 +248,166 @@ class FacilityImage(models.Model):
 
     def __str__(self):
         facility_name = self.facility.name if self.facility else 'N/A'
-        return f"Image for {facility_name} ({self.id})"
\ No newline at end of file
+        return f"Image for {facility_name} ({self.id})"
+
+class SlotAlreadyOccupied(IntegrityError):
+    """ Эксклюзивный слот уже занят другим заказом (нарушено unique_exclusive_slot_occupancy). """
+
+
+class SlotOccupancyManager(models.Manager):
+    def sync_for_order(self, order) -> None:
+        """
+        Пересобирает строки занятости для заказа.
+        Строки существуют только пока заказ создает конфликт (Order.STATUS_CREATES_CONFLICT).
+        """
+        old_rows = list(self.filter(order_id=order.pk).values_list('facility_id', 'date').distinct())
+        if old_rows:
+            self.filter(order_id=order.pk).delete()
+        rows = []
+        if order.status in order.STATUS_CREATES_CONFLICT:
+            is_exclusive = order.facility.booking_type == Facility.BOOKING_TYPE_EXCLUSIVE
+            rows = [
+                self.model(facility_id=order.facility_id, order_id=order.pk, date=slot_date, start_time=slot_time, is_exclusive=is_exclusive)
+                for slot_date, slot_time in order.iter_occupied_slots()
+            ]
+        if rows:
+            try:
+                with transaction.atomic(): # Точка сохранения: после ошибки транзакцию вызывающего кода можно использовать
+                    self.bulk_create(rows, batch_size=1000)
+            except IntegrityError as e:
+                # Конфликтом слота считается только занятость тех же слотов другим заказом; прочие ошибки — как есть
+                requested_slots = {(row.date, row.start_time) for row in rows}
+                occupied_slots = set(self.filter(
+                    facility_id=order.facility_id, is_exclusive=True, date__in={slot_date for slot_date, _slot_time in requested_slots}
+                ).exclude(order_id=order.pk).values_list('date', 'start_time'))
+                if is_exclusive and requested_slots & occupied_slots:
+                    raise SlotAlreadyOccupied(str(e)) from e
+                raise
+        # Точечная инвалидация кэша доступности по старым и новым датам заказа
+        affected_dates = defaultdict(set)
+        for facility_id, slot_date in old_rows: affected_dates[facility_id].add(slot_date)
+        for row in rows: affected_dates[row.facility_id].add(row.date)
+        for facility_id, dates in affected_dates.items():
+            invalidate_availability_cache(facility_id, dates)
+
+
+class SlotOccupancy(models.Model):
+    """
+    Материализованная занятость объекта: одна строка на (заказ, дата, время начала слота).
+    Позволяет считать конфликты одним индексированным запросом вместо разбора всех заказов в Python.
+    """
+    facility = models.ForeignKey(
+        Facility,
+        on_delete=models.CASCADE,
+        related_name='slot_occupancies',
+        verbose_name=_("Объект")
+    )
+    order = models.ForeignKey(
+        'bookings.Order',
+        on_delete=models.CASCADE,
+        related_name='slot_occupancies',
+        verbose_name=_("Заказ")
+    )
+    date = models.DateField(_("Дата"))
+    start_time = models.TimeField(
+        _("Время начала слота"),
+        null=True, blank=True,
+        help_text=_("Пусто — заказ занимает весь день (оплата за вход).")
+    )
+    # Тип объекта на момент заказа. Для эксклюзивных объектов БД сама не даст двум заказам занять
+    # один слот (unique_exclusive_slot_occupancy) — страховка поверх блокировки FacilityDayLedger,
+    # которая работает и там, где нет SELECT ... FOR UPDATE (SQLite).
+    is_exclusive = models.BooleanField(_("Эксклюзивный слот"), default=False, editable=False)
+
+    objects = SlotOccupancyManager()
+
+    class Meta:
+        verbose_name = _("Занятость слота")
+        verbose_name_plural = _("Занятость слотов")
+        indexes = [
+            models.Index(fields=['facility', 'date', 'start_time']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['order', 'date', 'start_time'], name='unique_slot_occupancy_per_order'),
+            models.UniqueConstraint(
+                fields=['facility', 'date', 'start_time'], condition=models.Q(is_exclusive=True),
+                name='unique_exclusive_slot_occupancy'
+            ),
+        ]
+
+    def __str__(self):
+        time_str = self.start_time.strftime('%H:%M') if self.start_time else _("весь день")
+        return f"{self.facility_id} {self.date} {time_str} (Заказ {self.order_id})"
+
+
+class FacilityDayLedgerManager(models.Manager):
+    def lock_dates(self, facility_id, dates) -> list:
+        """
+        Блокирует (SELECT ... FOR UPDATE) строки журнала объекта на указанные даты, создавая недостающие.
+        Вызывать внутри transaction.atomic(): блокировка держится до конца транзакции,
+        поэтому проверка конфликтов и создание заказа на эти даты выполняются последовательно.
+        Даты блокируются в порядке возрастания, чтобы параллельные заказы не попадали в deadlock.
+        """
+        dates = sorted(set(dates))
+        if not dates:
+            return []
+        self.bulk_create(
+            [self.model(facility_id=facility_id, date=ledger_date) for ledger_date in dates],
+            ignore_conflicts=True, batch_size=1000
+        )
+        return list(self.select_for_update().filter(facility_id=facility_id, date__in=dates).order_by('date'))
+
+    def purge_past(self, today=None) -> int:
+        """ Удаляет строки за прошедшие даты: заказы на них не оформляются, блокировать нечего. """
+        today = today or timezone.localdate()
+        deleted_count, _deleted_by_model = self.filter(date__lt=today).delete()
+        return deleted_count
+
+
+class FacilityDayLedger(models.Model):
+    """
+    Журнал объекта на дату: одна строка на (объект, дата), используется как точка блокировки
+    при оформлении заказа. Заказы на разные объекты и даты не блокируют друг друга.
+    """
+    facility = models.ForeignKey(
+        Facility,
+        on_delete=models.CASCADE,
+        related_name='day_ledgers',
+        verbose_name=_("Объект")
+    )
+    date = models.DateField(_("Дата"))
+
+    objects = FacilityDayLedgerManager()
+
+    class Meta:
+        verbose_name = _("Журнал объекта на дату")
+        verbose_name_plural = _("Журналы объектов на дату")
+        constraints = [
+            models.UniqueConstraint(fields=['facility', 'date'], name='unique_facility_day_ledger'),
+        ]
+
+    def __str__(self):
+        return f"{self.facility_id} {self.date}"
+
+
+class FacilitySearchDocument(models.Model):
+    """
+    Текст объекта для полнотекстового поиска каталога (facilities.search): все языковые варианты
+    названия и описания объекта, названия и города ВУЗа. Поисковый индекс над content создает миграция
+    отдельно для PostgreSQL (GIN по tsvector) и SQLite (FTS5), поэтому в Meta его нет.
+    """
+    facility = models.OneToOneField(
+        Facility,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='search_document',
+        verbose_name=_("Объект")
+    )
+    content = models.TextField(_("Текст для поиска"), blank=True)
+
+    class Meta:
+        verbose_name = _("Поисковый документ объекта")
+        verbose_name_plural = _("Поисковые документы объектов")
+
+    def __str__(self):
+        return f"{self.facility_id}"
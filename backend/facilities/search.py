@@ -0,0 +1,107 @@
+# facilities/search.py
+"""
+Полнотекстовый поиск по каталогу объектов.
+
+Для каждого объекта хранится FacilitySearchDocument.content — все языковые варианты (modeltranslation)
+названия и описания объекта, названия и города его ВУЗа одной колонкой. Индекс строит сама БД
+(миграция 0014_facilitysearchdocument, там же заполнение документов для существующих объектов):
+- PostgreSQL: GIN-индекс по выражению to_tsvector('simple', content), ранжирование ts_rank;
+- SQLite: FTS5-таблица над content (external content), синхронизируется триггерами, ранжирование bm25.
+На других БД search_facility_ids возвращает None, и фильтр остается на icontains из search_fields.
+
+Конфигурация 'simple' (без стемминга): словаря для узбекского в PostgreSQL нет, а текст смешанный.
+Каждое слово запроса ищется как префикс, все слова обязательны. Выдача ограничена
+FACILITY_SEARCH_MAX_RESULTS самыми релевантными объектами; об усечении фильтр каталога
+сообщает полем search_truncated (facilities.filters.FacilityFullTextSearchFilter).
+
+Документы обновляются сигналами (facilities.signals) при сохранении Facility и University;
+после массовых update() и для заполнения с нуля — команда rebuild_facility_search.
+"""
+import re
+from typing import Iterable, List, Optional
+
+from django.conf import settings
+from django.db import connection
+from modeltranslation import settings as mt_settings
+from modeltranslation.utils import build_localized_fieldname
+
+FACILITY_SEARCH_FIELDS = ('name', 'description')
+UNIVERSITY_SEARCH_FIELDS = ('name', 'city')
+
+SEARCH_DOCUMENT_TABLE = 'facilities_facilitysearchdocument'
+SQLITE_FTS_TABLE = 'facilities_facilitysearch_fts'
+MAX_QUERY_TERMS = 8 # Лишние слова запроса отбрасываются — длинный запрос не должен строить огромный MATCH
+
+
+def _translated_values(instance, field_name: str) -> List[str]:
+    """ Исходное поле и все его языковые колонки (работает и с историческими моделями миграций). """
+    field_names = [field_name] + [build_localized_fieldname(field_name, language) for language in mt_settings.AVAILABLE_LANGUAGES]
+    return [getattr(instance, name, None) or '' for name in field_names]
+
+
+def build_search_content(facility, university) -> str:
+    """ Текст документа: уникальные непустые значения в нижнем регистре, по строке на значение. """
+    values = []
+    for field_name in FACILITY_SEARCH_FIELDS: values += _translated_values(facility, field_name)
+    if university is not None:
+        for field_name in UNIVERSITY_SEARCH_FIELDS: values += _translated_values(university, field_name)
+    unique_values = dict.fromkeys(value.strip().lower() for value in values if value and value.strip())
+    return '\n'.join(unique_values)
+
+
+def refresh_facility_search_documents(facilities: Iterable) -> int:
+    """ Пересобирает документы объектов одним upsert. Объекты должны быть с select_related('university'). """
+    from .models import FacilitySearchDocument
+    documents = [
+        FacilitySearchDocument(facility_id=facility.pk, content=build_search_content(facility, facility.university))
+        for facility in facilities
+    ]
+    if documents:
+        # ON CONFLICT DO UPDATE: на SQLite срабатывает UPDATE-триггер, и FTS5-таблица обновляется вместе с документом
+        FacilitySearchDocument.objects.bulk_create(
+            documents, update_conflicts=True, unique_fields=['facility'], update_fields=['content'], batch_size=500
+        )
+    return len(documents)
+
+
+def refresh_university_search_documents(university_id: int) -> int:
+    """ Название/город ВУЗа входят в документы всех его объектов. """
+    from .models import Facility
+    return refresh_facility_search_documents(Facility.objects.filter(university_id=university_id).select_related('university'))
+
+
+def get_query_terms(query: str) -> List[str]:
+    # Только буквенно-цифровые слова: спецсимволы синтаксиса tsquery/FTS5 в запрос не попадают
+    return re.findall(r'\w+', (query or '').lower())[:MAX_QUERY_TERMS]
+
+
+def search_facility_ids(query: str, limit: Optional[int] = None) -> Optional[List[int]]:
+    """
+    id объектов, подходящих под запрос, от более релевантных к менее (не больше limit).
+    None — БД без поискового индекса (вызывающий код использует обычный icontains).
+    """
+    terms = get_query_terms(query)
+    if not terms:
+        return []
+    limit = limit or getattr(settings, 'FACILITY_SEARCH_MAX_RESULTS', 500)
+    if connection.vendor == 'postgresql':
+        ts_query = ' & '.join(f"{term}:*" for term in terms)
+        sql = (
+            f"SELECT facility_id FROM {SEARCH_DOCUMENT_TABLE} "
+            f"WHERE to_tsvector('simple', content) @@ to_tsquery('simple', %s) "
+            f"ORDER BY ts_rank(to_tsvector('simple', content), to_tsquery('simple', %s)) DESC, facility_id LIMIT %s"
+        )
+        params = [ts_query, ts_query, limit]
+    elif connection.vendor == 'sqlite':
+        match_query = ' '.join(f'"{term}"*' for term in terms)
+        sql = (
+            f"SELECT rowid FROM {SQLITE_FTS_TABLE} WHERE {SQLITE_FTS_TABLE} MATCH %s "
+            f"ORDER BY bm25({SQLITE_FTS_TABLE}), rowid LIMIT %s"
+        )
+        params = [match_query, limit]
+    else:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
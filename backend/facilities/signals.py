@@ -0,0 +1,42 @@
+# facilities/signals.py
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from core.cache import invalidate_catalog_cache, CATALOG_FACILITIES, CATALOG_UNIVERSITIES, CATALOG_AMENITIES
+from universities.models import University
+from .models import Facility, FacilityImage, Amenity
+from .search import refresh_facility_search_documents, refresh_university_search_documents
+
+
+@receiver([post_save, post_delete], sender=Facility)
+def invalidate_catalog_on_facility_change(sender, instance, **kwargs):
+    # Детали университета содержат счетчики объектов
+    invalidate_catalog_cache(CATALOG_FACILITIES, CATALOG_UNIVERSITIES)
+
+
+@receiver(post_save, sender=Facility)
+def refresh_search_document_on_facility_save(sender, instance, raw=False, **kwargs):
+    # Удаление документа — каскадом вместе с объектом
+    if not raw: refresh_facility_search_documents([instance])
+
+
+@receiver(post_save, sender=University)
+def refresh_search_documents_on_university_save(sender, instance, raw=False, **kwargs):
+    # Название и город ВУЗа входят в поисковые документы его объектов
+    if not raw: refresh_university_search_documents(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=FacilityImage)
+def invalidate_catalog_on_facility_image_change(sender, instance, **kwargs):
+    invalidate_catalog_cache(CATALOG_FACILITIES)
+
+
+@receiver([post_save, post_delete], sender=Amenity)
+def invalidate_catalog_on_amenity_change(sender, instance, **kwargs):
+    invalidate_catalog_cache(CATALOG_AMENITIES, CATALOG_FACILITIES)
+
+
+@receiver(m2m_changed, sender=Facility.amenities.through)
+def invalidate_catalog_on_facility_amenities_change(sender, instance, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_catalog_cache(CATALOG_FACILITIES)
@@ -1,15 +1,26 @@
-from django.test import TestCase
-from django.utils import timezone
+from django.test import TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils import timezone, translation
+from django.urls import reverse
 from django.conf import settings
 from datetime import datetime, time, date as dt_date, timedelta
+import base64
+import json
+import os
 import uuid
+import threading
+from unittest import mock
+
+from rest_framework.test import APIClient
 
 from core.models import User
 from universities.models import University
-from .models import Facility, Amenity
-from bookings.models import SlotBooking, Subscription, PaymentTransaction
+from .models import Facility, Amenity, SlotOccupancy, SlotAlreadyOccupied, FacilityDayLedger, FacilitySearchDocument
+from bookings.models import Order
 
-from .availability_checker import get_detailed_availability, REASON_AVAILABLE, REASON_CLOSED_DAY, REASON_CLOSED_TIME, REASON_LEAD_TIME_RESTRICTION, REASON_FULLY_BOOKED_EXCLUSIVE, REASON_MAX_CAPACITY_REACHED, REASON_FACILITY_MISCONFIGURED_CAPACITY
+from .availability_checker import FacilityAvailabilityService, get_detailed_availability, REASON_AVAILABLE, REASON_CLOSED_DAY, REASON_CLOSED_TIME, REASON_LEAD_TIME_RESTRICTION, REASON_FULLY_BOOKED_EXCLUSIVE, REASON_MAX_CAPACITY_REACHED, REASON_FACILITY_MISCONFIGURED_CAPACITY
 
 
 class AvailabilityCheckerTests(TestCase):
@@ -66,43 +77,49 @@ class AvailabilityCheckerTests(TestCase):
         if cls.next_monday <= cls.today : cls.next_monday += timedelta(days=7)
 
 
-        SlotBooking.objects.create(
+        Order.objects.create(
+            order_type=Order.TYPE_SLOT_BOOKING,
             user=cls.user1,
             facility=cls.facility_exclusive,
             booking_date=cls.tomorrow,
             slots=[{"start_time": "10:00", "end_time": "11:00"}],
             total_price=10000,
-            status='confirmed'
+            status=Order.STATUS_CONFIRMED
         )
 
-        Subscription.objects.create(
+        Order.objects.create(
+            order_type=Order.TYPE_SUBSCRIPTION,
             user=cls.user2,
             facility=cls.facility_exclusive,
-            start_date=cls.tomorrow,
-            end_date=cls.tomorrow + timedelta(days=28),
+            subscription_start_date=cls.tomorrow,
+            subscription_end_date=cls.tomorrow + timedelta(days=28),
             days_of_week=str(cls.tomorrow.weekday()),
-            start_times="14:00",
+            subscription_times="14:00",
             total_price=40000,
-            status='active'
+            status=Order.STATUS_CONFIRMED
         )
         
-        SlotBooking.objects.create(
+        Order.objects.create(
+            order_type=Order.TYPE_SLOT_BOOKING,
             user=cls.user1, facility=cls.facility_overlapping, booking_date=cls.next_monday,
-            slots=[{"start_time": "10:00", "end_time": "11:00"}], total_price=5000, status='confirmed'
+            slots=[{"start_time": "10:00", "end_time": "11:00"}], total_price=5000, status=Order.STATUS_CONFIRMED
         )
-        SlotBooking.objects.create(
+        Order.objects.create(
+            order_type=Order.TYPE_SLOT_BOOKING,
             user=cls.user2, facility=cls.facility_overlapping, booking_date=cls.next_monday,
-            slots=[{"start_time": "10:00", "end_time": "11:00"}], total_price=5000, status='confirmed'
+            slots=[{"start_time": "10:00", "end_time": "11:00"}], total_price=5000, status=Order.STATUS_CONFIRMED
         )
-        Subscription.objects.create(
+        Order.objects.create(
+            order_type=Order.TYPE_SUBSCRIPTION,
             user=cls.user1, facility=cls.facility_overlapping,
-            start_date=cls.next_monday, end_date=cls.next_monday + timedelta(days=28),
+            subscription_start_date=cls.next_monday, subscription_end_date=cls.next_monday + timedelta(days=28),
             days_of_week=str(cls.next_monday.weekday()),
-            start_times="10:00", total_price=20000, status='active'
+            subscription_times="10:00", total_price=20000, status=Order.STATUS_CONFIRMED
         )
-        SlotBooking.objects.create(
+        Order.objects.create(
+            order_type=Order.TYPE_SLOT_BOOKING,
             user=cls.user1, facility=cls.facility_overlapping, booking_date=cls.next_monday,
-            slots=[{"start_time": "12:00", "end_time": "13:00"}], total_price=5000, status='confirmed'
+            slots=[{"start_time": "12:00", "end_time": "13:00"}], total_price=5000, status=Order.STATUS_CONFIRMED
         )
 
     def _get_aware_datetime(self, date_obj, time_obj):
@@ -240,9 +257,10 @@ class AvailabilityCheckerTests(TestCase):
 
 
     def test_available_when_conflicting_slotbooking_is_excluded(self):
-        conflicting_sb = SlotBooking.objects.create(
+        conflicting_sb = Order.objects.create(
+            order_type=Order.TYPE_SLOT_BOOKING,
             user=self.user1, facility=self.facility_exclusive, booking_date=self.tomorrow,
-            slots=[{"start_time": "16:00", "end_time": "17:00"}], total_price=10000, status='confirmed'
+            slots=[{"start_time": "16:00", "end_time": "17:00"}], total_price=10000, status=Order.STATUS_CONFIRMED
         )
         check_dt_start = self._get_aware_datetime(self.tomorrow, time(16, 0))
         
@@ -251,17 +269,18 @@ class AvailabilityCheckerTests(TestCase):
 
         result_after_exclude = get_detailed_availability(
             self.facility_exclusive, check_dt_start,
-            exclude_slot_booking_id=conflicting_sb.id
+            exclude_order_id=conflicting_sb.id
         )
         self.assertTrue(result_after_exclude["is_available"])
         self.assertEqual(result_after_exclude["booked_slots_count"], 0)
 
     def test_available_when_conflicting_subscription_is_excluded(self):
-        conflicting_sub = Subscription.objects.create(
+        conflicting_sub = Order.objects.create(
+            order_type=Order.TYPE_SUBSCRIPTION,
             user=self.user2, facility=self.facility_exclusive,
-            start_date=self.tomorrow, end_date=self.tomorrow + timedelta(days=7),
-            days_of_week=str(self.tomorrow.weekday()), start_times="17:00",
-            total_price=10000, status='active'
+            subscription_start_date=self.tomorrow, subscription_end_date=self.tomorrow + timedelta(days=7),
+            days_of_week=str(self.tomorrow.weekday()), subscription_times="17:00",
+            total_price=10000, status=Order.STATUS_CONFIRMED
         )
         check_dt_start = self._get_aware_datetime(self.tomorrow, time(17, 0))
 
@@ -270,7 +289,7 @@ class AvailabilityCheckerTests(TestCase):
 
         result_after_exclude = get_detailed_availability(
             self.facility_exclusive, check_dt_start,
-            exclude_subscription_id=conflicting_sub.id
+            exclude_order_id=conflicting_sub.id
         )
         self.assertTrue(result_after_exclude["is_available"])
         self.assertEqual(result_after_exclude["booked_slots_count"], 0)
@@ -327,19 +346,21 @@ class ComprehensiveSubscriptionAvailabilityTests(TestCase):
         if cls.next_tuesday_for_sub <= cls.today_for_sub_tests: cls.next_tuesday_for_sub += timedelta(days=7)
 
         # Конфликт для exclusive: Пн (0), 10:00
-        SlotBooking.objects.create(
+        Order.objects.create(
+            order_type=Order.TYPE_SLOT_BOOKING,
             user=cls.user, facility=cls.facility_exclusive_for_sub,
             booking_date=cls.next_monday_for_sub, 
             slots=[{"start_time": "10:00", "end_time": "11:00"}],
-            total_price=12000, status='confirmed'
+            total_price=12000, status=Order.STATUS_CONFIRMED
         )
         # Конфликт для overlapping: Вт (1), 11:00 - 1 место занято
-        Subscription.objects.create(
+        Order.objects.create(
+            order_type=Order.TYPE_SUBSCRIPTION,
             user=cls.user, facility=cls.facility_overlapping_for_sub,
-            start_date=cls.today_for_sub_tests, # Действует с "сегодня"
-            end_date=cls.today_for_sub_tests + timedelta(days=30),
+            subscription_start_date=cls.today_for_sub_tests, # Действует с "сегодня"
+            subscription_end_date=cls.today_for_sub_tests + timedelta(days=30),
             days_of_week="1", # Вторник
-            start_times="11:00", total_price=10000, status='active'
+            subscription_times="11:00", total_price=10000, status=Order.STATUS_CONFIRMED
         )
 
     def test_entry_fee_facility_no_subscription_matrix(self):
@@ -387,11 +408,12 @@ class ComprehensiveSubscriptionAvailabilityTests(TestCase):
         self.assertEqual(matrix["1"]["11:00"]["available_spots_for_subscription"], 1) # Ожидаем 1, т.к. 1 уже занято
         
         # Добавим еще одну бронь на Вт 11:00, чтобы полностью занять слот
-        SlotBooking.objects.create(
+        Order.objects.create(
+            order_type=Order.TYPE_SLOT_BOOKING,
             user=self.user, facility=self.facility_overlapping_for_sub,
             booking_date=self.next_tuesday_for_sub, # Убедимся, что это правильный вторник
             slots=[{"start_time": "11:00", "end_time": "12:00"}],
-            total_price=6000, status='confirmed'
+            total_price=6000, status=Order.STATUS_CONFIRMED
         )
         response_after_booking = self.client.get(f'/ru/api/catalog/facilities/{self.facility_overlapping_for_sub.id}/comprehensive-subscription-availability/')
         matrix_after_booking = response_after_booking.data.get('availability_matrix', {})
@@ -411,4 +433,595 @@ class ComprehensiveSubscriptionAvailabilityTests(TestCase):
 
         # Пт (4) - нерабочий
         self.assertIn("4", matrix)
-        self.assertEqual(matrix["4"], {})
\ No newline at end of file
+        self.assertEqual(matrix["4"], {})
+
+class SlotOccupancyTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        from bookings.models import Order
+        cls.Order = Order
+        cls.user = User.objects.create_user(email='occupancy@example.com', password='password', first_name='Occ', last_name='User', username='occupancyuser')
+        cls.university = University.objects.create(name="Occupancy University", city="Occupancy City")
+        cls.facility = Facility.objects.create(
+            name="Occupancy Court", university=cls.university, facility_type=Facility.TYPE_TENNIS,
+            price_per_hour=10000, open_time=time(8, 0), close_time=time(22, 0),
+            working_days="0,1,2,3,4,5,6", booking_type=Facility.BOOKING_TYPE_OVERLAPPING, max_capacity=3,
+        )
+        cls.tomorrow = timezone.localdate() + timedelta(days=1)
+
+    def _create_slot_order(self, slots, status=None):
+        return self.Order.objects.create(
+            user=self.user, facility=self.facility, order_type=self.Order.TYPE_SLOT_BOOKING,
+            status=status or self.Order.STATUS_CONFIRMED, total_price=10000, booking_date=self.tomorrow,
+            slots=[{"start_time": s, "end_time": "00:00"} for s in slots],
+        )
+
+    def _aware(self, date_obj, time_obj):
+        return timezone.make_aware(datetime.combine(date_obj, time_obj), timezone.get_current_timezone())
+
+    def test_slot_booking_materialises_occupancy(self):
+        order = self._create_slot_order(["10:00", "11:00", "10:00"])
+        self.assertEqual(
+            set(SlotOccupancy.objects.filter(order=order).values_list('date', 'start_time')),
+            {(self.tomorrow, time(10, 0)), (self.tomorrow, time(11, 0))},
+        )
+
+    def test_status_transition_releases_occupancy(self):
+        order = self._create_slot_order(["10:00"], status=self.Order.STATUS_PENDING_PAYMENT)
+        self.assertTrue(SlotOccupancy.objects.filter(order=order).exists())
+        order.status = self.Order.STATUS_PAYMENT_FAILED
+        order.save(update_fields=['status', 'updated_at'])
+        self.assertFalse(SlotOccupancy.objects.filter(order=order).exists())
+
+    def test_subscription_expands_to_matching_weekdays(self):
+        order = self.Order.objects.create(
+            user=self.user, facility=self.facility, order_type=self.Order.TYPE_SUBSCRIPTION,
+            status=self.Order.STATUS_CONFIRMED, total_price=10000,
+            subscription_start_date=self.tomorrow, subscription_end_date=self.tomorrow + timedelta(days=13),
+            days_of_week=str(self.tomorrow.weekday()), subscription_times="18:00,19:00",
+        )
+        self.assertEqual(SlotOccupancy.objects.filter(order=order).count(), 4)
+
+    def test_availability_counts_occupancy_with_single_query(self):
+        self._create_slot_order(["10:00"])
+        self._create_slot_order(["10:00"])
+        other = self._create_slot_order(["10:00"], status=self.Order.STATUS_CANCELLED_USER)
+        service = FacilityAvailabilityService(self.facility, request_time=timezone.now())
+        with self.assertNumQueries(1):
+            result = service.check_slot_availability(self._aware(self.tomorrow, time(10, 0)))
+        self.assertEqual(result["booked_slots_count"], 2)
+        self.assertEqual(result["available_spots"], 1)
+        excluded = service.check_slot_availability(
+            self._aware(self.tomorrow, time(10, 0)),
+            exclude_order_id=self.Order.objects.exclude(pk=other.pk).first().pk,
+        )
+        self.assertEqual(excluded["booked_slots_count"], 1)
+
+    def test_check_range_day_view_uses_single_query(self):
+        self._create_slot_order(["10:00", "11:00"])
+        self._create_slot_order(["10:00"])
+        service = FacilityAvailabilityService(self.facility, request_time=timezone.now())
+        hours = [time(h, 0) for h in range(8, 22)]
+        with self.assertNumQueries(1):
+            results = service.check_range(self.tomorrow, self.tomorrow, hours)
+        self.assertEqual(len(results), len(hours))
+        self.assertEqual(results[(self.tomorrow, time(10, 0))]["booked_slots_count"], 2)
+        self.assertEqual(results[(self.tomorrow, time(11, 0))]["available_spots"], 2)
+        for slot_time in hours:
+            self.assertEqual(
+                results[(self.tomorrow, slot_time)],
+                service.check_slot_availability(self._aware(self.tomorrow, slot_time)),
+            )
+
+    def test_check_order_conflicts_reports_full_slot(self):
+        from bookings.order_utils import check_order_conflicts
+        for _i in range(3):
+            self._create_slot_order(["12:00"])
+        conflict = check_order_conflicts(
+            self.facility, self.Order.TYPE_SLOT_BOOKING,
+            {"date": self.tomorrow.isoformat(), "slots": ["11:00", "12:00"]},
+        )
+        self.assertIn("12:00", str(conflict))
+        self.assertIsNone(check_order_conflicts(
+            self.facility, self.Order.TYPE_SLOT_BOOKING,
+            {"date": self.tomorrow.isoformat(), "slots": ["11:00"]},
+        ))
+
+    def test_bulk_subscription_conflicts_match_per_slot_checks(self):
+        self.facility.working_days = "0,1,2,3,4"
+        self.facility.save(update_fields=['working_days'])
+        for _i in range(3):
+            self._create_slot_order(["18:00"])
+        self.Order.objects.create(
+            user=self.user, facility=self.facility, order_type=self.Order.TYPE_SUBSCRIPTION,
+            status=self.Order.STATUS_CONFIRMED, total_price=10000,
+            subscription_start_date=self.tomorrow, subscription_end_date=self.tomorrow + timedelta(days=30),
+            days_of_week="0,1,2,3,4,5,6", subscription_times="19:00,20:00",
+        )
+        request_time = timezone.localtime(timezone.now())
+        service = FacilityAvailabilityService(self.facility, request_time=request_time)
+        start_date, end_date = timezone.localdate(), timezone.localdate() + timedelta(days=60)
+        days, times = [0, 2, 5, 6], [time(21, 0), time(18, 0), time(7, 0), time(19, 0)]
+        with self.assertNumQueries(1):
+            conflicts = service.find_subscription_conflicts(start_date, end_date, days, times, first_only=False)
+        expected = []
+        current_date = start_date
+        while current_date <= end_date:
+            if current_date.weekday() in days:
+                for slot_time in times:
+                    result = service.check_slot_availability(self._aware(current_date, slot_time))
+                    if not result["is_available"]: expected.append((current_date, slot_time, result))
+            current_date += timedelta(days=1)
+        self.assertEqual(conflicts, expected)
+        self.assertEqual(service.find_subscription_conflicts(start_date, end_date, days, times), expected[:1])
+
+    def test_list_order_conflicts_returns_all_subscription_messages(self):
+        from bookings.order_utils import check_order_conflicts, list_order_conflicts
+        for _i in range(3):
+            self._create_slot_order(["12:00"])
+        params = {
+            "start_date": self.tomorrow.isoformat(), "end_date": (self.tomorrow + timedelta(days=14)).isoformat(),
+            "days_of_week": [self.tomorrow.weekday()], "start_times": ["11:00", "12:00"],
+        }
+        messages = list_order_conflicts(self.facility, self.Order.TYPE_SUBSCRIPTION, params)
+        self.assertEqual(len(messages), 1)
+        self.assertIn(self.tomorrow.strftime('%d.%m.%Y'), str(messages[0]))
+        self.assertEqual(check_order_conflicts(self.facility, self.Order.TYPE_SUBSCRIPTION, params), messages[0])
+
+    def test_order_slots_normalise_slot_and_subscription_fields(self):
+        from bookings.models import OrderSlot
+        slot_order = self.Order.objects.create(
+            user=self.user, facility=self.facility, order_type=self.Order.TYPE_SLOT_BOOKING,
+            status=self.Order.STATUS_CONFIRMED, total_price=10000, booking_date=self.tomorrow,
+            slots=[{"start_time": "11:00", "end_time": "12:00"}, {"start_time": "10:00", "end_time": "11:00"}],
+        )
+        self.assertEqual(
+            list(OrderSlot.objects.filter(order=slot_order).values_list('date', 'weekday', 'start_time')),
+            [(self.tomorrow, None, time(10, 0)), (self.tomorrow, None, time(11, 0))],
+        )
+        subscription = self.Order.objects.create(
+            user=self.user, facility=self.facility, order_type=self.Order.TYPE_SUBSCRIPTION,
+            status=self.Order.STATUS_CONFIRMED, total_price=10000, duration_per_slot_hours=2,
+            subscription_start_date=self.tomorrow, subscription_end_date=self.tomorrow + timedelta(days=30),
+            days_of_week="1,3", subscription_times="18:00",
+        )
+        self.assertEqual(
+            set(OrderSlot.objects.filter(order=subscription).values_list('weekday', 'start_time', 'duration_hours')),
+            {(1, time(18, 0), 2), (3, time(18, 0), 2)},
+        )
+        subscription.status = self.Order.STATUS_CANCELLED_USER
+        subscription.save(update_fields=['status', 'updated_at'])
+        self.assertEqual(OrderSlot.objects.filter(order=subscription).count(), 2)
+        prefetched = self.Order.objects.prefetch_related('order_slots').get(pk=slot_order.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(prefetched.get_order_slots_display(), "10:00-11:00, 11:00-12:00")
+
+
+class FacilityDayLedgerTests(TransactionTestCase):
+    def setUp(self):
+        from bookings.models import Order
+        self.Order = Order
+        self.university = University.objects.create(name="Ledger University", city="Ledger City")
+        self.facility = Facility.objects.create(
+            name="Ledger Court", university=self.university, facility_type=Facility.TYPE_TENNIS,
+            price_per_hour=10000, open_time=time(8, 0), close_time=time(22, 0),
+            working_days="0,1,2,3,4,5,6", booking_type=Facility.BOOKING_TYPE_EXCLUSIVE,
+        )
+        self.users = [
+            User.objects.create_user(email=f'ledger{i}@example.com', password='password', first_name='Ledger', last_name=str(i), username=f'ledger{i}')
+            for i in range(4)
+        ]
+        self.booking_date = timezone.localdate() + timedelta(days=2)
+
+    def test_lock_dates_creates_missing_rows_once(self):
+        dates = [self.booking_date, self.booking_date + timedelta(days=1), self.booking_date]
+        with transaction.atomic():
+            locked = FacilityDayLedger.objects.lock_dates(self.facility.id, dates)
+        self.assertEqual([row.date for row in locked], sorted(set(dates)))
+        with transaction.atomic():
+            FacilityDayLedger.objects.lock_dates(self.facility.id, dates)
+        self.assertEqual(FacilityDayLedger.objects.filter(facility=self.facility).count(), 2)
+
+    def _create_slot_order(self, user, status=None):
+        return self.Order.objects.create(
+            user=user, facility=self.facility, order_type=self.Order.TYPE_SLOT_BOOKING,
+            status=status or self.Order.STATUS_PENDING_PAYMENT, total_price=10000, booking_date=self.booking_date,
+            slots=[{"start_time": "10:00", "end_time": "11:00"}],
+        )
+
+    def test_exclusive_slot_occupancy_is_unique_without_row_locks(self):
+        # Проверка конфликтов пропущена (как при гонке без SELECT ... FOR UPDATE) — второй заказ отклоняет сама БД
+        self._create_slot_order(self.users[0])
+        with self.assertRaises(SlotAlreadyOccupied), transaction.atomic():
+            self._create_slot_order(self.users[1])
+        self.assertEqual(self.Order.objects.filter(facility=self.facility).count(), 1)
+        self.assertEqual(SlotOccupancy.objects.filter(facility=self.facility, date=self.booking_date, start_time=time(10, 0)).count(), 1)
+
+    def test_overlapping_slot_occupancy_allows_several_orders(self):
+        self.facility.booking_type = Facility.BOOKING_TYPE_OVERLAPPING
+        self.facility.max_capacity = 3
+        self.facility.save()
+        for user in self.users[:2]: self._create_slot_order(user)
+        self.assertEqual(SlotOccupancy.objects.filter(facility=self.facility, is_exclusive=False).count(), 2)
+
+    def test_prepare_payment_returns_conflict_when_check_loses_race(self):
+        from bookings.models import PaymentTransaction
+        self._create_slot_order(self.users[0], status=self.Order.STATUS_CONFIRMED)
+        client = APIClient()
+        client.force_authenticate(user=self.users[1])
+        payload = {"item_type": self.Order.TYPE_SLOT_BOOKING, "facility_id": self.facility.id, "date": self.booking_date.isoformat(), "slots": ["10:00"]}
+        with mock.patch('bookings.views.reserve_and_check_order_conflicts', return_value=None):
+            response = client.post(reverse('bookings_api:prepare-paycom-payment'), payload, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['type'], 'conflict')
+        self.assertEqual(self.Order.objects.filter(facility=self.facility).count(), 1)
+        self.assertFalse(PaymentTransaction.objects.exists())
+
+    def test_prepare_payment_does_not_report_other_integrity_errors_as_conflict(self):
+        from bookings.models import PaymentTransaction
+        client = APIClient()
+        client.force_authenticate(user=self.users[1])
+        payload = {"item_type": self.Order.TYPE_SLOT_BOOKING, "facility_id": self.facility.id, "date": self.booking_date.isoformat(), "slots": ["10:00"]}
+        with mock.patch.object(PaymentTransaction.objects, 'create', side_effect=IntegrityError("duplicate transaction_id")):
+            response = client.post(reverse('bookings_api:prepare-paycom-payment'), payload, format='json')
+        self.assertEqual(response.status_code, 500)
+        self.assertFalse(self.Order.objects.exists())
+
+    def test_purge_past_removes_only_past_dates(self):
+        today = timezone.localdate()
+        with transaction.atomic():
+            FacilityDayLedger.objects.lock_dates(self.facility.id, [today - timedelta(days=3), today - timedelta(days=1), today, self.booking_date])
+        self.assertEqual(FacilityDayLedger.objects.purge_past(today=today), 2)
+        self.assertEqual(sorted(FacilityDayLedger.objects.values_list('date', flat=True)), [today, self.booking_date])
+
+    @skipUnlessDBFeature('has_select_for_update')
+    def test_concurrent_checkouts_cannot_double_book_exclusive_slot(self):
+        from bookings.order_utils import reserve_and_check_order_conflicts
+        params = {"date": self.booking_date.isoformat(), "slots": ["10:00"]}
+        barrier = threading.Barrier(len(self.users))
+        outcomes = []
+
+        def checkout(user):
+            try:
+                barrier.wait()
+                with transaction.atomic():
+                    conflict = reserve_and_check_order_conflicts(self.facility, self.Order.TYPE_SLOT_BOOKING, params)
+                    if conflict:
+                        outcomes.append('conflict'); return
+                    threading.Event().wait(0.2) # Расширяем окно гонки между проверкой и созданием заказа
+                    self.Order.objects.create(
+                        user=user, facility=self.facility, order_type=self.Order.TYPE_SLOT_BOOKING,
+                        status=self.Order.STATUS_PENDING_PAYMENT, total_price=10000, booking_date=self.booking_date,
+                        slots=[{"start_time": "10:00", "end_time": "11:00"}],
+                    )
+                    outcomes.append('created')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=checkout, args=(user,)) for user in self.users]
+        for thread in threads: thread.start()
+        for thread in threads: thread.join()
+
+        self.assertEqual(sorted(outcomes), ['conflict'] * (len(self.users) - 1) + ['created'])
+        self.assertEqual(SlotOccupancy.objects.filter(facility=self.facility, date=self.booking_date, start_time=time(10, 0)).count(), 1)
+
+
+class CatalogCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.university = University.objects.create(name="Cache University", city="Cache City")
+        cls.facility = Facility.objects.create(
+            name="Cache Court", university=cls.university, facility_type=Facility.TYPE_TENNIS,
+            price_per_hour=10000, open_time=time(8, 0), close_time=time(22, 0), working_days="0,1,2,3,4",
+        )
+
+    def setUp(self):
+        from django.core.cache import cache
+        from rest_framework.test import APIClient
+        cache.clear()
+        self.client = APIClient()
+        self.list_url = reverse('facilities_api:facility-list')
+
+    def test_list_is_served_from_cache_until_facility_changes(self):
+        first = self.client.get(self.list_url, {'page_size': 5})
+        self.assertEqual(first['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            second = self.client.get(self.list_url, {'page_size': 5})
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(self.client.get(self.list_url, {'page_size': 6})['X-Cache'], 'MISS')
+
+        self.facility.name = "Renamed Cache Court"
+        with self.captureOnCommitCallbacks(execute=True): # Версия кэша увеличивается после коммита
+            self.facility.save()
+        third = self.client.get(self.list_url, {'page_size': 5})
+        self.assertEqual(third['X-Cache'], 'MISS')
+        self.assertEqual(third.json()['results'][0]['name'], "Renamed Cache Court")
+
+    def test_keys_include_language_prefix_and_stats_are_counted(self):
+        from core.cache import get_catalog_cache_stats
+        with translation.override('ru'):
+            ru_url = reverse('facilities_api:facility-list')
+        with translation.override('uz'):
+            uz_url = reverse('facilities_api:facility-list')
+        self.assertEqual(self.client.get(ru_url)['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get(uz_url)['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get(ru_url)['X-Cache'], 'HIT')
+        stats = get_catalog_cache_stats()['facilities']
+        self.assertEqual((stats['hits'], stats['misses']), (1, 2))
+
+    def test_invalidation_waits_for_commit(self):
+        from core.cache import CATALOG_FACILITIES, get_catalog_version
+        version = get_catalog_version(CATALOG_FACILITIES)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.facility.save()
+            self.assertEqual(get_catalog_version(CATALOG_FACILITIES), version) # Внутри транзакции старая версия
+        self.assertGreater(get_catalog_version(CATALOG_FACILITIES), version)
+
+    def test_cache_write_errors_do_not_break_responses(self):
+        with mock.patch('core.cache._incr', side_effect=ConnectionError("cache down")), \
+                mock.patch('core.cache.cache.set', side_effect=ConnectionError("cache down")):
+            response = self.client.get(self.list_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Cache'], 'MISS')
+
+
+class CatalogCursorPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        university = University.objects.create(name="Cursor University", city="Cursor City")
+        for name in ["Court B", "Court A", "Court B", "Court C", "Court A"]: # Повторы имен — проверка хвоста id
+            Facility.objects.create(
+                name=name, university=university, facility_type=Facility.TYPE_TENNIS,
+                price_per_hour=10000, open_time=time(8, 0), close_time=time(22, 0), working_days="0,1,2,3,4",
+            )
+
+    def setUp(self):
+        from django.core.cache import cache
+        from rest_framework.test import APIClient
+        cache.clear()
+        self.client = APIClient()
+        self.list_url = reverse('facilities_api:facility-list')
+
+    def test_cursor_pages_follow_name_id_order(self):
+        from urllib.parse import parse_qs, urlparse
+        seen_ids, cursor = [], ''
+        while cursor is not None:
+            data = self.client.get(self.list_url, {'cursor': cursor, 'page_size': 2}).json()
+            self.assertNotIn('count', data)
+            seen_ids += [row['id'] for row in data['results']]
+            cursor = data['next'] and parse_qs(urlparse(data['next']).query)['cursor'][0]
+        self.assertEqual(seen_ids, list(Facility.objects.order_by('name', 'id').values_list('id', flat=True)))
+        self.assertEqual(self.client.get(self.list_url, {'page_size': 2}).json()['count'], 5)
+
+    def _walk(self, url, link_key, cursor=''):
+        from urllib.parse import parse_qs, urlparse
+        pages = []
+        while cursor is not None:
+            data = self.client.get(url, {'cursor': cursor, 'page_size': 2}).json()
+            pages.append([row['id'] for row in data['results']])
+            cursor = data[link_key] and parse_qs(urlparse(data[link_key]).query)['cursor'][0]
+        return pages
+
+    def test_keyset_covers_all_columns_nulls_and_previous_links(self):
+        from urllib.parse import parse_qs, urlparse
+        second_b = Facility.objects.filter(name="Court B").order_by('id')[1]
+        Facility.objects.filter(pk=second_b.pk).update(name_ru="Корт Б") # Остальные без перевода: name_ru IS NULL
+        Facility.objects.filter(name="Court C").update(name_ru="Корт Б")
+        with translation.override('ru'):
+            ru_url = reverse('facilities_api:facility-list')
+        expected_ids = list(Facility.objects.order_by(F('name_ru').asc(nulls_last=True), 'id').values_list('id', flat=True))
+
+        forward_pages = self._walk(ru_url, 'next')
+        self.assertEqual(sum(forward_pages, []), expected_ids)
+        last_page = self.client.get(ru_url, {'cursor': '', 'page_size': 2}).json()
+        while last_page['next']:
+            last_page = self.client.get(last_page['next']).json()
+        backward_pages = self._walk(ru_url, 'previous', parse_qs(urlparse(last_page['previous']).query)['cursor'][0])
+        self.assertEqual(backward_pages, forward_pages[-2::-1])
+
+        second_page_url = self.client.get(ru_url, {'cursor': '', 'page_size': 2}).json()['next']
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(second_page_url)
+        self.assertFalse(any('OFFSET' in query['sql'] for query in queries.captured_queries))
+        self.assertEqual(self.client.get(ru_url, {'cursor': 'not-a-cursor'}).status_code, 404)
+
+    def test_tampered_cursor_values_return_404(self):
+        for position in (["abc", 1], [["x"], 1], [{"a": 1}, 1], ["10000", "1.5"], [None, 1]):
+            cursor = base64.urlsafe_b64encode(json.dumps({'p': position}).encode('utf-8')).decode('ascii')
+            response = self.client.get(self.list_url, {'cursor': cursor, 'ordering': 'price_per_hour'})
+            self.assertEqual(response.status_code, 404, position)
+        valid_cursor = base64.urlsafe_b64encode(json.dumps({'p': ["10000", 1]}).encode('utf-8')).decode('ascii')
+        self.assertEqual(self.client.get(self.list_url, {'cursor': valid_cursor, 'ordering': 'price_per_hour'}).status_code, 200)
+
+
+class FacilitySearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.university = University.objects.create(name_uz="Samarqand universiteti", name_ru="Самаркандский университет", city="Samarqand")
+        other_university = University.objects.create(name="Toshkent universiteti", city="Toshkent")
+        cls.pool = cls._create_facility(cls.university, name_uz="Suzish havzasi", name_ru="Бассейн", description_ru="Олимпийский бассейн")
+        cls.court = cls._create_facility(cls.university, name_uz="Tennis korti", name_ru="Теннисный корт")
+        cls.other_pool = cls._create_facility(other_university, name_uz="Katta havza", name_ru="Большой бассейн", price_per_hour=20000)
+
+    @classmethod
+    def _create_facility(cls, university, **fields):
+        fields.setdefault('price_per_hour', 10000)
+        return Facility.objects.create(
+            university=university, facility_type=Facility.TYPE_TENNIS,
+            open_time=time(8, 0), close_time=time(22, 0), working_days="0,1,2,3,4", **fields
+        )
+
+    def setUp(self):
+        from django.core.cache import cache
+        from rest_framework.test import APIClient
+        cache.clear()
+        self.client = APIClient()
+        self.list_url = reverse('facilities_api:facility-list')
+
+    def _search_ids(self, query, **params):
+        response = self.client.get(self.list_url, {'search': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [row['id'] for row in response.json()['results']]
+
+    def test_search_covers_translations_and_university(self):
+        self.assertEqual(self._search_ids("бассейн"), [self.pool.id, self.other_pool.id]) # В названии и описании — выше
+        self.assertEqual(set(self._search_ids("havza")), {self.pool.id, self.other_pool.id})
+        self.assertEqual(set(self._search_ids("samarq")), {self.pool.id, self.court.id}) # Префикс города ВУЗа
+        self.assertEqual(self._search_ids("Самаркандский корт"), [self.court.id]) # Все слова обязательны
+        self.assertEqual(self._search_ids("бассейн", ordering='-price_per_hour'), [self.other_pool.id, self.pool.id])
+        self.assertEqual(self._search_ids('"kort*:&'), [self.court.id]) # Синтаксис FTS/tsquery из запроса отбрасывается
+
+    def test_documents_follow_facility_and_university_saves(self):
+        self.university.city = "Buxoro"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.university.save()
+        self.assertEqual(set(self._search_ids("buxoro")), {self.pool.id, self.court.id})
+        self.court.name_ru = "Падел корт"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.court.save()
+        self.assertEqual(self._search_ids("падел"), [self.court.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.court.delete()
+        self.assertEqual(self._search_ids("падел"), [])
+
+    def test_rebuild_command_restores_documents(self):
+        from django.core.management import call_command
+        FacilitySearchDocument.objects.all().delete()
+        self.assertEqual(self._search_ids("бассейн"), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('rebuild_facility_search', stdout=open(os.devnull, 'w'))
+        self.assertEqual(self._search_ids("бассейн"), [self.pool.id, self.other_pool.id])
+
+    def test_truncated_results_are_flagged(self):
+        self.assertNotIn('search_truncated', self.client.get(self.list_url, {'search': "бассейн"}).json())
+        with override_settings(FACILITY_SEARCH_MAX_RESULTS=1):
+            data = self.client.get(self.list_url, {'search': "бассейн", 'page_size': 1}).json()
+            facets = self.client.get(reverse('facilities_api:facility-facets'), {'search': "бассейн"}).json()
+        self.assertEqual(([row['id'] for row in data['results']], data['count'], data['search_truncated']), ([self.pool.id], 1, True))
+        self.assertEqual((facets['count'], facets['search_truncated']), (1, True))
+
+    def test_cursor_requires_explicit_ordering_with_search(self):
+        self.assertEqual(self.client.get(self.list_url, {'search': "бассейн", 'cursor': ''}).status_code, 400)
+        response = self.client.get(self.list_url, {'search': "бассейн", 'cursor': '', 'ordering': '-price_per_hour'})
+        self.assertEqual([row['id'] for row in response.json()['results']], [self.other_pool.id, self.pool.id])
+
+class FacilityFacetsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.tashkent_university = University.objects.create(name="Facet Tashkent University", city_uz="Toshkent", city_ru="Ташкент")
+        cls.samarkand_university = University.objects.create(name="Facet Samarkand University", city_uz="Samarqand", city_ru="Самарканд")
+        cls.shower = Amenity.objects.create(name="Facet Shower")
+        cls.parking = Amenity.objects.create(name="Facet Parking")
+        cls.court = cls._create_facility(cls.tashkent_university, Facility.TYPE_TENNIS, 10000, [cls.shower, cls.parking])
+        cls._create_facility(cls.tashkent_university, Facility.TYPE_TENNIS, 30000, [cls.shower])
+        cls._create_facility(cls.samarkand_university, Facility.TYPE_SWIMMING, 20000, [], booking_type=Facility.BOOKING_TYPE_ENTRY)
+
+    @classmethod
+    def _create_facility(cls, university, facility_type, price, amenities, **extra):
+        facility = Facility.objects.create(
+            name=f"Facet {facility_type} {price}", university=university, facility_type=facility_type, price_per_hour=price,
+            open_time=time(8, 0), close_time=time(22, 0), working_days="0,1,2,3,4", **extra
+        )
+        facility.amenities.set(amenities)
+        return facility
+
+    def setUp(self):
+        from django.core.cache import cache
+        from rest_framework.test import APIClient
+        cache.clear()
+        self.client = APIClient()
+        self.facets_url = reverse('facilities_api:facility-facets')
+
+    def _counts(self, facet):
+        return {item['value']: item['count'] for item in facet}
+
+    def test_facets_count_current_filter_set(self):
+        tashkent_city_id = self.tashkent_university.normalized_city_id
+        with self.assertNumQueries(5): # GROUP BY фасетов + удобства + названия ВУЗов, городов, удобств
+            facets = self.client.get(self.facets_url).json()
+        self.assertEqual(facets['count'], 3)
+        self.assertEqual(self._counts(facets['facility_type']), {Facility.TYPE_TENNIS: 2, Facility.TYPE_SWIMMING: 1})
+        self.assertEqual(self._counts(facets['city']), {tashkent_city_id: 2, self.samarkand_university.normalized_city_id: 1})
+        self.assertEqual(self._counts(facets['amenities']), {self.shower.id: 2, self.parking.id: 1})
+        self.assertEqual((float(facets['price']['min']), float(facets['price']['max'])), (10000, 30000))
+
+        filtered = self.client.get(self.facets_url, {'city': tashkent_city_id, 'amenities': self.parking.id}).json()
+        self.assertEqual(filtered['count'], 1)
+        self.assertEqual(self._counts(filtered['university']), {self.tashkent_university.id: 1})
+        self.assertEqual(self._counts(filtered['booking_type']), {self.court.booking_type: 1})
+
+    def test_city_filter_uses_city_table_and_cache_follows_saves(self):
+        list_url = reverse('facilities_api:facility-list')
+        for city_name in ["ташкент", " Toshkent ", "TOSHKENT"]:
+            self.assertEqual(self.client.get(list_url, {'university__city': city_name}).json()['count'], 2)
+        self.assertEqual(self.client.get(list_url, {'university__city': "Tosh"}).json()['count'], 0) # Точное совпадение
+
+        self.assertEqual(self.client.get(self.facets_url)['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get(self.facets_url)['X-Cache'], 'HIT')
+        self.court.facility_type = Facility.TYPE_FOOTBALL
+        with self.captureOnCommitCallbacks(execute=True):
+            self.court.save()
+        response = self.client.get(self.facets_url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(self._counts(response.json()['facility_type'])[Facility.TYPE_FOOTBALL], 1)
+
+
+class AvailabilityCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        from bookings.models import Order
+        cls.Order = Order
+        cls.user = User.objects.create_user(email='avcache@example.com', password='password', first_name='Av', last_name='Cache', username='avcacheuser')
+        cls.university = University.objects.create(name="Availability Cache University", city="Cache City")
+        cls.facility = Facility.objects.create(
+            name="Availability Cache Court", university=cls.university, facility_type=Facility.TYPE_TENNIS,
+            price_per_hour=10000, open_time=time(8, 0), close_time=time(22, 0),
+            working_days="0,1,2,3,4,5,6", booking_type=Facility.BOOKING_TYPE_EXCLUSIVE,
+        )
+        cls.booking_date = timezone.localdate() + timedelta(days=3)
+
+    def setUp(self):
+        from django.core.cache import cache
+        from rest_framework.test import APIClient
+        cache.clear()
+        self.client = APIClient()
+        self.url = reverse('facilities_api:facility-availability', args=[self.facility.id])
+
+    def _slot(self, response, slot_time):
+        return next(slot for slot in response.json()['slots'] if slot['time'] == slot_time)
+
+    def test_day_is_cached_and_invalidated_by_order_status_changes(self):
+        first = self.client.get(self.url, {'date': self.booking_date.isoformat()})
+        self.assertEqual(first['X-Cache'], 'MISS')
+        cached = self.client.get(self.url, {'date': self.booking_date.isoformat()})
+        self.assertEqual(cached['X-Cache'], 'HIT')
+        self.assertEqual(cached.json(), first.json())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            order = self.Order.objects.create(
+                user=self.user, facility=self.facility, order_type=self.Order.TYPE_SLOT_BOOKING,
+                status=self.Order.STATUS_PENDING_PAYMENT, total_price=10000, booking_date=self.booking_date,
+                slots=[{"start_time": "10:00", "end_time": "11:00"}],
+            )
+        booked = self.client.get(self.url, {'date': self.booking_date.isoformat()})
+        self.assertEqual(booked['X-Cache'], 'MISS')
+        self.assertFalse(self._slot(booked, "10:00")['is_available'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            order.status = self.Order.STATUS_PAYMENT_FAILED
+            order.save(update_fields=['status', 'updated_at'])
+        released = self.client.get(self.url, {'date': self.booking_date.isoformat()})
+        self.assertEqual(released['X-Cache'], 'MISS')
+        self.assertTrue(self._slot(released, "10:00")['is_available'])
+
+    def test_other_dates_stay_cached(self):
+        other_date = self.booking_date + timedelta(days=1)
+        self.client.get(self.url, {'date': other_date.isoformat()})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.Order.objects.create(
+                user=self.user, facility=self.facility, order_type=self.Order.TYPE_SLOT_BOOKING,
+                status=self.Order.STATUS_CONFIRMED, total_price=10000, booking_date=self.booking_date,
+                slots=[{"start_time": "12:00", "end_time": "13:00"}],
+            )
+        self.assertEqual(self.client.get(self.url, {'date': other_date.isoformat()})['X-Cache'], 'HIT')
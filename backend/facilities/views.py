@@ -1,9 +1,9 @@
 from rest_framework import viewsets, permissions, filters, status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 from django.shortcuts import get_object_or_404
-from django.utils import timezone
+from django.utils import timezone, translation
 from datetime import datetime, time, timedelta, date as dt_date
 from collections import defaultdict
 from django.conf import settings
@@ -15,18 +15,21 @@ from .serializers import FacilityListSerializer, FacilityDetailSerializer, Ameni
 # --- ИЗМЕНЕНИЕ: Импортируем сервис ---
 from .availability_checker import FacilityAvailabilityService, REASON_AVAILABLE 
 # --- КОНЕЦ ИЗМЕНЕНИЯ ---
-from .filters import FacilityFilter 
-
-from rest_framework.pagination import PageNumberPagination
+from .filters import FacilityFilter, FacilityFullTextSearchFilter
+from .facets import build_facility_facets
+from .availability_cache import get_cached_day_availability, set_cached_day_availability
+from core.cache import CatalogCacheMixin, CATALOG_FACILITIES, CATALOG_AMENITIES
+from core.pagination import CursorOrPageNumberPagination
 
 logger = logging.getLogger(__name__)
 
-class StandardResultsSetPagination(PageNumberPagination):
+class StandardResultsSetPagination(CursorOrPageNumberPagination):
     page_size = 12
     page_size_query_param = 'page_size'
     max_page_size = 48
+    cursor_ordering = ('name', 'id')
 
-class FacilityViewSet(viewsets.ReadOnlyModelViewSet):
+class FacilityViewSet(CatalogCacheMixin, viewsets.ReadOnlyModelViewSet):
     # ... (код FacilityViewSet без изменений) ...
     queryset = Facility.objects.filter(
         is_active=True,
@@ -37,27 +40,46 @@ class FacilityViewSet(viewsets.ReadOnlyModelViewSet):
     ).prefetch_related(
         'amenities',
         'images'
-    ).order_by('name')
+    ).order_by('name', 'id')
     permission_classes = [permissions.AllowAny]
     pagination_class = StandardResultsSetPagination
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    cache_namespace = CATALOG_FACILITIES
+    # Поиск — после OrderingFilter: без ?ordering= он сортирует по релевантности
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, FacilityFullTextSearchFilter]
     filterset_class = FacilityFilter 
-    search_fields = ['name', 'description', 'university__name', 'university__city']
+    search_fields = ['name', 'description', 'university__name', 'university__city'] # icontains, если БД без поискового индекса
     ordering_fields = ['name', 'price_per_hour', 'created_at']
-    ordering = ['name']
+    ordering = ['name', 'id'] # id — уникальный хвост сортировки для стабильных страниц и курсора (?cursor=)
     def get_serializer_context(self):
         context = super().get_serializer_context(); context['request'] = self.request
         return context
     def get_serializer_class(self):
         if self.action == 'list': return FacilityListSerializer
         return FacilityDetailSerializer
-
-class AmenityViewSet(viewsets.ReadOnlyModelViewSet):
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        # Поиск отдает не больше FACILITY_SEARCH_MAX_RESULTS объектов — клиент должен знать, что выдача усечена
+        if getattr(self.request, 'facility_search_truncated', False): response.data['search_truncated'] = True
+        return response
+
+    # URL: /catalog/facilities/facets/ — те же параметры фильтрации и ?search=, что и у списка
+    @action(detail=False, methods=['get'])
+    def facets(self, request):
+        """ Счетчики по значениям фасетов для текущих фильтров; кэшируется и сбрасывается вместе со списком. """
+        return self._get_cached_response(self._build_facets_response, request)
+
+    def _build_facets_response(self, request):
+        facets = build_facility_facets(self.filter_queryset(self.get_queryset()))
+        if getattr(request, 'facility_search_truncated', False): facets['search_truncated'] = True
+        return Response(facets)
+
+class AmenityViewSet(CatalogCacheMixin, viewsets.ReadOnlyModelViewSet):
     # ... (код AmenityViewSet без изменений) ...
     queryset = Amenity.objects.all().order_by('name')
     serializer_class = AmenitySerializer
     permission_classes = [permissions.AllowAny]
     pagination_class = None
+    cache_namespace = CATALOG_AMENITIES
 
 
 @api_view(['GET'])
@@ -93,6 +115,15 @@ def get_facility_availability(request, facility_id):
     availability_service = FacilityAvailabilityService(facility, request_time=request_processing_time)
     # --- КОНЕЦ ИЗМЕНЕНИЯ ---
     
+    # Кэш дня: инвалидируется при изменении заказов на эту дату (см. availability_cache)
+    language_code = translation.get_language()
+    facility_version = facility.updated_at.isoformat() if facility.updated_at else ''
+    cached_response_data = get_cached_day_availability(facility.id, selected_date_naive, language_code, facility_version)
+    if cached_response_data is not None:
+        response = Response(cached_response_data, status=status.HTTP_200_OK)
+        response['X-Cache'] = 'HIT'
+        return response
+
     # Проверка, работает ли объект в этот день недели (можно также перенести в сервис как отдельный метод)
     day_of_week_py = selected_date_naive.weekday()
     if not facility.is_working_on_day(day_of_week_py):
@@ -106,37 +137,37 @@ def get_facility_availability(request, facility_id):
     time_step = timedelta(hours=1) # Предполагаем шаг в 1 час
     current_dt_naive = datetime.combine(selected_date_naive, open_t)
     end_work_dt_naive = datetime.combine(selected_date_naive, close_t) if close_t != time(0,0) else datetime.combine(selected_date_naive + timedelta(days=1), time(0,0))
-    
-    current_tz = timezone.get_current_timezone()
 
+    # Сначала собираем времена начала слотов рабочего дня
+    slot_start_times = []
     while current_dt_naive < end_work_dt_naive:
-        slot_start_time_obj = current_dt_naive.time()
-        check_datetime_start_aware = timezone.make_aware(current_dt_naive, current_tz)
-        
-        # --- ИЗМЕНЕНИЕ: Вызываем метод сервиса ---
-        availability_details = availability_service.check_slot_availability(
-            check_datetime_start=check_datetime_start_aware, 
-            capacity_needed=1 
-        )
-        # --- КОНЕЦ ИЗМЕНЕНИЯ ---
-        
-        slot_end_dt_naive = current_dt_naive + time_step
-        if slot_end_dt_naive <= end_work_dt_naive:
-            response_data["slots"].append({
-                "time": slot_start_time_obj.strftime('%H:%M'), 
-                "is_available": availability_details["is_available"],
-                "booked_count": availability_details["booked_slots_count"], 
-                "max_capacity": availability_details["max_capacity"],
-                "available_spots": availability_details["available_spots"], 
-                "reason": availability_details.get("reason")
-            })
-        else: break 
+        if current_dt_naive + time_step > end_work_dt_naive: break
+        slot_start_times.append(current_dt_naive.time())
         current_dt_naive += time_step
 
+    # --- ИЗМЕНЕНИЕ: Доступность всего дня одним запросом к сервису ---
+    day_availability = availability_service.check_range(selected_date_naive, selected_date_naive, slot_start_times, capacity_needed=1)
+    # --- КОНЕЦ ИЗМЕНЕНИЯ ---
+
+    for slot_start_time_obj in slot_start_times:
+        availability_details = day_availability[(selected_date_naive, slot_start_time_obj)]
+        response_data["slots"].append({
+            "time": slot_start_time_obj.strftime('%H:%M'), 
+            "is_available": availability_details["is_available"],
+            "booked_count": availability_details["booked_slots_count"], 
+            "max_capacity": availability_details["max_capacity"],
+            "available_spots": availability_details["available_spots"], 
+            "reason": availability_details.get("reason")
+        })
+
     if not response_data["slots"] and not response_data["message"]:
         response_data["message"] = _("Нет доступных слотов в указанные рабочие часы или объект не работает.")
-        
-    return Response(response_data, status=status.HTTP_200_OK)
+
+    response_data["message"] = str(response_data["message"]) if response_data["message"] else None
+    set_cached_day_availability(facility.id, selected_date_naive, language_code, facility_version, response_data)
+    response = Response(response_data, status=status.HTTP_200_OK)
+    response['X-Cache'] = 'MISS'
+    return response
 
 
 @api_view(['GET'])
@@ -159,7 +190,6 @@ def get_comprehensive_subscription_availability(request, facility_id):
     # --- КОНЕЦ ИЗМЕНЕНИЯ ---
 
     availability_matrix = defaultdict(dict)
-    current_tz = timezone.get_current_timezone()
     today_local = timezone.localdate() # Используем request_processing_time.date() если request_time важно для определения "сегодня"
     
     start_day_offset = (0 - today_local.weekday() + 7) % 7 
@@ -168,8 +198,11 @@ def get_comprehensive_subscription_availability(request, facility_id):
     # if base_monday_for_matrix <= today_local: 
     #     base_monday_for_matrix += timedelta(days=7)
 
+    # Сначала собираем даты и времена слотов для каждого рабочего дня недели
+    matrix_days = []
     for day_index_in_week in range(7):
-        current_day_matrix_slots = {}
+        day_slot_times = []
+        current_check_date_for_matrix_day = None
         if facility.is_working_on_day(day_index_in_week): # Проверяем, работает ли объект в этот день недели
             # Дата для текущего дня недели в матрице
             current_check_date_for_matrix_day = base_monday_for_matrix + timedelta(days=(day_index_in_week - base_monday_for_matrix.weekday() + 7)%7)
@@ -184,24 +217,28 @@ def get_comprehensive_subscription_availability(request, facility_id):
             if time_slot_dt_naive.time() <= end_iteration_time_obj:
                 while True:
                     current_slot_time_obj = time_slot_dt_naive.time()
-                    check_dt_start_naive_for_slot = datetime.combine(current_check_date_for_matrix_day, current_slot_time_obj)
-                    check_dt_start_aware_for_slot = timezone.make_aware(check_dt_start_naive_for_slot, current_tz)
-                    
-                    # --- ИЗМЕНЕНИЕ: Вызываем метод сервиса ---
-                    slot_availability_details = availability_service.check_slot_availability(
-                        check_datetime_start=check_dt_start_aware_for_slot, 
-                        capacity_needed=1
-                    )
-                    # --- КОНЕЦ ИЗМЕНЕНИЯ ---
-                    
-                    current_day_matrix_slots[current_slot_time_obj.strftime('%H:%M')] = {
-                        "is_available_for_subscription": slot_availability_details["is_available"],
-                        "available_spots_for_subscription": slot_availability_details["available_spots"],
-                        "reason_key": slot_availability_details.get("reason", REASON_AVAILABLE if slot_availability_details["is_available"] else None)
-                    }
+                    day_slot_times.append(current_slot_time_obj)
                     if current_slot_time_obj == end_iteration_time_obj: break 
                     time_slot_dt_naive += timedelta(hours=1)
                     if time_slot_dt_naive.time() == facility.open_time and facility.open_time != time(0,0) and facility.open_time == facility.close_time: break
+        matrix_days.append((day_index_in_week, current_check_date_for_matrix_day, day_slot_times))
+
+    # --- ИЗМЕНЕНИЕ: Вся неделя проверяется одним запросом к сервису ---
+    all_matrix_times = sorted({slot_time for _d, _dt, times in matrix_days for slot_time in times})
+    week_availability = availability_service.check_range(
+        base_monday_for_matrix, base_monday_for_matrix + timedelta(days=6), all_matrix_times, capacity_needed=1
+    )
+    # --- КОНЕЦ ИЗМЕНЕНИЯ ---
+
+    for day_index_in_week, matrix_date, day_slot_times in matrix_days:
+        current_day_matrix_slots = {}
+        for current_slot_time_obj in day_slot_times:
+            slot_availability_details = week_availability[(matrix_date, current_slot_time_obj)]
+            current_day_matrix_slots[current_slot_time_obj.strftime('%H:%M')] = {
+                "is_available_for_subscription": slot_availability_details["is_available"],
+                "available_spots_for_subscription": slot_availability_details["available_spots"],
+                "reason_key": slot_availability_details.get("reason", REASON_AVAILABLE if slot_availability_details["is_available"] else None)
+            }
         availability_matrix[str(day_index_in_week)] = current_day_matrix_slots
         
     response_data["availability_matrix"] = dict(availability_matrix)
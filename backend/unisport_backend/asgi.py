@@ -5,6 +5,9 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
+
+Long-poll статуса оплаты (bookings.views.OrderPaymentStatusWaitView) — async-представление:
+под ASGI-сервером (uvicorn/daphne) ожидающие запросы не занимают поток, под WSGI каждый держит воркер.
 """
 
 import os
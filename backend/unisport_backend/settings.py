@@ -116,6 +116,27 @@ else:
         }
     }
 
+# Кэш: по умолчанию в памяти процесса, Redis — если задан REDIS_URL (нужен пакет redis)
+REDIS_URL = os.environ.get('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'bronsport',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'bronsport-default',
+        }
+    }
+CATALOG_CACHE_TIMEOUT = int(os.environ.get('CATALOG_CACHE_TIMEOUT', 10 * 60)) # Кэш публичного каталога (секунды)
+AVAILABILITY_CACHE_TIMEOUT = int(os.environ.get('AVAILABILITY_CACHE_TIMEOUT', 30)) # Кэш дневной доступности объекта (секунды)
+FACILITY_SEARCH_MAX_RESULTS = int(os.environ.get('FACILITY_SEARCH_MAX_RESULTS', 500)) # Максимум объектов в выдаче полнотекстового поиска каталога
+
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',},
     {'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator',},
@@ -229,9 +250,28 @@ PAYME_WEBHOOK_LOGIN = os.environ.get('PAYME_WEBHOOK_LOGIN', "Paycom")
 PAYME_WEBHOOK_TEST_KEY = os.environ.get("PAYME_WEBHOOK_TEST_KEY") # Ключ для Sandbox из .env
 PAYME_WEBHOOK_PRODUCTION_KEY = os.environ.get("PAYME_WEBHOOK_PRODUCTION_KEY") # Ключ для боевого из .env
 
+PAYME_WEBHOOK_CREDENTIALS_TTL_SECONDS = int(os.environ.get('PAYME_WEBHOOK_CREDENTIALS_TTL_SECONDS', 300)) # Кэш ключей кассы ВУЗа в процессе
+
 PAYCOM_CHECKOUT_URL = "https://checkout.paycom.uz" if not DEBUG else "https://test.paycom.uz"
 PAYCOM_CALLBACK_BASE_URL = FRONTEND_BASE_URL_ENV 
 
+# Истечение неоплаченных заказов (manage.py expire_pending_orders)
+PENDING_ORDER_TTL_MINUTES = int(os.environ.get('PENDING_ORDER_TTL_MINUTES', 30)) # Сколько заказ ждет перехода к оплате
+PAYCOM_TRANSACTION_TTL_MINUTES = int(os.environ.get('PAYCOM_TRANSACTION_TTL_MINUTES', 12 * 60)) # Таймаут Paycom после CreateTransaction
+PAYME_CALLBACK_IDEMPOTENCY_TTL_MINUTES = int(os.environ.get('PAYME_CALLBACK_IDEMPOTENCY_TTL_MINUTES', 12 * 60)) # Сколько хранить ответы Perform/Cancel для повторов Payme
+ORDER_STATUS_BROKER_CLASS = os.environ.get('ORDER_STATUS_BROKER_CLASS', 'bookings.status_events.LocalOrderStatusBroker') # Брокер событий статуса заказа
+ORDER_STATUS_LONG_POLL_TIMEOUT_SECONDS = int(os.environ.get('ORDER_STATUS_LONG_POLL_TIMEOUT_SECONDS', 25)) # Максимальное ожидание long-poll запроса
+ORDER_STATUS_RECHECK_SECONDS = int(os.environ.get('ORDER_STATUS_RECHECK_SECONDS', 5)) # Как часто long-poll перечитывает статус из БД
+PENDING_ORDER_SWEEP_INTERVAL_SECONDS = int(os.environ.get('PENDING_ORDER_SWEEP_INTERVAL_SECONDS', 60))
+PENDING_ORDER_SWEEP_BATCH_SIZE = int(os.environ.get('PENDING_ORDER_SWEEP_BATCH_SIZE', 500))
+ORDER_EXPORT_CHUNK_SIZE = int(os.environ.get('ORDER_EXPORT_CHUNK_SIZE', 2000)) # Заказов в одной пачке выгрузки Excel/CSV
+EXPORT_JOB_POLL_INTERVAL_SECONDS = int(os.environ.get('EXPORT_JOB_POLL_INTERVAL_SECONDS', 5)) # Пауза воркера run_export_jobs
+EXPORT_JOB_RETENTION_HOURS = int(os.environ.get('EXPORT_JOB_RETENTION_HOURS', 24)) # Сколько хранить готовые файлы выгрузок
+EXPORT_JOB_STALE_MINUTES = int(os.environ.get('EXPORT_JOB_STALE_MINUTES', 60)) # Задача 'running' дольше — воркер упал
+EXPORT_FILES_ROOT = os.environ.get('EXPORT_FILES_ROOT', os.path.join(BASE_DIR, 'private_exports')) # Файлы выгрузок: вне MEDIA_ROOT, не раздаются веб-сервером
+CHECKIN_MANIFEST_SIGNING_KEY = os.environ.get('CHECKIN_MANIFEST_SIGNING_KEY') # Мастер-ключ HMAC манифеста сканеров; без него манифест не выдается (ключи ВУЗов — manage.py checkin_manifest_key)
+CHECKIN_BATCH_MAX_CODES = int(os.environ.get('CHECKIN_BATCH_MAX_CODES', 500)) # Максимум кодов в пакетной отметке
+
 # Безопасность для продакшена
 if not DEBUG:
     CSRF_COOKIE_SECURE = True
@@ -5,7 +5,7 @@ from django.urls import path, reverse # path не используется зд
 from django.utils.html import format_html
 from django.utils.translation import gettext_lazy as _
 
-from .models import University, Staff, SportClub, UniversityImage
+from .models import City, University, Staff, SportClub, UniversityImage
 from core.models import User 
 from core.utils import get_admin_university_details
 
@@ -49,6 +49,11 @@ if FACILITY_APP_AVAILABLE:
 else: FacilityInline = None
 
 
+@admin.register(City)
+class CityAdmin(TranslationAdmin):
+    list_display = ('name', 'key'); search_fields = ('name', 'key'); readonly_fields = ('key',)
+
+
 @admin.register(University)
 class UniversityAdmin(TranslationAdmin): # Наследуемся от TranslationAdmin
     list_display = (
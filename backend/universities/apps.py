@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class UniversitiesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'universities'
+
+    def ready(self):
+        # Регистрируем сигналы инвалидации кэша каталога
+        from . import signals  # noqa: F401
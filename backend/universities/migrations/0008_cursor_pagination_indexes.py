@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-18 11:16
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('universities', '0007_remove_university_payme_merchant_id_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='university',
+            index=models.Index(fields=['name_uz', 'id'], name='university_name_uz_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='university',
+            index=models.Index(fields=['name_ru', 'id'], name='university_name_ru_id_idx'),
+        ),
+    ]
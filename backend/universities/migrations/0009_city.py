@@ -0,0 +1,61 @@
+# Generated by Django 5.2 on 2026-10-18 11:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Копия логики CityManager.resolve: в миграциях исторические модели не имеют методов менеджера.
+LANGUAGES = ('uz', 'ru')
+DEFAULT_LANGUAGE = 'uz'
+
+
+def _build_key(value):
+    return ' '.join((value or '').split()).casefold()
+
+
+def backfill_cities(apps, schema_editor):
+    City = apps.get_model('universities', 'City')
+    University = apps.get_model('universities', 'University')
+    cities_by_key = {}
+    for university in University.objects.all():
+        names = {language: (getattr(university, f'city_{language}') or '').strip() for language in LANGUAGES}
+        if not any(names.values()): names = {DEFAULT_LANGUAGE: (university.city or '').strip()}
+        key_source = names.get(DEFAULT_LANGUAGE) or next((name for name in names.values() if name), '')
+        key = _build_key(key_source)
+        if not key: continue
+        if key not in cities_by_key:
+            cities_by_key[key] = City.objects.create(
+                key=key, name=key_source, **{f'name_{language}': name for language, name in names.items() if name}
+            )
+        university.normalized_city = cities_by_key[key]
+        university.save(update_fields=['normalized_city'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('universities', '0008_cursor_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='City',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='Название')),
+                ('name_uz', models.CharField(max_length=100, null=True, verbose_name='Название')),
+                ('name_ru', models.CharField(max_length=100, null=True, verbose_name='Название')),
+                ('key', models.CharField(help_text='Название на языке по умолчанию в нижнем регистре. Заполняется автоматически.', max_length=100, unique=True, verbose_name='Ключ')),
+            ],
+            options={
+                'verbose_name': 'Город',
+                'verbose_name_plural': 'Города',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='university',
+            name='normalized_city',
+            field=models.ForeignKey(blank=True, editable=False, help_text="Заполняется автоматически из поля 'Город' при сохранении.", null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='universities', to='universities.city', verbose_name='Город (справочник)'),
+        ),
+        migrations.RunPython(backfill_cities, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2 on 2026-10-18 11:44
+
+from django.db import migrations, models
+
+# Копия логики City.save / CityManager.build_key: в миграциях исторические модели без методов.
+LANGUAGES = ('uz', 'ru')
+
+
+def _build_key(value):
+    return ' '.join((value or '').split()).casefold()
+
+
+def backfill_lookup_keys(apps, schema_editor):
+    City = apps.get_model('universities', 'City')
+    for city in City.objects.all():
+        for language in LANGUAGES:
+            setattr(city, f'lookup_key_{language}', _build_key(getattr(city, f'name_{language}')))
+        city.save(update_fields=[f'lookup_key_{language}' for language in LANGUAGES])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('universities', '0009_city'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='city',
+            name='lookup_key',
+            field=models.CharField(blank=True, db_index=True, editable=False, help_text='Название в нижнем регистре без лишних пробелов. Заполняется автоматически.', max_length=100, verbose_name='Ключ поиска'),
+        ),
+        migrations.AddField(
+            model_name='city',
+            name='lookup_key_ru',
+            field=models.CharField(blank=True, db_index=True, editable=False, help_text='Название в нижнем регистре без лишних пробелов. Заполняется автоматически.', max_length=100, null=True, verbose_name='Ключ поиска'),
+        ),
+        migrations.AddField(
+            model_name='city',
+            name='lookup_key_uz',
+            field=models.CharField(blank=True, db_index=True, editable=False, help_text='Название в нижнем регистре без лишних пробелов. Заполняется автоматически.', max_length=100, null=True, verbose_name='Ключ поиска'),
+        ),
+        migrations.RunPython(backfill_lookup_keys, migrations.RunPython.noop),
+    ]
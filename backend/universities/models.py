@@ -4,6 +4,8 @@ from django.utils.translation import gettext_lazy as _
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils.text import slugify # Для генерации слага
 import uuid # Для уникальности слага
+from modeltranslation import settings as mt_settings
+from modeltranslation.utils import build_localized_fieldname
 
 from core.models import User 
 # Импортируем University только для type hinting в поле administered_university модели User (если есть такая связь)
@@ -11,6 +13,64 @@ from core.models import User
 # Для прямого использования в полях ForeignKey лучше использовать строки 'app_label.ModelName'
 # чтобы избежать циклических импортов при запуске.
 
+class CityManager(models.Manager):
+    @staticmethod
+    def build_key(value) -> str:
+        return ' '.join((value or '').split()).casefold()
+
+    def resolve(self, names_by_language: dict):
+        """
+        Город справочника по названиям на языках ({'uz': ..., 'ru': ...}), создается при первом упоминании.
+        Ключ — название на языке по умолчанию (или первое непустое) без регистра и лишних пробелов.
+        """
+        key_source = names_by_language.get(mt_settings.DEFAULT_LANGUAGE) or next((name for name in names_by_language.values() if name and name.strip()), '')
+        key = self.build_key(key_source)
+        if not key:
+            return None
+        defaults = {
+            build_localized_fieldname('name', language): name.strip()
+            for language, name in names_by_language.items() if name and name.strip()
+        }
+        city, _created = self.get_or_create(key=key, defaults=defaults)
+        return city
+
+
+class City(models.Model):
+    """
+    Нормализованный справочник городов. Заполняется автоматически при сохранении University
+    из его текстового поля city; по нему работают фильтр и фасеты каталога по городу (точное совпадение по FK).
+    """
+    name = models.CharField(_("Название"), max_length=100)
+    key = models.CharField(
+        _("Ключ"), max_length=100, unique=True,
+        help_text=_("Название на языке по умолчанию в нижнем регистре. Заполняется автоматически.")
+    )
+    # Переводимое (lookup_key_uz, lookup_key_ru): фильтр каталога ищет город точным совпадением по индексу,
+    # регистр сравнивается в Python при сохранении (в SQLite lower()/iexact не работают с кириллицей)
+    lookup_key = models.CharField(
+        _("Ключ поиска"), max_length=100, blank=True, editable=False, db_index=True,
+        help_text=_("Название в нижнем регистре без лишних пробелов. Заполняется автоматически.")
+    )
+
+    objects = CityManager()
+
+    class Meta:
+        verbose_name = _("Город")
+        verbose_name_plural = _("Города")
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+    def save(self, *args, **kwargs):
+        for language in mt_settings.AVAILABLE_LANGUAGES:
+            setattr(self, build_localized_fieldname('lookup_key', language), City.objects.build_key(getattr(self, build_localized_fieldname('name', language), None)))
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | {build_localized_fieldname('lookup_key', language) for language in mt_settings.AVAILABLE_LANGUAGES}
+        super().save(*args, **kwargs)
+
+
 class University(models.Model):
     name = models.CharField(
         _("Название университета"),
@@ -27,6 +87,15 @@ class University(models.Model):
         max_length=100,
         db_index=True
     )
+    normalized_city = models.ForeignKey(
+        City,
+        on_delete=models.SET_NULL,
+        null=True, blank=True,
+        editable=False,
+        related_name='universities',
+        verbose_name=_("Город (справочник)"),
+        help_text=_("Заполняется автоматически из поля 'Город' при сохранении.")
+    )
     address = models.CharField(
         _("Адрес"),
         max_length=255
@@ -115,6 +184,12 @@ class University(models.Model):
         verbose_name = _("Университет")
         verbose_name_plural = _("Университеты")
         ordering = ['name']
+        # Курсорная пагинация каталога (core.pagination): ORDER BY name, id по колонке текущего языка.
+        # Имена заданы явно: поля name_uz/name_ru добавляет modeltranslation уже после создания класса
+        indexes = [
+            models.Index(fields=['name_uz', 'id'], name='university_name_uz_id_idx'),
+            models.Index(fields=['name_ru', 'id'], name='university_name_ru_id_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -132,6 +207,14 @@ class University(models.Model):
                     slug_candidate = f"{base_slug}-{uuid.uuid4().hex[:6]}"
                     break
             self.webhook_slug = slug_candidate
+        # Справочник городов — только если город мог измениться (save(update_fields=[...]) без city его не трогает)
+        city_field_names = {'city'} | {build_localized_fieldname('city', language) for language in mt_settings.AVAILABLE_LANGUAGES}
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or city_field_names & set(update_fields):
+            city_names = {language: getattr(self, build_localized_fieldname('city', language), None) for language in mt_settings.AVAILABLE_LANGUAGES}
+            if not any(city_names.values()): city_names = {mt_settings.DEFAULT_LANGUAGE: self.city}
+            self.normalized_city = City.objects.resolve(city_names)
+            if update_fields is not None: kwargs['update_fields'] = set(update_fields) | {'normalized_city'}
         super().save(*args, **kwargs)
 
 class UniversityImage(models.Model):
@@ -70,21 +70,27 @@ class UniversityDetailSerializer(serializers.ModelSerializer):
             'gallery_images'
         )
 
-    # --- НОВЫЕ МЕТОДЫ ДЛЯ ПОДСЧЕТА ---
+    # --- Счетчики: аннотации UniversityViewSet.get_queryset, без них — отдельный COUNT ---
     def get_active_facilities_count(self, obj):
          """ Подсчитывает количество АКТИВНЫХ объектов. """
+         annotated_count = getattr(obj, 'active_facilities_count', None)
+         if annotated_count is not None: return annotated_count
          if hasattr(obj, 'facilities'):
              return obj.facilities.filter(is_active=True).count()
          return 0
 
     def get_staff_count(self, obj):
         """ Подсчитывает количество сотрудников. """
+        annotated_count = getattr(obj, 'staff_count', None)
+        if annotated_count is not None: return annotated_count
         if hasattr(obj, 'staff_members'):
             return obj.staff_members.count()
         return 0
 
     def get_active_clubs_count(self, obj):
         """ Подсчитывает количество АКТИВНЫХ кружков. """
+        annotated_count = getattr(obj, 'active_clubs_count', None)
+        if annotated_count is not None: return annotated_count
         if hasattr(obj, 'sport_clubs'):
             return obj.sport_clubs.filter(is_active=True).count()
         return 0
@@ -0,0 +1,22 @@
+# universities/signals.py
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from core.cache import invalidate_catalog_cache, CATALOG_FACILITIES, CATALOG_UNIVERSITIES
+from .models import University, UniversityImage, Staff, SportClub
+from .webhook_credentials import invalidate_webhook_credentials
+
+
+@receiver([post_save, post_delete], sender=University)
+def invalidate_catalog_on_university_change(sender, instance, **kwargs):
+    # Список объектов показывает название/город университета
+    invalidate_catalog_cache(CATALOG_UNIVERSITIES, CATALOG_FACILITIES)
+    # Ключи/слаг Payme могли измениться — вебхук перечитает их из БД
+    invalidate_webhook_credentials(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=UniversityImage)
+@receiver([post_save, post_delete], sender=Staff)
+@receiver([post_save, post_delete], sender=SportClub)
+def invalidate_catalog_on_university_related_change(sender, instance, **kwargs):
+    invalidate_catalog_cache(CATALOG_UNIVERSITIES)
@@ -1,3 +1,101 @@
+import base64
+from datetime import time
+from unittest import mock
+
+from django.core.cache import cache
 from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from facilities.models import Facility
+from .models import City, University, Staff, SportClub
+from .webhook_credentials import get_webhook_credentials, invalidate_webhook_credentials
+
+
+class WebhookCredentialsCacheTests(TestCase):
+    def setUp(self):
+        invalidate_webhook_credentials()
+        self.addCleanup(invalidate_webhook_credentials)
+        self.university = University.objects.create(
+            name="Payme University", city="Payme City", payme_cash_id="cash-1", payme_secret_key="secret-1"
+        )
+
+    def _basic_header(self, login, key):
+        return "Basic " + base64.b64encode(f"{login}:{key}".encode('utf-8')).decode('ascii')
+
+    def test_credentials_are_cached_until_university_is_saved(self):
+        slug = self.university.webhook_slug
+        credentials = get_webhook_credentials(slug)
+        self.assertEqual((credentials.university_id, credentials.cash_id), (self.university.id, "cash-1"))
+        with self.assertNumQueries(0):
+            self.assertEqual(get_webhook_credentials(slug), credentials)
+        self.assertTrue(credentials.matches_authorization_header(self._basic_header("cash-1", "secret-1")))
+        self.assertFalse(credentials.matches_authorization_header(self._basic_header("cash-1", "wrong")))
+        self.assertFalse(credentials.matches_authorization_header("Bearer token"))
+
+        self.university.payme_secret_key = "secret-2"
+        self.university.save()
+        self.assertTrue(get_webhook_credentials(slug).matches_authorization_header(self._basic_header("cash-1", "secret-2")))
+
+        University.objects.filter(pk=self.university.pk).update(is_active=False)
+        invalidate_webhook_credentials(self.university.pk)
+        self.assertIsNone(get_webhook_credentials(slug))
+
+
+class UniversityDetailCountsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.university = University.objects.create(name="Counted University", city="Count City")
+        other_university = University.objects.create(name="Other Counted University", city="Count City")
+        for university, is_active in [(cls.university, True), (cls.university, True), (cls.university, False), (other_university, True)]:
+            Facility.objects.create(
+                name="Count Court", university=university, facility_type=Facility.TYPE_TENNIS, is_active=is_active,
+                price_per_hour=10000, open_time=time(8, 0), close_time=time(22, 0), working_days="0,1,2,3,4",
+            )
+        for index in range(3):
+            Staff.objects.create(university=cls.university, full_name=f"Coach {index}", position="Тренер")
+        SportClub.objects.create(university=cls.university, name="Active Club", sport_type="Теннис")
+        SportClub.objects.create(university=cls.university, name="Closed Club", sport_type="Теннис", is_active=False)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_detail_counts_come_from_annotations(self):
+        with self.assertNumQueries(2): # Университет со счетчиками + prefetch галереи
+            response = self.client.get(reverse('universities_api:university-detail', args=[self.university.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            (response.data['active_facilities_count'], response.data['staff_count'], response.data['active_clubs_count']),
+            (2, 3, 1),
+        )
+
+
+class CityNormalizationTests(TestCase):
+    def test_universities_share_city_by_default_language_name(self):
+        first = University.objects.create(name="First City University", city_uz="Toshkent", city_ru="Ташкент")
+        second = University.objects.create(name="Second City University", city_uz="  toshkent ", city_ru="г. Ташкент")
+        self.assertEqual(first.normalized_city_id, second.normalized_city_id)
+        city = City.objects.get()
+        self.assertEqual((city.key, city.name_uz, city.name_ru), ("toshkent", "Toshkent", "Ташкент"))
+
+        second.city_uz = "Samarqand"
+        second.save()
+        self.assertNotEqual(second.normalized_city_id, first.normalized_city_id)
+        self.assertEqual(City.objects.count(), 2)
+
+    def test_partial_saves_resolve_city_only_when_city_changes(self):
+        university = University.objects.create(name="Partial Save University", city_uz="Buxoro", city_ru="Бухара")
+        university.description = "Updated"
+        with mock.patch.object(City.objects, 'resolve') as resolve_mock:
+            university.save(update_fields=['description'])
+        resolve_mock.assert_not_called()
 
-# Create your tests here.
+        university.city_uz = "Xiva"
+        university.save(update_fields=['city_uz'])
+        university.refresh_from_db()
+        self.assertEqual(university.normalized_city.key, "xiva")
+        self.assertEqual(
+            (university.normalized_city.lookup_key_uz, university.normalized_city.lookup_key_ru),
+            ("xiva", "бухара") # Названия нового города — из полей ВУЗа на момент создания
+        )
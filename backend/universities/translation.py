@@ -1,5 +1,9 @@
 from modeltranslation.translator import register, TranslationOptions
-from .models import University, Staff, SportClub
+from .models import City, University, Staff, SportClub
+
+@register(City)
+class CityTranslationOptions(TranslationOptions):
+    fields = ('name', 'lookup_key')
 
 @register(University)
 class UniversityTranslationOptions(TranslationOptions):
@@ -8,7 +8,12 @@ from rest_framework.pagination import PageNumberPagination
 # --- Фильтры: импортируем DjangoFilterBackend и filters ---
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters # Добавляем filters для SearchFilter/OrderingFilter, если нужны
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 
+from core.cache import CatalogCacheMixin, CATALOG_UNIVERSITIES
+from core.pagination import CursorOrPageNumberPagination
+from facilities.models import Facility
 from .models import University, Staff, SportClub
 from .serializers import (
     UniversityListSerializer, UniversityDetailSerializer, StaffSerializer,
@@ -21,17 +26,32 @@ class StandardResultsSetPagination(PageNumberPagination):
     page_size_query_param = 'page_size' # Параметр для изменения размера страницы
     max_page_size = 100 # Максимальное количество на странице
 
+# --- Пагинация каталога: номера страниц или keyset-курсор (?cursor=) ---
+class CatalogResultsSetPagination(CursorOrPageNumberPagination):
+    page_size = 12
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_ordering = ('name', 'id')
+
+def _university_count_subquery(queryset):
+    """ COUNT связанных строк коррелированным подзапросом: без JOIN трех таблиц и GROUP BY основного запроса. """
+    return Coalesce(Subquery(
+        queryset.filter(university=OuterRef('pk')).order_by().values('university').annotate(total=Count('id')).values('total')[:1]
+    ), 0)
+
 # --- ViewSet для Университетов ---
-class UniversityViewSet(viewsets.ReadOnlyModelViewSet):
+class UniversityViewSet(CatalogCacheMixin, viewsets.ReadOnlyModelViewSet):
     """
     API эндпоинт для просмотра списка и деталей университетов (только чтение).
-    Поддерживает фильтрацию по городу (`city__icontains`) и стандартную пагинацию.
+    Поддерживает фильтрацию по городу (`city__icontains`) и пагинацию по номерам страниц или курсору (`?cursor=`).
     Предоставляет дополнительные действия 'staff' и 'clubs' для получения связанной информации.
+    Ответы list/retrieve кэшируются (CatalogCacheMixin), инвалидация — сигналами universities.signals.
     """
     # Queryset: выбираем только активные университеты и предзагружаем галерею
-    queryset = University.objects.filter(is_active=True).prefetch_related('gallery_images').order_by('name')
+    queryset = University.objects.filter(is_active=True).prefetch_related('gallery_images').order_by('name', 'id')
     permission_classes = [permissions.AllowAny] # Просмотр доступен всем
-    pagination_class = StandardResultsSetPagination # Используем стандартную пагинацию
+    pagination_class = CatalogResultsSetPagination # Номера страниц или курсор (?cursor=)
+    cache_namespace = CATALOG_UNIVERSITIES # Пространство имен кэша ответов
 
     # --- Настройка Фильтрации, Поиска и Сортировки ---
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter, filters.SearchFilter] # Подключаем бэкенды
@@ -41,9 +61,20 @@ class UniversityViewSet(viewsets.ReadOnlyModelViewSet):
     }
     search_fields = ['name', 'short_name', 'city', 'description'] # Поля для ?search=
     ordering_fields = ['name', 'city', 'established_year'] # Поля для ?ordering=
-    ordering = ['name'] # Сортировка по умолчанию
+    ordering = ['name', 'id'] # Сортировка по умолчанию (id — уникальный хвост для курсора)
     # -------------------------------------------------
 
+    def get_queryset(self):
+        """ Для деталей счетчики UniversityDetailSerializer считаются в том же запросе (аннотации). """
+        queryset = super().get_queryset()
+        if self.action == 'retrieve':
+            queryset = queryset.annotate(
+                active_facilities_count=_university_count_subquery(Facility.objects.filter(is_active=True)),
+                staff_count=_university_count_subquery(Staff.objects.all()),
+                active_clubs_count=_university_count_subquery(SportClub.objects.filter(is_active=True)),
+            )
+        return queryset
+
     def get_serializer_class(self):
         """ Динамический выбор сериализатора """
         if self.action == 'list':
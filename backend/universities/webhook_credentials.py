@@ -0,0 +1,75 @@
+# universities/webhook_credentials.py
+"""
+Кэш учетных данных вебхука Payme в памяти процесса: webhook_slug -> (university_id, cash_id, secret_key).
+
+Payme присылает CheckPerform/Create/Perform/CheckTransaction пачками, поэтому авторизация
+не должна ходить в БД на каждый вызов. Записи живут PAYME_WEBHOOK_CREDENTIALS_TTL_SECONDS;
+сохранение/удаление University сбрасывает записи этого ВУЗа в текущем процессе
+(universities.signals), остальные воркеры подхватят изменения по TTL.
+Ненайденные слаги не кэшируются.
+"""
+import base64
+import hmac
+import threading
+import time
+from typing import NamedTuple, Optional
+
+from django.conf import settings
+
+from .models import University
+
+
+class WebhookCredentials(NamedTuple):
+    university_id: int
+    cash_id: str
+    secret_key: str
+    basic_auth_token: str # base64("cash_id:secret_key") — сравнивается с заголовком без декодирования
+
+    def matches_authorization_header(self, auth_header: Optional[str]) -> bool:
+        auth_type, _sep, token = (auth_header or '').strip().partition(' ')
+        if auth_type.lower() != 'basic':
+            return False
+        return hmac.compare_digest(token.strip().encode('utf-8'), self.basic_auth_token.encode('utf-8'))
+
+
+_credentials_by_slug = {} # slug -> (expires_at, WebhookCredentials)
+_credentials_lock = threading.Lock()
+
+
+def _build_credentials(university_id: int, cash_id: str, secret_key: str) -> WebhookCredentials:
+    basic_auth_token = base64.b64encode(f"{cash_id}:{secret_key}".encode('utf-8')).decode('ascii')
+    return WebhookCredentials(university_id, cash_id, secret_key, basic_auth_token)
+
+
+def get_webhook_credentials(webhook_slug: str) -> Optional[WebhookCredentials]:
+    """
+    Учетные данные активного ВУЗа по слагу вебхука или None, если ВУЗа нет.
+    Пустые cash_id/secret_key возвращаются как есть — проверку делает вызывающий код.
+    """
+    now = time.monotonic()
+    cached = _credentials_by_slug.get(webhook_slug)
+    if cached and cached[0] > now:
+        return cached[1]
+    university_row = University.objects.filter(webhook_slug=webhook_slug, is_active=True).values_list(
+        'id', 'payme_cash_id', 'payme_secret_key'
+    ).first()
+    if university_row is None:
+        with _credentials_lock: _credentials_by_slug.pop(webhook_slug, None)
+        return None
+    university_id, cash_id, secret_key = university_row
+    credentials = _build_credentials(university_id, cash_id or '', secret_key or '')
+    ttl_seconds = getattr(settings, 'PAYME_WEBHOOK_CREDENTIALS_TTL_SECONDS', 300)
+    with _credentials_lock:
+        _credentials_by_slug[webhook_slug] = (now + ttl_seconds, credentials)
+    return credentials
+
+
+def invalidate_webhook_credentials(university_id: Optional[int] = None) -> None:
+    """ Сбрасывает записи ВУЗа (слаг мог измениться, поэтому ищем по id) или весь кэш при university_id=None. """
+    with _credentials_lock:
+        if university_id is None:
+            _credentials_by_slug.clear()
+            return
+        for webhook_slug, (_expires_at, credentials) in list(_credentials_by_slug.items()):
+            if credentials.university_id == university_id:
+                del _credentials_by_slug[webhook_slug]
@@ -2,14 +2,14 @@
 import React, { useState, useEffect, useMemo, useCallback } from 'react';
 import { useParams, Link, useNavigate, useLocation } // location все еще нужен для редиректа на логин
 from 'react-router-dom';
-import { useQuery, useMutation } from '@tanstack/react-query'; // queryClient не нужен здесь напрямую
+import { useQuery, useMutation, useQueryClient } from '@tanstack/react-query';
 import { useSelector } from 'react-redux';
 import dayjs from 'dayjs';
 import clsx from 'clsx';
 import { useTranslation } from 'react-i18next';
 import { toast } from 'react-hot-toast';
 
-import { fetchOrderPaymentStatus, getPaycomCheckoutUrl } from '../services/api';
+import { fetchOrderPaymentStatus, getPaycomCheckoutUrl, waitOrderPaymentStatus } from '../services/api';
 import LoadingSpinner from '../components/Common/LoadingSpinner.jsx';
 import BookingQRCode from '../components/Common/BookingQRCode.jsx';
 import { formatTime, formatSlotTimeRange, DOW_MAP_I18N, DOW_FALLBACK } from '../utils/helpers.jsx';
@@ -49,6 +49,36 @@ const PaymentStatusPage = () => {
         refetchOnMount: true,
     });
 
+    const queryClient = useQueryClient();
+    const knownOrderStatus = orderDetails?.status;
+
+    // Пока заказ ждет оплаты — long-poll: полный статус перезапрашивается только когда он изменился
+    useEffect(() => {
+        if (!order_identifier || knownOrderStatus !== 'pending_payment') return undefined;
+        const controller = new AbortController();
+        const waitForStatusChange = async () => {
+            while (!controller.signal.aborted) {
+                try {
+                    const result = await waitOrderPaymentStatus(order_identifier, knownOrderStatus, { signal: controller.signal });
+                    if (result?.changed) {
+                        queryClient.invalidateQueries({ queryKey: ['orderPaymentStatus', order_identifier] });
+                        return;
+                    }
+                } catch (error) {
+                    if (controller.signal.aborted) return;
+                    const status = error?.response?.status;
+                    if (status && status < 500) { // 4xx не исправится повтором — перезапрашиваем статус, ошибку покажет обработчик useQuery
+                        queryClient.invalidateQueries({ queryKey: ['orderPaymentStatus', order_identifier] });
+                        return;
+                    }
+                    await new Promise(resolve => setTimeout(resolve, 5000)); // Пауза перед повтором после ошибки сети
+                }
+            }
+        };
+        waitForStatusChange();
+        return () => controller.abort();
+    }, [order_identifier, knownOrderStatus, queryClient]);
+
     useEffect(() => {
         if (isErrorOrderStatus && errorOrderStatus) {
             const status = errorOrderStatus.response?.status;
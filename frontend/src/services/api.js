@@ -197,6 +197,14 @@ export const fetchOrderPaymentStatus = async ({ queryKey }) => {
     }
 };
 
+// Long-poll: сервер отвечает, когда статус заказа отличается от knownStatus (или по таймауту, changed=false)
+export const waitOrderPaymentStatus = async (orderIdentifier, knownStatus, { signal } = {}) => {
+    const response = await apiClient.get(`/bookings/orders/${orderIdentifier}/payment-status/wait/`, {
+        params: { status: knownStatus }, signal,
+    });
+    return response.data; // { id, status, changed }
+};
+
 // УДАЛЕННЫЕ/ЗАКОММЕНТИРОВАННЫЕ ФУНКЦИИ STRIPE
 // export const createCheckoutSession = (orderData) => apiClient.post('/bookings/create-checkout-session/', orderData);
 // export const fetchBookingDetailsBySession = async ({ queryKey }) => { const [, sessionId] = queryKey; if (!sessionId) throw new Error("Session ID required"); const response = await apiClient.get(`/bookings/details-by-session/${sessionId}/`); return response.data; };